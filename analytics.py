@@ -0,0 +1,212 @@
+"""
+Materialized fleet-wide EEG analytics.
+
+Every enrollment appends one row to the eeg_analytics table with the
+template's relative band powers, a few signal statistics, the mean Welch PSD
+(so the per-user plot never re-reads the EEG file) and the drift from that
+employee's previous enrollment. eeg_band_summary keeps running sums over the
+latest row of every employee, so the fleet band distribution is a five-row
+read instead of a scan.
+
+    record(conn, empid, recording, source)   # app.save_brainwave_db, in the enrollment's transaction
+    python analytics.py backfill --db neurolock.db
+
+All queries go through indexes on (empid, recorded_at) and (is_latest, drift).
+"""
+import os
+import time
+import sqlite3
+import argparse
+
+import numpy as np
+
+import eeg_io
+import preprocess
+
+BANDS = (
+    ("delta", 1.0, 4.0),
+    ("theta", 4.0, 8.0),
+    ("alpha", 8.0, 13.0),
+    ("beta", 13.0, 30.0),
+    ("gamma", 30.0, 40.0),
+)
+BAND_NAMES = tuple(name for name, _, _ in BANDS)
+WELCH_SECONDS = 2.0          # 0.5 Hz PSD resolution
+TOP_N = 10
+
+
+# ---------- Schema ----------
+def init_tables(conn):
+    conn.executescript(f"""
+    CREATE TABLE IF NOT EXISTS eeg_analytics (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        empid TEXT NOT NULL,
+        recorded_at REAL NOT NULL,
+        source TEXT,
+        is_latest INTEGER NOT NULL DEFAULT 1,
+        n_channels INTEGER,
+        duration_s REAL,
+        rms REAL,
+        alpha_peak_hz REAL,
+        {", ".join(f"{b} REAL" for b in BAND_NAMES)},
+        drift REAL,
+        psd BLOB,
+        psd_df REAL
+    );
+    CREATE INDEX IF NOT EXISTS idx_analytics_emp_time ON eeg_analytics(empid, recorded_at);
+    CREATE INDEX IF NOT EXISTS idx_analytics_latest_drift ON eeg_analytics(is_latest, drift);
+    CREATE TABLE IF NOT EXISTS eeg_band_summary (
+        band TEXT PRIMARY KEY,
+        n INTEGER NOT NULL DEFAULT 0,
+        total REAL NOT NULL DEFAULT 0,
+        total_sq REAL NOT NULL DEFAULT 0
+    );
+    """)
+    conn.executemany("INSERT OR IGNORE INTO eeg_band_summary (band) VALUES (?)", [(b,) for b in BAND_NAMES])
+    conn.commit()
+
+
+# ---------- Features ----------
+def band_features(recording):
+    """Relative band powers, PSD and signal statistics of one (preprocessed) recording."""
+    from scipy.signal import welch
+    data = np.asarray(recording.data, dtype=np.float64)
+    if data.ndim == 1:
+        data = data[:, None]
+    fs = float(recording.sample_rate or eeg_io.DEFAULT_SAMPLE_RATE)
+    nperseg = max(2, min(len(data), int(WELCH_SECONDS * fs)))
+    freqs, pxx = welch(data, fs=fs, nperseg=nperseg, axis=0)
+    psd = pxx.mean(axis=1)
+
+    lo, hi = BANDS[0][1], BANDS[-1][2]
+    total = psd[(freqs >= lo) & (freqs < hi)].sum() or 1.0
+    powers = {name: float(psd[(freqs >= f0) & (freqs < f1)].sum() / total) for name, f0, f1 in BANDS}
+    alpha = (freqs >= 8.0) & (freqs < 13.0)
+    return {
+        **powers,
+        "n_channels": int(data.shape[1]),
+        "duration_s": len(data) / fs,
+        "rms": float(np.sqrt(np.mean(data * data))),
+        "alpha_peak_hz": float(freqs[alpha][psd[alpha].argmax()]) if alpha.any() else None,
+        "psd": psd.astype(np.float32),
+        "psd_df": float(freqs[1] - freqs[0]) if len(freqs) > 1 else fs,
+    }
+
+
+# ---------- Incremental refresh ----------
+def _summary_delta(conn, values, sign):
+    conn.executemany("UPDATE eeg_band_summary SET n = n + ?, total = total + ?, total_sq = total_sq + ? WHERE band = ?",
+                     [(sign, sign * v, sign * v * v, b) for b, v in zip(BAND_NAMES, values)])
+
+
+def record(conn, empid, recording, source=None, recorded_at=None):
+    """Add one enrollment of `empid`; replaces its contribution to the fleet summary. Caller commits."""
+    f = band_features(recording)
+    bands = [f[b] for b in BAND_NAMES]
+    previous = conn.execute(f"SELECT id, {', '.join(BAND_NAMES)} FROM eeg_analytics "
+                            "WHERE empid = ? AND is_latest = 1", (empid,)).fetchone()
+    drift = None
+    if previous:
+        drift = float(np.abs(np.subtract(bands, previous[1:])).sum())
+        conn.execute("UPDATE eeg_analytics SET is_latest = 0 WHERE id = ?", (previous[0],))
+        _summary_delta(conn, previous[1:], -1)
+    columns = ("empid", "recorded_at", "source", "n_channels", "duration_s", "rms", "alpha_peak_hz",
+               *BAND_NAMES, "drift", "psd", "psd_df")
+    conn.execute(f"INSERT INTO eeg_analytics ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                 (empid, recorded_at or time.time(), source, f["n_channels"], f["duration_s"], f["rms"],
+                  f["alpha_peak_hz"], *bands, drift, f["psd"].tobytes(), f["psd_df"]))
+    _summary_delta(conn, bands, +1)
+    return f
+
+
+def backfill(conn):
+    """Materialize every enrolled employee that has no analytics row yet (legacy CSV templates included)."""
+    init_tables(conn)
+    rows = conn.execute("""
+        SELECT e.empid, e.brainwave_path FROM employees e
+        WHERE e.brainwave_path IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM eeg_analytics a WHERE a.empid = e.empid)
+    """).fetchall()
+    done = 0
+    for empid, path in rows:
+        if not path or not os.path.exists(path):
+            continue
+        try:
+            recording = eeg_io.read_eeg(path) if path.endswith(".npz") else preprocess.load(path)
+            record(conn, empid, recording, path, recorded_at=os.path.getmtime(path))
+            conn.commit()
+            done += 1
+        except Exception as e:
+            print(f"analytics: skipping {empid} ({path}): {e}")
+    rebuild_summary(conn)
+    return done
+
+
+def rebuild_summary(conn):
+    """Recompute eeg_band_summary from the latest rows (after a backfill or manual edits)."""
+    for b in BAND_NAMES:
+        conn.execute(f"UPDATE eeg_band_summary SET (n, total, total_sq) = "
+                     f"(SELECT COUNT(*), COALESCE(SUM({b}), 0), COALESCE(SUM({b} * {b}), 0) "
+                     f"FROM eeg_analytics WHERE is_latest = 1) WHERE band = ?", (b,))
+    conn.commit()
+
+
+# ---------- Dashboard queries ----------
+def latest(conn, empid):
+    """Latest analytics row of `empid` as a dict (psd decoded), or None."""
+    cur = conn.execute(f"SELECT recorded_at, {', '.join(BAND_NAMES)}, rms, alpha_peak_hz, drift, psd, psd_df "
+                       "FROM eeg_analytics WHERE empid = ? AND is_latest = 1", (empid,))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    out = dict(zip([d[0] for d in cur.description], row))
+    out["psd"] = np.frombuffer(out["psd"], dtype=np.float32)
+    out["freqs"] = np.arange(len(out["psd"])) * out["psd_df"]
+    return out
+
+
+def history(conn, empid):
+    """[(recorded_at, drift, {band: power})] of every enrollment of `empid`, oldest first."""
+    rows = conn.execute(f"SELECT recorded_at, drift, {', '.join(BAND_NAMES)} FROM eeg_analytics "
+                        "WHERE empid = ? ORDER BY recorded_at", (empid,)).fetchall()
+    return [(r[0], r[1], dict(zip(BAND_NAMES, r[2:]))) for r in rows]
+
+
+def band_distribution(conn):
+    """{band: (mean, std, n)} over the latest enrollment of every employee."""
+    out = {}
+    for band, n, total, total_sq in conn.execute("SELECT band, n, total, total_sq FROM eeg_band_summary"):
+        mean = total / n if n else 0.0
+        out[band] = (mean, float(np.sqrt(max(total_sq / n - mean * mean, 0.0))) if n else 0.0, n)
+    return {b: out.get(b, (0.0, 0.0, 0)) for b in BAND_NAMES}
+
+
+def top_drift(conn, limit=TOP_N):
+    """Employees whose latest re-enrollment moved furthest from the previous one."""
+    return conn.execute("SELECT empid, drift, recorded_at FROM eeg_analytics "
+                        "WHERE is_latest = 1 AND drift IS NOT NULL ORDER BY drift DESC LIMIT ?",
+                        (limit,)).fetchall()
+
+
+def outliers(conn, limit=TOP_N, dist=None):
+    """[(empid, z)] latest enrollments furthest from the fleet mean (RMS of per-band z-scores)."""
+    dist = dist or band_distribution(conn)
+    terms, params = [], []
+    for b in BAND_NAMES:
+        mean, std, _ = dist[b]
+        terms.append(f"(({b} - ?) * ({b} - ?)) / ?")
+        params += [mean, mean, max(std * std, 1e-12)]
+    rows = conn.execute(f"SELECT empid, {' + '.join(terms)} AS z2 FROM eeg_analytics "
+                        "WHERE is_latest = 1 ORDER BY z2 DESC LIMIT ?", (*params, limit)).fetchall()
+    return [(empid, float(np.sqrt(z2 / len(BAND_NAMES)))) for empid, z2 in rows]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Materialize NeuroLock EEG analytics")
+    sub = parser.add_subparsers(dest="command", required=True)
+    b = sub.add_parser("backfill")
+    b.add_argument("--db", default="neurolock.db")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    print(f"analytics: materialized {backfill(conn)} enrollment(s)")
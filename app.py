@@ -1,50 +1,202 @@
 import dash
 from dash import dcc, html, Input, Output, State, ctx
 import dash_bootstrap_components as dbc
-import pandas as pd
+from flask import jsonify, request
 import sqlite3
+import threading
 import numpy as np
-import os, base64, io, joblib
-import plotly.express as px
-import plotly.graph_objects as go
+import os, io, re, time, tempfile
+from functools import lru_cache
+import eeg_io
+import preprocess
+import scoring
+import matching
+import retrain
+import npz_model
+import analytics
+import templates
+import upload_cache
+import replay
+import audit
+import ratelimit
+import memprof
+import sampler
+import shard
+
+# pandas, plotly.express, plotly.graph_objects, scipy.signal and joblib (which
+# pulls in sklearn through the pickle) are imported inside the functions that
+# use them and pre-imported by the warm-up thread, so importing this module
+# stays cheap.
 
 
 # ---------- DATABASE ----------
-DB_FILE = "neurolock.db"
+DB_FILE = os.environ.get("NEUROLOCK_DB_FILE", "neurolock.db")
+BRAINWAVE_DIR = os.environ.get("NEUROLOCK_BRAINWAVE_DIR", "brainwaves")
 conn = sqlite3.connect(DB_FILE, check_same_thread=False)
-cursor = conn.cursor()
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS employees (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    empid TEXT UNIQUE,
-    name TEXT,
-    password TEXT,
-    brainwave_path TEXT
-)
-""")
-conn.commit()
+cursor = conn.cursor()       # init_db only: request threads take their own (conn.execute / conn.cursor())
+# the connection is shared by every Dash thread, so each write transaction holds this from first write to commit
+db_write = threading.RLock()
+
+
+def init_db():
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS employees (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        empid TEXT UNIQUE,
+        name TEXT,
+        password TEXT,
+        brainwave_path TEXT
+    )
+    """)
+    # case-insensitive prefix search for the analytics employee picker
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_employees_empid_nocase ON employees(empid COLLATE NOCASE)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_employees_name_nocase ON employees(name COLLATE NOCASE)")
+    # one row per enrollment session; the merged Mahalanobis template per employee
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS brainwave_sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        empid TEXT NOT NULL,
+        recorded_at REAL NOT NULL,
+        n_epochs INTEGER,
+        source TEXT
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_empid ON brainwave_sessions(empid, recorded_at)")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS brainwave_templates (
+        empid TEXT PRIMARY KEY,
+        n_sessions INTEGER NOT NULL,
+        template BLOB NOT NULL,
+        updated_at REAL
+    )
+    """)
+    conn.commit()
+    analytics.init_tables(conn)
 
 
 ADMIN_CODE = "ADMIN123"
 
+# per-empid / per-address token buckets plus a cap on concurrent verifications
+verify_gate = ratelimit.Admission()
+
 
 # ---------- LOAD AI MODEL ----------
 MODEL_FILE = "neurolock_invariant_model.pkl"
+MODEL_POLL_S = 5.0        # how often get_model() looks for a newer retrained model
+AUTO_RETRAIN = True       # retrain in a background process after enrollments, while legacy users remain
+REPLAY_CHECK = True       # refuse uploads that repeat an accepted one (replay.py)
+shard_router = shard.from_env()   # NEUROLOCK_SHARDS: enrollments and verification live on shard workers
 brainwave_model = None
-if os.path.exists(MODEL_FILE):
+model_path = None
+model_error = None
+model_ready = threading.Event()
+_warmup_lock = threading.Lock()
+_warmup_thread = None
+_warmup_started = None
+_warmup_finished = None
+_last_model_poll = 0.0
+_swap_thread = None
+
+
+def load_model(path=None):
+    """
+    Load the newest retrained model (or MODEL_FILE), preferring its NumPy
+    .npz export, and swap it in; the old one serves until then.
+    """
+    global brainwave_model, model_path, model_error
+    path = npz_model.preferred_path(path or retrain.latest_model_path() or MODEL_FILE)
+    if not os.path.exists(path):
+        model_error = f"Model file not found: {path}"
+        print("⚠️", model_error)
+        return
     try:
-        brainwave_model = joblib.load(MODEL_FILE)
-        print("✅ Loaded AI model:", MODEL_FILE)
+        if path.endswith(".npz"):
+            # pure-NumPy export: no sklearn import, no unpickling
+            model = npz_model.load(path)
+        else:
+            import joblib
+            model = joblib.load(path)
+        brainwave_model, model_path = model, path
+        print("✅ Loaded AI model:", path)
     except Exception as e:
-        print("⚠️ Failed to load model:", e)
-else:
-    print("⚠️ Model file not found:", MODEL_FILE)
+        model_error = f"Failed to load model: {e}"
+        print("⚠️", model_error)
+
+
+def _maybe_hot_swap():
+    """At most every MODEL_POLL_S, start loading a newer retrained model in the background."""
+    global _last_model_poll, _swap_thread
+    now = time.monotonic()
+    if now - _last_model_poll < MODEL_POLL_S:
+        return
+    _last_model_poll = now
+    latest = retrain.latest_model_path()
+    if latest and npz_model.preferred_path(latest) != model_path and (_swap_thread is None or not _swap_thread.is_alive()):
+        _swap_thread = threading.Thread(target=load_model, args=(latest,), name="neurolock-model-swap", daemon=True)
+        _swap_thread.start()
+
+
+def _warmup():
+    global _warmup_finished
+    try:
+        load_model()
+        import pandas, plotly.express, plotly.graph_objects, scipy.signal  # noqa: F401
+        preprocess.bandpass_sos(float(preprocess.CANONICAL_RATE), *preprocess.BANDPASS)
+        memprof.start()   # after the heavy imports, so snapshots stay small
+    finally:
+        _warmup_finished = time.time()
+        model_ready.set()
+
+
+def start_warmup():
+    """Create the tables and start loading the model / plotting stack in the background (idempotent)."""
+    global _warmup_thread, _warmup_started
+    if _warmup_thread is not None:
+        return _warmup_thread
+    with _warmup_lock:
+        if _warmup_thread is None:
+            init_db()
+            _warmup_started = time.time()
+            thread = threading.Thread(target=_warmup, name="neurolock-warmup", daemon=True)
+            thread.start()
+            _warmup_thread = thread
+    return _warmup_thread
+
+
+def get_model(timeout=None):
+    """Return the loaded model, waiting for the warm-up thread if it is still running."""
+    start_warmup()
+    model_ready.wait(timeout)
+    _maybe_hot_swap()
+    return brainwave_model
 
 
 # ---------- APP ----------
 external_stylesheets = [dbc.themes.BOOTSTRAP]
 app = dash.Dash(__name__, external_stylesheets=external_stylesheets, suppress_callback_exceptions=True)
 app.title = "NeuroLock System"
+server = app.server
+memprof.install(server, app, start_tracing=False)  # no-op unless NEUROLOCK_MEMPROF is set
+sampler.install(server, os.environ.get("NEUROLOCK_ADMIN_CODE"))  # /admin/profile, only when that is set
+
+
+@server.before_request
+def _ensure_warm():
+    start_warmup()
+
+
+@server.route("/ready")
+def ready():
+    warm = model_ready.is_set()
+    body = {
+        "ready": warm and brainwave_model is not None,
+        "warm": warm,
+        "model_loaded": brainwave_model is not None,
+        "model_path": model_path,
+        "model_error": model_error,
+        "warmup_s": round((_warmup_finished or time.time()) - _warmup_started, 3) if _warmup_started else None,
+    }
+    return jsonify(body), 200 if body["ready"] else 503
 
 
 # ---------- CSS + BACKGROUND ----------
@@ -154,8 +306,7 @@ input.form-control::placeholder { color: rgba(255,255,255,0.7) !important; }
 
 # ---------- Helper Logic ----------
 def generate_empid():
-    cursor.execute("SELECT empid FROM employees ORDER BY id DESC LIMIT 1")
-    last = cursor.fetchone()
+    last = conn.execute("SELECT empid FROM employees ORDER BY id DESC LIMIT 1").fetchone()
     if last:
         try:
             num = int(''.join(filter(str.isdigit, last[0])))
@@ -173,126 +324,219 @@ def register_user(name, company_code, password, confirm_password):
     if password != confirm_password:
         return "❌ Passwords do not match."
 
-    empid = generate_empid()
-    cursor.execute("INSERT INTO employees (empid, name, password, brainwave_path) VALUES (?, ?, ?, NULL)",
-                   (empid, name, password))
-    conn.commit()
+    with db_write:
+        empid = generate_empid()
+        conn.execute("INSERT INTO employees (empid, name, password, brainwave_path) VALUES (?, ?, ?, NULL)",
+                     (empid, name, password))
+        conn.commit()
+    search_employees.cache_clear()
     return f"✅ Registered! Your Employee ID is {empid}"
 
 
+EMPLOYEE_PAGE = 20
+DENSE_MATCHES = 2000      # past this many matches a prefix is scanned in empid order instead
 
-    empid = generate_empid()
-    cursor.execute("INSERT INTO employees (empid, name, password, brainwave_path) VALUES (?, ?, ?, NULL)",
-                   (empid, name, password))
-    conn.commit()
-    return f"✅ Registered! Your Employee ID is {empid}"
 
+def _prefix_page(column, prefix, after, limit):
+    """
+    Up to `limit` (empid, name) rows after `after` whose `column` starts with
+    `prefix`, in empid order, without sorting every match: a sparse prefix
+    (<= DENSE_MATCHES matches) is read whole through the column's NOCASE index
+    and sorted here; a dense one walks the empid index and stops at `limit`,
+    which takes about limit * headcount / DENSE_MATCHES rows at worst.
+    """
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    rows = conn.execute(f"""
+        SELECT empid, name FROM employees
+        WHERE {column} >= ? COLLATE NOCASE AND {column} < ? COLLATE NOCASE AND empid > ?
+        LIMIT ?
+    """, (prefix, upper, after, DENSE_MATCHES + 1)).fetchall()
+    if len(rows) <= DENSE_MATCHES:
+        return sorted(rows)[:limit]
+    # unary + keeps the planner off the column's index, so it follows ORDER BY empid
+    return conn.execute(f"""
+        SELECT empid, name FROM employees
+        WHERE empid > ? AND +{column} >= ? COLLATE NOCASE AND +{column} < ? COLLATE NOCASE
+        ORDER BY empid LIMIT ?
+    """, (after, prefix, upper, limit)).fetchall()
+
+
+@lru_cache(maxsize=256)
+def search_employees(prefix="", after="", limit=EMPLOYEE_PAGE):
+    """
+    One page of (empid, name) rows whose empid or name starts with `prefix`
+    (case-insensitive), ordered by empid and starting after the keyset cursor
+    `after`. Each branch is one bounded query (_prefix_page), merged here;
+    register_user clears the cache.
+    """
+    prefix = (prefix or "").strip().lower()
+    if not prefix:
+        rows = conn.execute("SELECT empid, name FROM employees WHERE empid > ? ORDER BY empid LIMIT ?",
+                            (after, limit))
+        return tuple(rows.fetchall())
+    merged = dict(_prefix_page("empid", prefix, after, limit))
+    merged.update(_prefix_page("name", prefix, after, limit))
+    return tuple(sorted(merged.items())[:limit])
+
+
+def employee_options(prefix="", after=""):
+    """Dropdown options for one page of search results, plus a disabled marker if there are more."""
+    rows = search_employees(prefix, after, EMPLOYEE_PAGE + 1)
+    options = [{"label": f"{e} — {n}" if n else e, "value": e} for e, n in rows[:EMPLOYEE_PAGE]]
+    if len(rows) > EMPLOYEE_PAGE:
+        options.append({"label": "… more matches (type to narrow or click More)", "value": "__more__", "disabled": True})
+    return options
+
+
+def read_upload(contents, filename=None):
+    """
+    Decode a dcc.Upload data URL into an eeg_io.Recording (CSV, EDF/BDF, NPY/NPZ).
+    Parsed once per upload: the preview, save and verify callbacks share upload_cache.
+    """
+    return upload_cache.recording(contents, filename)
 
-def save_brainwave_db(empid, admin_code, contents):
-    if admin_code != ADMIN_CODE:
-        return "❌ Invalid Admin Code!"
-    if not empid or not contents:
-        return "⚠ Provide Employee ID and CSV."
 
+def load_template(path):
+    """Stored template as a preprocessed Recording; legacy CSV templates are preprocessed on load."""
+    if path.endswith(".npz"):
+        return eeg_io.read_eeg(path)
+    return preprocess.load(path)
 
-    df = pd.read_csv(io.BytesIO(base64.b64decode(contents.split(',')[1])))
-    os.makedirs("brainwaves", exist_ok=True)
-    save_path = f"brainwaves/{empid}.csv"
-    df.to_csv(save_path, index=False)
-    cursor.execute("UPDATE employees SET brainwave_path = ? WHERE empid = ?", (save_path, empid))
-    conn.commit()
-    return f"✅ Brainwave saved for {empid}"
 
+EMPID_RE = re.compile(r"[A-Za-z0-9_-]{1,32}")    # empids name files under BRAINWAVE_DIR
 
-def verify_login_db(empid, password):
-    cursor.execute("SELECT * FROM employees WHERE empid=? AND password=?", (empid, password))
-    return bool(cursor.fetchone())
 
-import joblib
-import numpy as np
-import pandas as pd
-import io, base64
+def valid_empid(empid):
+    return isinstance(empid, str) and EMPID_RE.fullmatch(empid) is not None
+
+
+def save_brainwave_db(empid, admin_code, contents, filename=None):
+    if admin_code != ADMIN_CODE:
+        return "❌ Invalid Admin Code!"
+    if not empid or not contents:
+        return "⚠ Provide Employee ID and EEG file."
+    if not valid_empid(empid):
+        return "⚠ Invalid Employee ID."
+
+    # nothing is written for an unknown employee
+    if not conn.execute("SELECT 1 FROM employees WHERE empid = ?", (empid,)).fetchone():
+        return f"⚠ Unknown Employee ID {empid}."
+    if shard_router is not None:
+        return shard_router.enroll(empid, admin_code, contents, filename)
+
+    # templates are stored already preprocessed (canonical rate, filtered, z-scored)
+    recording = upload_cache.preprocessed(contents, filename)
+    if not templates.long_enough(recording.data):
+        return f"⚠ Recording too short: at least {templates.MIN_SESSION_SECONDS:g} s of EEG is needed."
+    os.makedirs(BRAINWAVE_DIR, exist_ok=True)
+    save_path = os.path.join(BRAINWAVE_DIR, f"{empid}.npz")
+    # the previous recording stays in place until the new session is committed
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{empid}-", suffix=".npz", dir=BRAINWAVE_DIR)
+    os.close(fd)
+    try:
+        eeg_io.write_npz(tmp_path, recording)
+        # path, template session and analytics row are one transaction, so the fleet summary never drifts
+        with db_write:
+            try:
+                conn.execute("UPDATE employees SET brainwave_path = ? WHERE empid = ?", (save_path, empid))
+                # every recording is another enrollment session merged into the template
+                template = templates.enroll(conn.cursor(), empid, recording.data, save_path)
+                analytics.record(conn, empid, recording, save_path)
+            except Exception:
+                conn.rollback()
+                raise
+            conn.commit()
+            os.replace(tmp_path, save_path)
+    finally:
+        if os.path.exists(tmp_path):      # only left behind when the save failed
+            os.remove(tmp_path)
+    if AUTO_RETRAIN and retrain.needed(conn):
+        retrain.schedule(DB_FILE)
+    return f"✅ Brainwave saved for {empid} (session {template.n_sessions})"
 
-import joblib
-import numpy as np
-import pandas as pd
-import io, base64
-import joblib
-import numpy as np
-import pandas as pd
-import io, base64
 
-def ai_verify_brainwave(empid, uploaded_contents):
+def verify_login_db(empid, password):
+    return bool(conn.execute("SELECT * FROM employees WHERE empid=? AND password=?", (empid, password)).fetchone())
+
+def ai_verify_brainwave(empid, uploaded_contents, filename=None):
     """
     Uses trained ML model (neurolock_invariant_model.pkl)
     to verify uploaded brainwave pattern for a given empid.
     """
+    return verify_brainwave(empid, uploaded_contents, filename)[2]
 
-    # --- Fetch stored brainwave path from DB ---
-    cursor.execute("SELECT brainwave_path FROM employees WHERE empid=?", (empid,))
-    row = cursor.fetchone()
-    if not row or not row[0]:
-        return "⚠ No stored brainwave found."
 
-    stored = pd.read_csv(row[0])
-    uploaded = pd.read_csv(io.BytesIO(base64.b64decode(uploaded_contents.split(',')[1])))
+def verify_brainwave(empid, uploaded_contents, filename=None):
+    """ai_verify_brainwave returning (decision, score, message); decision is accept/reject/replay/error."""
+    if shard_router is not None:
+        return shard_router.verify(empid, uploaded_contents, filename)
 
-    # --- Load model ---
-    try:
-        model_data = joblib.load("neurolock_invariant_model.pkl")
-        print("DEBUG: Model type =", type(model_data))
-    except Exception as e:
-        return f"⚠️ Model load error: {e}"
+    # --- Fetch stored brainwave path from DB ---
+    row = conn.execute("SELECT brainwave_path FROM employees WHERE empid=?", (empid,)).fetchone()
+    if not row or not row[0]:
+        return "error", None, "⚠ No stored brainwave found."
+
+    # --- Replays of an accepted upload are refused before any scoring ---
+    replays = replay.get_index() if REPLAY_CHECK else None
+    match = upload_key = None
+    if replays is not None:
+        upload_key = replay.content_key(uploaded_contents)
+        match = replays.check_exact(upload_key)
+    if match is None:
+        uploaded = upload_cache.preprocessed(uploaded_contents, filename).data
+        if replays is not None:
+            match = replays.lookup(replay.probe_sketch(uploaded))
+    if match is not None:
+        when = time.strftime("%Y-%m-%d %H:%M", time.localtime(match.ts))
+        return "replay", None, (f"❌ Replay Detected: this recording matches one accepted on {when} "
+                                f"({match.kind}, {match.distance} bits)")
+
+    decision, score, message = score_brainwave(empid, row[0], uploaded)
+    if decision == "accept" and replays is not None:
+        replays.add(replay.sketch(uploaded), upload_key, empid)
+    return decision, score, message
+
+
+def score_brainwave(empid, stored_path, uploaded):
+    """Template (or legacy model) decision for a preprocessed upload; (decision, score, message)."""
+
+    # --- Enrolled template: one batched Mahalanobis evaluation decides ---
+    template = templates.fetch(conn.cursor(), empid)
+    if template is not None:
+        distance, n_epochs = templates.score(template, uploaded)
+        details = f"Mahalanobis: {distance:.3f} ({template.n_sessions} sessions, {n_epochs} epochs)"
+        if distance <= templates.MAHALANOBIS_ACCEPT:
+            return "accept", distance, f"✅ Brainwave Match (Template Verified)\n{details}"
+        return "reject", distance, f"❌ Brainwave Not Matching (Template Rejected)\n{details}"
+
+    # --- Legacy users without a template: model + alignment ---
+    stored = load_template(stored_path).data
+
+    # --- Load model (warmed in the background at startup) ---
+    model_data = get_model()
+    if model_data is None:
+        return "error", None, f"⚠️ Model load error: {model_error}"
 
     # --- Detect model & scaler ---
-    if isinstance(model_data, tuple):
-        model = None
-        scaler = None
-        for obj in model_data:
-            if hasattr(obj, "predict"):
-                model = obj
-            elif hasattr(obj, "transform"):
-                scaler = obj
-    else:
-        model = model_data
-        scaler = None
-
-    # --- Compute similarity score (for info only) ---
-    min_rows = min(stored.shape[0], uploaded.shape[0])
-    min_cols = min(stored.shape[1], uploaded.shape[1])
-    diff = np.mean(np.abs(stored.values[:min_rows, :min_cols] - uploaded.values[:min_rows, :min_cols]))
-    #print("DEBUG: EEG difference =", diff)
-
-    # --- Prepare uploaded data for model ---
-    # Flatten and resize to expected input size (270)
-    features = uploaded.values.flatten()
-    expected_features = getattr(model, "n_features_in_", 270)
-    if len(features) > expected_features:
-        features = features[:expected_features]
-    elif len(features) < expected_features:
-        features = np.pad(features, (0, expected_features - len(features)), mode="constant")
-
-    features = features.reshape(1, -1)
-
-    # Apply scaler if exists
-    if scaler is not None:
-        try:
-            features = scaler.transform(features)
-        except Exception as e:
-            print("DEBUG: Skipping scaler transform:", e)
+    model, scaler = scoring.split_model(model_data)
 
-    # --- Predict ---
+    # --- Compute similarity score at the best alignment (within ±1 s) ---
+    similarity, _, lag = matching.xcorr_similarity(stored, uploaded)
+    diff = matching.aligned_diff(stored, uploaded, lag)
+
+    # --- Predict on every epoch of the upload in one batch ---
     try:
-        pred = model.predict(features)[0]
-        print("DEBUG: Model prediction =", pred)
+        score, n_epochs = scoring.score_probe(model, scaler, uploaded, target=scoring.target_for(model, empid))
     except Exception as e:
-        return f"⚠️ Prediction error: {e}"
+        return "error", None, f"⚠️ Prediction error: {e}"
 
     # --- Decision ---
-    if pred == 1 or diff < 0.12:
-        return f"✅ Brainwave Match (AI Verified)\nEEG Difference: {diff:.4f}"
+    details = (f"EEG Difference: {diff:.4f}\nCorrelation: {similarity:.3f} (offset {lag / preprocess.CANONICAL_RATE:+.2f}s)"
+               f"\nAI Score: {score:.3f} ({n_epochs} epochs)")
+    if score >= scoring.ACCEPT_SCORE or diff < matching.DIFF_ACCEPT:
+        return "accept", score, f"✅ Brainwave Match (AI Verified)\n{details}"
     else:
-        return f"❌ Brainwave Not Matching (AI Rejected)\nEEG Difference: {diff:.4f}"
+        return "reject", score, f"❌ Brainwave Not Matching (AI Rejected)\n{details}"
 
 
 # ---------- UI Cards ----------
@@ -340,7 +584,7 @@ def record_card():
         html.Br(),
         dbc.Input(id="rec-admin", placeholder="Admin Code", type="password", className="form-control"),
         html.Br(),
-        dcc.Upload(id="rec-upload", children=html.Div(["📂 Upload CSV"]), className="upload-zone"),
+        dcc.Upload(id="rec-upload", children=html.Div(["📂 Upload EEG (CSV, EDF/BDF, NPY/NPZ)"]), className="upload-zone"),
         html.Br(),
         html.Button("Upload & Save", id="rec-btn", className="btn-neon"),
         html.Div(id="rec-output", style={"marginTop": "10px"}),
@@ -361,7 +605,7 @@ def login_card():
         html.Hr(),
         html.Div(id="level2", style={"display": "none"}, children=[
             html.H4(" Brainwave Verification"),
-            dcc.Upload(id="brainwave-verify-upload", children=html.Div(["📂 Upload Brainwave CSV"]), className="upload-zone"),
+            dcc.Upload(id="brainwave-verify-upload", children=html.Div(["📂 Upload Brainwave (CSV, EDF/BDF, NPY/NPZ)"]), className="upload-zone"),
             html.Br(),
             html.Button("Verify Brainwave", id="verify-btn", className="btn-neon"),
             html.Div(id="verify-output", style={"marginTop": "10px"})
@@ -370,16 +614,22 @@ def login_card():
 
 
 def analytics_card():
-    cursor.execute("SELECT empid FROM employees")
-    users = cursor.fetchall()
-    options = [{"label": u[0], "value": u[0]} for u in users]
+    # only the first page is rendered; the rest is fetched as the user types
     return html.Div(className="glass-card", children=[
         html.H3(" Brainwave Analytics"),
-        dcc.Dropdown(id="analytics-user-dropdown", options=options, placeholder="Select user",style={"color": "black"}),
+        dcc.Dropdown(id="analytics-user-dropdown", options=employee_options(),
+                     placeholder="Search by Employee ID or name", style={"color": "black"}),
+        dcc.Store(id="analytics-search-prefix", data=""),
+        html.Button("More", id="analytics-more", className="btn-neon", style={"marginTop": "6px"}),
         html.Br(),
         dbc.Button("Compute Band Powers", id="compute-bands", className="btn-neon"),
         html.Div(id="band-powers-output", style={"marginTop": "12px"}),
-        dcc.Graph(id="psd-plot")
+        dcc.Graph(id="psd-plot"),
+        html.Hr(),
+        html.H4(" Fleet Overview"),
+        dbc.Button("Refresh Fleet View", id="fleet-refresh", className="btn-neon"),
+        html.Div(id="fleet-output", style={"marginTop": "12px"}),
+        dcc.Graph(id="fleet-plot")
     ])
 
 
@@ -440,17 +690,27 @@ def on_register(n, name, company_code, pwd, confirm):
 
 @app.callback(Output("rec-output", "children"),
               Input("rec-btn", "n_clicks"),
-              State("rec-empid", "value"), State("rec-admin", "value"), State("rec-upload", "contents"))
-def on_record(n, empid, admin, contents):
+              State("rec-empid", "value"), State("rec-admin", "value"),
+              State("rec-upload", "contents"), State("rec-upload", "filename"))
+def on_record(n, empid, admin, contents, filename):
     if not n: return ""
-    return save_brainwave_db(empid, admin, contents)
+    return save_brainwave_db(empid, admin, contents, filename)
+
+
+PREVIEW_POINTS = 2000
 
 
 @app.callback(Output("brainwave-preview", "figure"),
-              Input("rec-upload", "contents"))
-def update_graph(contents):
+              Input("rec-upload", "contents"), State("rec-upload", "filename"))
+def update_graph(contents, filename):
     if contents is None: return {}
-    df = pd.read_csv(io.BytesIO(base64.b64decode(contents.split(',')[1])))
+    import pandas as pd
+    import plotly.express as px
+    recording = read_upload(contents, filename)
+    # a preview needs at most PREVIEW_POINTS per channel; plotting every sample
+    # copies the whole recording into the DataFrame and the figure JSON
+    step = max(1, len(recording.data) // PREVIEW_POINTS)
+    df = pd.DataFrame(recording.data[::step], columns=recording.channels, index=np.arange(0, len(recording.data), step))
     fig = px.line(df, title="📊 Brainwave Data Preview")
     fig.update_layout(template="plotly_dark", paper_bgcolor="rgba(0,0,0,0)")
     return fig
@@ -462,17 +722,58 @@ def update_graph(contents):
     State("log-empid", "value"), State("log-pass", "value"))
 def on_login(n, empid, pwd):
     if not n: return "", {"display":"none"}
-    if verify_login_db(empid, pwd):
+    t0 = time.perf_counter()
+    ok = verify_login_db(empid, pwd)
+    audit.record(empid, "password", "accept" if ok else "reject",
+                 latency_ms=(time.perf_counter() - t0) * 1000, source="dash")
+    if ok:
         return "✅ Level 1 Passed.", {"display":"block"}
     return "❌ Invalid credentials.", {"display":"none"}
 
 
 @app.callback(Output("verify-output", "children"),
               Input("verify-btn", "n_clicks"),
-              State("log-empid", "value"), State("brainwave-verify-upload", "contents"))
-def on_verify(n, empid, contents):
+              State("log-empid", "value"), State("brainwave-verify-upload", "contents"),
+              State("brainwave-verify-upload", "filename"))
+def on_verify(n, empid, contents, filename):
     if not n: return ""
-    return ai_verify_brainwave(empid, contents)
+    t0 = time.perf_counter()
+    with verify_gate.admit(empid, request.remote_addr) as admission:
+        if not admission.ok:
+            decision, score = "throttled", None
+            message = (f"⏳ Too many verification attempts, try again in {admission.retry_header}s."
+                       if admission.status == 429 else
+                       f"⏳ Server busy, try again in {admission.retry_header}s.")
+        else:
+            try:
+                decision, score, message = verify_brainwave(empid, contents, filename)
+            except Exception as e:
+                decision, score, message = "error", None, f"⚠️ Verification error: {e}"
+    audit.record(empid, "brainwave", decision, score=score,
+                 latency_ms=(time.perf_counter() - t0) * 1000, source="dash",
+                 detail=admission.reason if not admission.ok else message if decision in ("error", "replay") else None)
+    return message
+
+
+@app.callback(Output("analytics-user-dropdown", "options"),
+              Output("analytics-search-prefix", "data"),
+              Input("analytics-user-dropdown", "search_value"),
+              Input("analytics-more", "n_clicks"),
+              State("analytics-user-dropdown", "options"),
+              State("analytics-user-dropdown", "value"),
+              State("analytics-search-prefix", "data"))
+def search_users(search, more, options, value, prefix):
+    if ctx.triggered_id == "analytics-more":
+        options = [o for o in options or [] if o["value"] != "__more__"]
+        after = options[-1]["value"] if options else ""
+        return options + employee_options(prefix, after), prefix
+    if not search:
+        # the dropdown clears its search text on blur; keep the current page
+        raise dash.exceptions.PreventUpdate
+    options = employee_options(search)
+    if value and value not in {o["value"] for o in options}:
+        options.insert(0, {"label": value, "value": value})
+    return options, search
 
 
 @app.callback(Output("band-powers-output", "children"),
@@ -483,24 +784,78 @@ def compute_bands(n, empid):
     if not n or not empid:
         return "", {}
 
-    cursor.execute("SELECT brainwave_path FROM employees WHERE empid=?", (empid,))
-    row = cursor.fetchone()
-    if not row or not row[0] or not os.path.exists(row[0]):
-        return "No EEG file found.", {}
+    stats = analytics.latest(conn, empid)
+    if stats is None:
+        # enrolled before analytics were materialized: fill it in once
+        row = conn.execute("SELECT brainwave_path FROM employees WHERE empid=?", (empid,)).fetchone()
+        if not row or not row[0] or not os.path.exists(row[0]):
+            return "No EEG file found.", {}
+        recording = load_template(row[0])
+        with db_write:
+            analytics.record(conn, empid, recording, row[0], recorded_at=os.path.getmtime(row[0]))
+            conn.commit()
+        stats = analytics.latest(conn, empid)
+
+    import plotly.graph_objects as go
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=stats["freqs"], y=stats["psd"]))
+    fig.update_layout(template="plotly_dark", paper_bgcolor="rgba(0,0,0,0)",
+                      xaxis_title="Frequency (Hz)", yaxis_title="PSD")
 
-    df = pd.read_csv(row[0])
-    data = df.values.flatten()
-    freqs = np.fft.rfftfreq(len(data), d=1.0/128)
-    psd = np.abs(np.fft.rfft(data))**2
+    powers = ", ".join(f"{b} {stats[b]:.1%}" for b in analytics.BAND_NAMES)
+    drift = "first enrollment" if stats["drift"] is None else f"drift {stats['drift']:.3f}"
+    return f"✅ Band powers: {powers} ({drift})", fig
+
+
+@app.callback(Output("fleet-output", "children"),
+              Output("fleet-plot", "figure"),
+              Input("fleet-refresh", "n_clicks"))
+def fleet_overview(n):
+    if not n:
+        return "", {}
+    dist = analytics.band_distribution(conn)
+    drift = analytics.top_drift(conn)
+    outliers = analytics.outliers(conn, dist=dist)
+
+    import plotly.graph_objects as go
+    fig = go.Figure(go.Bar(x=list(dist), y=[m for m, _, _ in dist.values()],
+                           error_y={"type": "data", "array": [sd for _, sd, _ in dist.values()]}))
+    fig.update_layout(template="plotly_dark", paper_bgcolor="rgba(0,0,0,0)",
+                      title=f"Relative band power across {max(c for _, _, c in dist.values())} employees")
+    summary = html.Div([
+        html.H5("Largest drift since previous enrollment"),
+        html.Ul([html.Li(f"{e}: {d:.3f}") for e, d, _ in drift] or [html.Li("No re-enrollments yet")]),
+        html.H5("Outlier enrollments"),
+        html.Ul([html.Li(f"{e}: z = {z:.2f}") for e, z in outliers] or [html.Li("No enrollments yet")]),
+    ])
+    return summary, fig
+
+
+# ---------- SHARD WORKER ----------
+def enroll_on_shard(empid, admin_code, contents, filename=None):
+    """/shard/enroll: the router owns the employee directory, so the row is created here on first use."""
+    if admin_code != ADMIN_CODE:
+        return "❌ Invalid Admin Code!"
+    if not valid_empid(empid):
+        return "⚠ Invalid Employee ID."
+    with db_write:
+        conn.execute("INSERT OR IGNORE INTO employees (empid) VALUES (?)", (empid,))
+        conn.commit()
+    search_employees.cache_clear()
+    return save_brainwave_db(empid, admin_code, contents, filename)
+
+
+def shard_stats():
+    enrolled = conn.execute("SELECT COUNT(*) FROM employees WHERE brainwave_path IS NOT NULL").fetchone()[0]
+    return {"enrolled": enrolled, "templates": conn.execute("SELECT COUNT(*) FROM brainwave_templates").fetchone()[0],
+            "model_loaded": brainwave_model is not None, "model_path": model_path}
 
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(x=freqs, y=psd))
-    fig.update_layout(template="plotly_dark", paper_bgcolor="rgba(0,0,0,0)")
 
-    return "✅ Band powers computed successfully.", fig
+shard.install(server, verify_brainwave, enroll_on_shard, shard_stats)  # no-op unless NEUROLOCK_SHARD_ID is set
 
 
 # ---------- RUN ----------
 if __name__ == "__main__":
-    os.makedirs("brainwaves", exist_ok=True)
+    os.makedirs(BRAINWAVE_DIR, exist_ok=True)
+    start_warmup()
     app.run(debug=True, port=8050)
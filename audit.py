@@ -0,0 +1,224 @@
+"""
+Append-only authentication audit log with group commit.
+
+record() only appends a tuple to an in-memory deque; a background writer
+thread drains it every FLUSH_INTERVAL_S (or as soon as FLUSH_BATCH rows are
+waiting) and writes each batch with one executemany inside one transaction,
+so a request never waits for an fsync. The log lives in its own SQLite file
+(WAL mode) so it never contends with neurolock.db. A batch whose write fails
+goes back to the head of the buffer and is retried on the next round.
+
+    audit.record("E101", "brainwave", "accept", score=0.93, latency_ms=41.2)
+    audit.query(empid="E101", since=time.time() - 86400)
+
+Retention: rows older than RETENTION_DAYS are deleted once per
+MAINTENANCE_INTERVAL_S. Rollover: when the file grows past ROLLOVER_BYTES it
+is renamed to neurolock_audit-YYYYmmdd-HHMMSS.db and a fresh one is started;
+only the newest KEEP_ARCHIVES archives are kept.
+"""
+import os
+import time
+import glob
+import atexit
+import logging
+import sqlite3
+import threading
+from collections import deque
+
+AUDIT_DB = os.environ.get("NEUROLOCK_AUDIT_DB", "neurolock_audit.db")
+FLUSH_INTERVAL_S = 0.5
+FLUSH_BATCH = 500
+MAX_BUFFER = 100000          # rows held in memory if the disk stalls; the oldest are dropped
+RETENTION_DAYS = 365
+ROLLOVER_BYTES = 256 * 1024 * 1024
+KEEP_ARCHIVES = 12
+MAINTENANCE_INTERVAL_S = 3600.0
+
+log = logging.getLogger(__name__)
+
+COLUMNS = ("ts", "empid", "stage", "decision", "score", "latency_ms", "source", "detail")
+
+
+# ---------- Schema ----------
+def _connect(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript("""
+    CREATE TABLE IF NOT EXISTS audit_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        ts REAL NOT NULL,
+        empid TEXT,
+        stage TEXT NOT NULL,
+        decision TEXT NOT NULL,
+        score REAL,
+        latency_ms REAL,
+        source TEXT,
+        detail TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_audit_empid_ts ON audit_log(empid, ts);
+    CREATE INDEX IF NOT EXISTS idx_audit_ts ON audit_log(ts);
+    CREATE TRIGGER IF NOT EXISTS audit_log_append_only BEFORE UPDATE ON audit_log
+    BEGIN SELECT RAISE(ABORT, 'audit_log is append-only'); END;
+    """)
+    return conn
+
+
+# ---------- Writer ----------
+class AuditLog:
+    def __init__(self, path=AUDIT_DB, flush_interval=FLUSH_INTERVAL_S):
+        self.path = os.path.abspath(path)
+        self.flush_interval = flush_interval
+        self.buffer = deque(maxlen=MAX_BUFFER)
+        self.dropped = 0
+        self.written = 0
+        self._wake = threading.Event()
+        self._flushed = threading.Condition()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._conn = None
+        self._last_maintenance = 0.0
+
+    def record(self, empid, stage, decision, score=None, latency_ms=None, source=None, detail=None):
+        """Queue one audit row; returns immediately (deque.append is atomic)."""
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped += 1
+        self.buffer.append((time.time(), empid, stage, decision,
+                            None if score is None else float(score),
+                            None if latency_ms is None else float(latency_ms),
+                            source, detail))
+        if self._thread is None:
+            self._start()
+        if len(self.buffer) >= FLUSH_BATCH:
+            self._wake.set()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._conn = _connect(self.path)
+                self._thread = threading.Thread(target=self._run, name="neurolock-audit", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        try:
+            self._maintain()                           # apply retention at startup
+        except Exception:
+            log.exception("audit: maintenance failed")
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self._write_pending()
+                if time.time() - self._last_maintenance > MAINTENANCE_INTERVAL_S:
+                    self._maintain()
+            except Exception:
+                log.exception("audit: write failed, retrying in %.1fs", self.flush_interval)
+
+    def _write_pending(self):
+        with self._lock:
+            while self.buffer:
+                batch = []
+                while self.buffer and len(batch) < FLUSH_BATCH * 4:
+                    batch.append(self.buffer.popleft())
+                try:
+                    with self._conn:                   # one transaction per batch
+                        self._conn.executemany(
+                            f"INSERT INTO audit_log ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                            batch)
+                except Exception:
+                    # back at the head of the queue for the next round; a full buffer sheds its newest rows
+                    self.dropped += max(0, len(self.buffer) + len(batch) - self.buffer.maxlen)
+                    self.buffer.extendleft(reversed(batch))
+                    raise
+                self.written += len(batch)
+        with self._flushed:
+            self._flushed.notify_all()
+
+    def flush(self, timeout=5.0):
+        """Block until everything queued so far is on disk (used at exit and by tests/benchmarks)."""
+        if self._thread is None:
+            return
+        with self._flushed:
+            self._wake.set()
+            deadline = time.time() + timeout
+            while self.buffer and time.time() < deadline:
+                self._flushed.wait(deadline - time.time())
+        # the last batch may still be inside its transaction
+        with self._lock:
+            pass
+
+    # ---------- Retention / rollover ----------
+    def _maintain(self):
+        self._last_maintenance = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM audit_log WHERE ts < ?",
+                                   (time.time() - RETENTION_DAYS * 86400,))
+            if os.path.getsize(self.path) > ROLLOVER_BYTES:
+                self._rollover()
+
+    def _rollover(self):
+        self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self._conn.close()
+        stem, ext = os.path.splitext(self.path)
+        os.replace(self.path, f"{stem}-{time.strftime('%Y%m%d-%H%M%S')}{ext}")
+        for leftover in (f"{self.path}-wal", f"{self.path}-shm"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        for old in sorted(glob.glob(f"{stem}-*{ext}"))[:-KEEP_ARCHIVES]:
+            os.remove(old)
+        self._conn = _connect(self.path)
+
+    # ---------- Queries ----------
+    def query(self, empid=None, since=None, until=None, stage=None, limit=100):
+        """Newest-first rows (as dicts) for one employee and/or a time range; both are indexed."""
+        where, params = [], []
+        if empid is not None:
+            where.append("empid = ?")
+            params.append(empid)
+        if since is not None:
+            where.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("ts < ?")
+            params.append(until)
+        if stage is not None:
+            where.append("stage = ?")
+            params.append(stage)
+        sql = f"SELECT {', '.join(COLUMNS)} FROM audit_log"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        conn = _connect(self.path)
+        try:
+            rows = conn.execute(sql + " ORDER BY ts DESC LIMIT ?", (*params, limit)).fetchall()
+        finally:
+            conn.close()
+        return [dict(zip(COLUMNS, r)) for r in rows]
+
+
+# ---------- Process-wide log ----------
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_log():
+    global _log
+    if _log is None:
+        with _log_lock:
+            if _log is None:
+                _log = AuditLog()
+    return _log
+
+
+def record(empid, stage, decision, score=None, latency_ms=None, source=None, detail=None):
+    get_log().record(empid, stage, decision, score, latency_ms, source, detail)
+
+
+def query(**kwargs):
+    return get_log().query(**kwargs)
+
+
+def flush(timeout=5.0):
+    if _log is not None:
+        _log.flush(timeout)
@@ -0,0 +1,1048 @@
+"""
+NeuroLock benchmark harness.
+
+Generates synthetic multi-channel EEG recordings, enrolls N synthetic users in
+a scratch directory and measures latency percentiles / throughput for every
+authentication path. Results are written as JSON so runs can be compared:
+
+    python benchmark.py --users 20 --out bench.json
+    python benchmark.py --users 20 --out bench2.json --compare bench.json
+"""
+import os
+import sys
+import json
+import re
+import time
+import shutil
+import io
+import base64
+import sqlite3
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import importlib
+import itertools
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_FILE = "neurolock_invariant_model.pkl"
+
+
+# ---------- Synthetic EEG ----------
+def synthetic_eeg(seed, n_samples=1280, n_channels=8, fs=128, noise=0.3):
+    """Per-user mixture of alpha/beta/theta rhythms plus noise, shape (samples, channels)."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_samples) / fs
+    freqs = rng.uniform([4, 8, 13], [8, 13, 30], size=(n_channels, 3))
+    amps = rng.uniform(0.2, 1.0, size=(n_channels, 3))
+    phases = rng.uniform(0, 2 * np.pi, size=(n_channels, 3))
+    waves = amps[None] * np.sin(2 * np.pi * freqs[None] * t[:, None, None] + phases[None])
+    data = waves.sum(axis=2) + noise * rng.standard_normal((n_samples, n_channels))
+    return data
+
+
+def session_of(base, seed, noise=0.05):
+    """A fresh 'session' of the same user: same rhythm, new noise."""
+    rng = np.random.default_rng(seed)
+    return base + noise * rng.standard_normal(base.shape)
+
+
+def fresh_session(seed, session, n_samples=1280, n_channels=8, fs=128, noise=0.3):
+    """A new recording of user `seed`: the same rhythms as synthetic_eeg, new phases and noise."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(n_samples) / fs
+    freqs = rng.uniform([4, 8, 13], [8, 13, 30], size=(n_channels, 3))
+    amps = rng.uniform(0.2, 1.0, size=(n_channels, 3))
+    rng = np.random.default_rng([seed, session])
+    phases = rng.uniform(0, 2 * np.pi, size=(n_channels, 3))
+    waves = amps[None] * np.sin(2 * np.pi * freqs[None] * t[:, None, None] + phases[None])
+    return waves.sum(axis=2) + noise * rng.standard_normal((n_samples, n_channels))
+
+
+def to_csv_bytes(data):
+    header = ",".join(f"ch{i}" for i in range(data.shape[1]))
+    lines = [header] + [",".join(f"{v:.6f}" for v in row) for row in data]
+    return ("\n".join(lines) + "\n").encode()
+
+
+def to_data_url(raw, mime="text/csv"):
+    return f"data:{mime};base64," + base64.b64encode(raw).decode()
+
+
+# ---------- Timing ----------
+def measure(fn, repeats, warmup=1):
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+    wall = time.perf_counter() - start
+    return summarize(latencies, wall)
+
+
+def summarize(latencies, wall):
+    ms = np.asarray(latencies) * 1000.0
+    return {
+        "n": int(ms.size),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p90_ms": float(np.percentile(ms, 90)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+        "throughput_per_s": float(ms.size / wall) if wall > 0 else None,
+    }
+
+
+def _cycle(items):
+    state = {"i": 0}
+
+    def nxt():
+        item = items[state["i"] % len(items)]
+        state["i"] += 1
+        return item
+    return nxt
+
+
+def expect(ok, what):
+    """Fail the suite (also under python -O) when a timed call did not do what it measures."""
+    if not ok:
+        raise RuntimeError(what)
+
+
+def _fresh_import(name):
+    sys.modules.pop(name, None)
+    return importlib.import_module(name)
+
+
+# ---------- Dash app (app.py) ----------
+def dash_payload(outputs, inputs, state):
+    out_ids = [{"id": o[0], "property": o[1]} for o in outputs]
+    if len(outputs) == 1:
+        output = f"{outputs[0][0]}.{outputs[0][1]}"
+    else:
+        output = ".." + "...".join(f"{o[0]}.{o[1]}" for o in outputs) + ".."
+    return {
+        "output": output,
+        "outputs": out_ids if len(out_ids) > 1 else out_ids[0],
+        "inputs": [{"id": i[0], "property": i[1], "value": i[2]} for i in inputs],
+        "state": [{"id": s[0], "property": s[1], "value": s[2]} for s in state],
+        "changedPropIds": [f"{inputs[0][0]}.{inputs[0][1]}"],
+    }
+
+
+BULK_EMPLOYEES = 50000
+
+
+def bench_app(n_users, repeats, workdir):
+    results = {}
+    t0 = time.perf_counter()
+    app_mod = _fresh_import("app")
+    results["app_import_s"] = time.perf_counter() - t0
+    app_mod.AUTO_RETRAIN = False      # timed separately below
+    app_mod.start_warmup()
+    app_mod.model_ready.wait()
+    results["app_time_to_ready_s"] = time.perf_counter() - t0
+
+    users = []
+    t0 = time.perf_counter()
+    for i in range(n_users):
+        msg = app_mod.register_user(f"user{i}", "230106", "pw", "pw")
+        users.append(msg.rsplit(" ", 1)[-1])
+    results["register_user"] = measure(
+        lambda: app_mod.register_user("bench", "230106", "pw", "pw"), repeats)
+    enroll_wall = time.perf_counter() - t0
+
+    bases = {}
+    lat = []
+    for i, empid in enumerate(users):
+        bases[empid] = synthetic_eeg(seed=i)
+        url = to_data_url(to_csv_bytes(bases[empid]))
+        s = time.perf_counter()
+        app_mod.save_brainwave_db(empid, app_mod.ADMIN_CODE, url)
+        lat.append(time.perf_counter() - s)
+    results["save_brainwave_db"] = summarize(lat, sum(lat))
+    results["enroll_wall_s"] = enroll_wall + sum(lat)
+
+    nxt_user = _cycle(users)
+    results["verify_login_db"] = measure(lambda: app_mod.verify_login_db(nxt_user(), "pw"), repeats)
+
+    # every login is a new recording; repeating an accepted upload is refused as a replay
+    index = {e: i for i, e in enumerate(users)}
+    logins = iter([(e, to_data_url(to_csv_bytes(fresh_session(index[e], 1000 + k))))
+                   for k, e in zip(range(3 * (repeats + 1)), itertools.cycle(users))])
+    genuine = {e: to_data_url(to_csv_bytes(fresh_session(i, 1))) for e, i in index.items()}
+    import upload_cache
+
+    def cold_verify():
+        # a fresh upload each round; drop the parsed copy left by the previous one
+        upload_cache.clear()
+        return app_mod.ai_verify_brainwave(*next(logins))
+
+    results["ai_verify_brainwave"] = measure(cold_verify, repeats)
+    # Mahalanobis template decisions: the next user's probe, then each user's own
+    decide = lambda e, probe: app_mod.verify_brainwave(e, probe)[0]
+    results["template_impostor_accept_rate"] = float(np.mean(
+        [decide(e, genuine[users[(k + 1) % len(users)]]) == "accept" for k, e in enumerate(users)]))
+    results["template_genuine_accept_rate"] = float(np.mean([decide(e, genuine[e]) == "accept" for e in users]))
+    # the accepted probes again: byte-identical, then rescaled with a little added noise
+    rng = np.random.default_rng(7)
+    results["replay_exact_detect_rate"] = float(np.mean([decide(e, genuine[e]) == "replay" for e in users]))
+    results["replay_perturbed_detect_rate"] = float(np.mean([decide(e, to_data_url(to_csv_bytes(
+        1.5 * fresh_session(i, 1) + 0.05 * rng.standard_normal((1280, 8))))) == "replay" for e, i in index.items()]))
+    # the pre-template path (alignment + model) for users enrolled before templates existed
+    stashed = app_mod.conn.execute("SELECT * FROM brainwave_templates").fetchall()
+    app_mod.conn.execute("DELETE FROM brainwave_templates")
+    results["ai_verify_brainwave_legacy"] = measure(cold_verify, repeats)
+
+    # incremental retraining: full pass over N new enrollments, then one re-enrollment
+    import retrain
+    t = time.perf_counter()
+    retrain.run(app_mod.DB_FILE)
+    results["retrain_initial_s"] = time.perf_counter() - t
+    app_mod.save_brainwave_db(users[0], app_mod.ADMIN_CODE, genuine[users[0]])
+    t = time.perf_counter()
+    retrain.run(app_mod.DB_FILE)
+    results["retrain_incremental_s"] = time.perf_counter() - t
+    app_mod.load_model()
+    results["ai_verify_brainwave_retrained"] = measure(cold_verify, repeats)
+    results["ai_verify_brainwave_retrained_accept_rate"] = float(np.mean(
+        [app_mod.verify_brainwave(e, to_data_url(to_csv_bytes(fresh_session(index[e], 5))))[0] == "accept"
+         for e in users[:20]]))
+    results["ai_verify_brainwave_retrained_impostor_rate"] = float(np.mean(
+        [app_mod.verify_brainwave(e, to_data_url(to_csv_bytes(fresh_session(index[users[k - 1]], 6))))[0] == "accept"
+         for k, e in enumerate(users[:20])]))
+    app_mod.conn.executemany("INSERT OR REPLACE INTO brainwave_templates VALUES (?, ?, ?, ?)", stashed)
+    app_mod.conn.commit()
+    results["retrain_needed_with_templates"] = app_mod.retrain.needed(app_mod.conn)
+
+    client = app_mod.app.server.test_client()
+    nxt_user = _cycle(users)
+
+    def compute_bands():
+        payload = dash_payload(
+            outputs=[("band-powers-output", "children"), ("psd-plot", "figure")],
+            inputs=[("compute-bands", "n_clicks", 1)],
+            state=[("analytics-user-dropdown", "value", nxt_user())])
+        r = client.post("/_dash-update-component", json=payload)
+        expect(r.status_code == 200, f"dash callback returned {r.status_code}")
+    results["compute_bands"] = measure(compute_bands, repeats)
+
+    def fleet_overview():
+        payload = dash_payload(outputs=[("fleet-output", "children"), ("fleet-plot", "figure")],
+                               inputs=[("fleet-refresh", "n_clicks", 1)], state=[])
+        r = client.post("/_dash-update-component", json=payload)
+        expect(r.status_code == 200, f"dash callback returned {r.status_code}")
+    results["fleet_overview"] = measure(fleet_overview, repeats)
+
+    def render_analytics():
+        payload = dash_payload(outputs=[("tab-content", "children")],
+                               inputs=[("tabs", "value", "analytics")], state=[])
+        r = client.post("/_dash-update-component", json=payload)
+        expect(r.status_code == 200, f"dash callback returned {r.status_code}")
+    results["render_analytics_tab"] = measure(render_analytics, repeats)
+
+    # the picker must not grow with headcount: bulk-add employees and re-measure
+    app_mod.conn.executemany("INSERT INTO employees (empid, name, password) VALUES (?, ?, 'pw')",
+                             [(f"B{i:06d}", f"bulk{i}") for i in range(BULK_EMPLOYEES)])
+    app_mod.conn.commit()
+    app_mod.search_employees.cache_clear()
+    results[f"render_analytics_tab_{BULK_EMPLOYEES}"] = measure(render_analytics, repeats)
+
+    prefixes = _cycle([f"B{i:02d}" for i in range(100)] + [f"bulk{i}" for i in range(100)])
+
+    def search_users():
+        payload = dash_payload(
+            outputs=[("analytics-user-dropdown", "options"), ("analytics-search-prefix", "data")],
+            inputs=[("analytics-user-dropdown", "search_value", prefixes()), ("analytics-more", "n_clicks", None)],
+            state=[("analytics-user-dropdown", "options", []), ("analytics-user-dropdown", "value", None),
+                   ("analytics-search-prefix", "data", "")])
+        r = client.post("/_dash-update-component", json=payload)
+        expect(r.status_code == 200, f"dash callback returned {r.status_code}")
+    results[f"search_users_{BULK_EMPLOYEES}"] = measure(search_users, repeats)
+
+    # a one-character prefix matches most of the table: cold cache, every page must still be bounded
+    short = _cycle(["b", "B"])
+
+    def search_one_char():
+        app_mod.search_employees.cache_clear()
+        app_mod.search_employees(short())
+    results[f"search_users_1char_{BULK_EMPLOYEES}"] = measure(search_one_char, repeats)
+
+    # one 60 s upload through preview, save and verify: parsed once, then shared
+    upload = to_data_url(to_csv_bytes(synthetic_eeg(seed=777, n_samples=128 * 60)))
+    parses = upload_cache.stats()["parses"]
+    preview = dash_payload(outputs=[("brainwave-preview", "figure")],
+                           inputs=[("rec-upload", "contents", upload)], state=[("rec-upload", "filename", "s.csv")])
+    t = time.perf_counter()
+    expect(client.post("/_dash-update-component", json=preview).status_code == 200, "upload preview failed")
+    results["upload_preview_ms"] = (time.perf_counter() - t) * 1000
+    t = time.perf_counter()
+    app_mod.save_brainwave_db(users[-1], app_mod.ADMIN_CODE, upload, "s.csv")
+    results["upload_save_after_preview_ms"] = (time.perf_counter() - t) * 1000
+    t = time.perf_counter()
+    app_mod.verify_brainwave(users[-1], upload, "s.csv")
+    results["upload_verify_after_save_ms"] = (time.perf_counter() - t) * 1000
+    results["upload_parses"] = upload_cache.stats()["parses"] - parses
+    results["upload_cache"] = upload_cache.stats()
+    return results
+
+
+# ---------- Flask liveness app (webcam.py) ----------
+def bench_webcam(repeats, workdir):
+    import ratelimit
+    webcam = _fresh_import("webcam")
+    client = webcam.app.test_client()
+    limited_gate = webcam.verify_gate
+    limited_challenges = webcam.challenge_buckets
+    # the happy path is timed without limits; the shed path separately below
+    webcam.verify_gate = ratelimit.Admission(ip_rate=1e9, ip_burst=1e9, empid_rate=1e9, empid_burst=1e9)
+    webcam.challenge_buckets = ratelimit.TokenBuckets(1e9, 1e9)
+    rng = np.random.default_rng(0)
+    jpeg = rng.integers(0, 256, 60000, dtype=np.uint8).tobytes()
+    face = to_data_url(jpeg, "image/jpeg")
+    results = {}
+
+    results["webcam_challenge"] = measure(lambda: client.get("/challenge"), repeats)
+
+    def fields():
+        chal = client.get("/challenge").get_json()
+        return {"nonce": chal["nonce"], "ts": time.time(), "blink_count": 2, "head_motion": 1.0,
+                "focus_score": 0.8, "challenge_observed": chal["challenge"]}
+
+    def verify():
+        r = client.post("/verify", json={**fields(), "face": face})
+        expect(r.status_code == 200, r.get_json())
+    results["webcam_verify"] = measure(verify, repeats)
+
+    def verify_multipart():
+        r = client.post("/verify", data={**fields(), "face": (io.BytesIO(jpeg), "face.jpg", "image/jpeg")},
+                        content_type="multipart/form-data")
+        expect(r.status_code == 200, r.get_json())
+    results["webcam_verify_multipart"] = measure(verify_multipart, repeats)
+
+    def verify_raw():
+        headers = {"X-" + k.replace("_", "-"): str(v) for k, v in fields().items()}
+        r = client.post("/verify", data=jpeg, content_type="image/jpeg", headers=headers)
+        expect(r.status_code == 200, r.get_json())
+    results["webcam_verify_raw"] = measure(verify_raw, repeats)
+    results["webcam_payload_bytes"] = {"json": len(json.dumps({**fields(), "face": face})), "raw": len(jpeg)}
+
+    too_big = bytes(webcam.MAX_FACE_BYTES + 1)
+    results["webcam_oversize_status"] = {
+        "raw": client.post("/verify", data=too_big, content_type="image/jpeg").status_code,
+        "multipart": client.post("/verify", data={**fields(), "face": (io.BytesIO(too_big), "f.jpg")},
+                                 content_type="multipart/form-data").status_code,
+    }
+
+    # a JSON body that is not an object, or a nonce that is not a string, is a 400 (not a 500)
+    results["webcam_bad_json_status"] = [client.post("/verify", json=body).status_code
+                                         for body in ([1, 2], 5, "x", None, {**fields(), "face": face, "nonce": [1]})]
+
+    webcam.verify_gate = limited_gate
+    webcam.challenge_buckets = limited_challenges
+    results["webcam_challenge_throttled_status"] = [client.get("/challenge").status_code
+                                                    for _ in range(webcam.CHALLENGE_BURST + 2)][-2:]
+
+    def throttled():
+        r = client.post("/verify", json={"empid": "E100"})
+        expect(r.status_code in (400, 429), f"throttled /verify returned {r.status_code}")
+    results["webcam_verify_throttled"] = measure(throttled, repeats)
+    results["webcam_verify_throttled"]["rejected"] = dict(limited_gate.rejected)
+    return results
+
+
+# ---------- Tk scorers (neurolock_core) on SQLite ----------
+class SQLiteStandIn:
+    """Minimal mysql.connector look-alike over SQLite (translates %s placeholders)."""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+
+    def cursor(self):
+        return _SQLiteCursor(self.conn.cursor())
+
+    def commit(self):
+        self.conn.commit()
+
+    def rollback(self):
+        self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
+
+
+class _SQLiteCursor:
+    def __init__(self, cur):
+        self.cur = cur
+
+    def execute(self, sql, params=()):
+        sql = sql.replace("%s", "?").replace("AUTO_INCREMENT", "AUTOINCREMENT")
+        sql = re.sub(r",\s*INDEX \w+ \([^)]*\)", "", sql)        # MySQL inline index
+        return self.cur.execute(sql, params)
+
+    @property
+    def rowcount(self):
+        return self.cur.rowcount
+
+    def fetchone(self):
+        return self.cur.fetchone()
+
+    def fetchall(self):
+        return self.cur.fetchall()
+
+    def close(self):
+        self.cur.close()
+
+
+def bench_tk_scorers(n_users, repeats, workdir):
+    core = _fresh_import("neurolock_core")
+    db_path = os.path.join(workdir, "neuro_users.db")
+    core.set_connection_factory(lambda: SQLiteStandIn(db_path))
+    core.create_table_if_not_exists()
+
+    paths = {}
+    for i in range(n_users):
+        emp_id = f"T{i}"
+        path = os.path.join(workdir, f"tk_{emp_id}.csv")
+        with open(path, "wb") as f:
+            f.write(to_csv_bytes(synthetic_eeg(seed=500 + i)))
+        paths[emp_id] = path
+
+    results = {}
+    pending = list(paths)
+    results["core_register_user"] = measure(
+        lambda: (lambda e: core.register_user(e, e, "pw", paths[e]))(pending.pop()),
+        len(paths), warmup=0)
+
+    nxt = _cycle(list(paths))
+    results["core_authenticate_user"] = measure(
+        lambda: (lambda e: core.authenticate_user(e, "pw", paths[e]))(nxt()), repeats)
+    results["core_authenticate"] = measure(
+        lambda: (lambda e: core.authenticate(e, "pw", paths[e]))(nxt()), repeats)
+    # a second session for one user merges into its template without re-reading the first
+    emp_id = next(iter(paths))
+    results["core_register_session"] = measure(lambda: core.register_user(emp_id, emp_id, "pw", paths[emp_id]),
+                                               1, warmup=0)
+    core.set_connection_factory(None)
+    return results
+
+
+# ---------- Startup ----------
+HEAVY_MODULES = ("tkinter", "mysql", "sklearn", "pandas", "bcrypt")
+STARTUP_BUDGET_MS = 500
+
+
+def bench_startup(repeats, module="neurolock_core"):
+    """Cold-start a headless worker process that imports `module` and report heavy imports."""
+    code = (f"import sys, json; import {module}; "
+            f"print(json.dumps(sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules)))")
+    lat = []
+    heavy = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", code], cwd=REPO_DIR,
+                             capture_output=True, text=True, check=True).stdout
+        lat.append(time.perf_counter() - t0)
+        heavy = json.loads(out.strip().splitlines()[-1])
+    stats = summarize(lat, sum(lat))
+    stats["heavy_imports"] = heavy
+    stats["budget_ms"] = STARTUP_BUDGET_MS
+    stats["over_budget"] = bool(heavy) or stats["p50_ms"] > STARTUP_BUDGET_MS
+    return {f"startup_{module}": stats}
+
+
+APP_IMPORT_BUDGET_MS = 1500
+APP_LAZY_MODULES = ("pandas", "plotly.express", "sklearn", "joblib")
+
+
+def import_time(module, workdir):
+    """Run `python -X importtime -c "import module"` and return {imported module: cumulative us}."""
+    env = dict(os.environ, PYTHONPATH=REPO_DIR)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=workdir, env=env, capture_output=True, text=True, check=True)
+    cumulative = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cum, name = line[len("import time:"):].split("|")
+        cumulative[name.strip()] = int(cum)
+    return cumulative
+
+
+def bench_app_import(workdir):
+    cumulative = import_time("app", workdir)
+    total_ms = cumulative.get("app", 0) / 1000.0
+    eager = [m for m in APP_LAZY_MODULES if m in cumulative]
+    slowest = sorted(((v, k) for k, v in cumulative.items() if "." not in k and k != "app"), reverse=True)[:10]
+    return {"import_app": {
+        "import_ms": total_ms,
+        "budget_ms": APP_IMPORT_BUDGET_MS,
+        "eager_heavy_imports": eager,
+        "over_budget": total_ms > APP_IMPORT_BUDGET_MS or bool(eager),
+        "top_level_ms": {name: us / 1000.0 for us, name in slowest},
+    }}
+
+
+# ---------- EEG readers (eeg_io) ----------
+def bench_readers(workdir, minutes=60, n_channels=8, fs=128, repeats=3):
+    """Read one long recording in every eeg_io format and report latency and MB/s."""
+    import eeg_io
+    data = synthetic_eeg(seed=42, n_samples=minutes * 60 * fs, n_channels=n_channels, fs=fs)
+    rec = eeg_io.Recording(data, [f"ch{i}" for i in range(n_channels)], fs)
+    paths = {
+        "edf": os.path.join(workdir, "long.edf"),
+        "bdf": os.path.join(workdir, "long.bdf"),
+        "npy": os.path.join(workdir, "long.npy"),
+        "npz": os.path.join(workdir, "long.npz"),
+        "raw": os.path.join(workdir, "long.f32"),
+    }
+    eeg_io.write_edf(paths["edf"], rec)
+    eeg_io.write_edf(paths["bdf"], rec, bdf=True)
+    np.save(paths["npy"], data)
+    eeg_io.write_npz(paths["npz"], rec)
+    data.astype(np.float32).tofile(paths["raw"])
+    # CSV is written for a tenth of the duration only; text parsing dominates
+    paths["csv"] = os.path.join(workdir, "long.csv")
+    with open(paths["csv"], "wb") as f:
+        f.write(to_csv_bytes(data[:len(data) // 10]))
+
+    results = {}
+    for fmt, path in paths.items():
+        kwargs = {"n_channels": n_channels} if fmt == "raw" else {}
+        # np.asarray forces memory-mapped .npy data off the disk like the other formats
+        stats = measure(lambda: np.asarray(eeg_io.read_eeg(path, **kwargs).data).sum(), repeats)
+        stats["file_mb"] = os.path.getsize(path) / 1e6
+        stats["mb_per_s"] = stats["file_mb"] / (stats["p50_ms"] / 1000.0)
+        results[f"read_{fmt}"] = stats
+    return results
+
+
+# ---------- Preprocessing ----------
+def bench_preprocess(repeats, n_channels=8):
+    """Preprocess 10 s recordings at the canonical rate and at 256/250 Hz (resampled)."""
+    import eeg_io
+    import preprocess
+    results = {}
+    for fs in (preprocess.CANONICAL_RATE, 256, 250):
+        data = synthetic_eeg(seed=fs, n_samples=10 * fs, n_channels=n_channels, fs=fs)
+        rec = eeg_io.Recording(data, [f"ch{i}" for i in range(n_channels)], fs)
+        stats = measure(lambda: preprocess.preprocess(rec), repeats)
+        stats["files_per_min"] = 60000.0 / stats["p50_ms"]
+        results[f"preprocess_{fs}hz"] = stats
+    return results
+
+
+# ---------- Epoch scoring ----------
+def bench_scoring(repeats):
+    """One-window predict (old ai_verify path) vs batched epoch scoring of the whole probe."""
+    import joblib
+    import scoring
+    model, scaler = scoring.split_model(joblib.load(os.path.join(REPO_DIR, MODEL_FILE)))
+    probe = synthetic_eeg(seed=7)
+    n_features = getattr(model, "n_features_in_", scoring.DEFAULT_FEATURES)
+
+    def single():
+        x = probe.flatten()[:n_features].reshape(1, -1)
+        return model.predict(scaler.transform(x) if scaler is not None else x)
+
+    results = {
+        "predict_single_window": measure(single, repeats),
+        "score_probe_epochs": measure(lambda: scoring.score_probe(model, scaler, probe), repeats),
+    }
+    results["score_probe_epochs"]["epochs"] = len(scoring.epoch_matrix(probe, n_features))
+    return results
+
+
+# ---------- Matching ----------
+def bench_matching(repeats, n_channels=8, fs=128):
+    """FFT cross-correlation matcher vs the old fixed-index mean-abs diff at typical lengths."""
+    import matching
+    results = {}
+    for seconds in (10, 60, 300):
+        stored = synthetic_eeg(seed=1, n_samples=seconds * fs, n_channels=n_channels, fs=fs)
+        probe = session_of(stored, seed=2)[fs // 2:]      # starts half a second late
+        rows = min(len(stored), len(probe))
+
+        def diff():
+            return np.mean(np.abs(stored[:rows] - probe[:rows]))
+        results[f"match_diff_{seconds}s"] = measure(diff, repeats)
+        results[f"match_xcorr_{seconds}s"] = measure(lambda: matching.xcorr_similarity(stored, probe), repeats)
+        score, _, lag = matching.xcorr_similarity(stored, probe)
+        results[f"match_xcorr_{seconds}s"].update({"score": score, "lag": lag, "fixed_index_diff": float(diff()),
+                                                  "aligned_diff": matching.aligned_diff(stored, probe, lag)})
+    return results
+
+
+# ---------- NumPy model export ----------
+def bench_export(repeats, workdir):
+    """Parity, epoch-scoring latency and cold-start load of the pickle vs its npz_model export."""
+    import joblib
+    import npz_model
+    import scoring
+    pkl = os.path.join(workdir, MODEL_FILE)
+    npz = npz_model.export(pkl, os.path.join(workdir, "bench_model.npz"))
+    ok, mismatches, max_dp = npz_model.check(pkl, npz)
+
+    probe = synthetic_eeg(seed=7)
+    results = {}
+    for name, loaded in (("pickle", joblib.load(pkl)), ("npz", npz_model.load(npz))):
+        model, scaler = scoring.split_model(loaded)
+        results[f"score_probe_{name}"] = measure(lambda: scoring.score_probe(model, scaler, probe), repeats)
+
+    for name, path, loader in (("pickle", pkl, "import joblib; joblib.load(p)"),
+                               ("npz", npz, "import npz_model; npz_model.load(p)")):
+        code = (f"import sys, json; p = {path!r}; {loader}; "
+                f"print(json.dumps('sklearn' in sys.modules))")
+        lat = []
+        for _ in range(max(3, repeats // 10)):
+            t0 = time.perf_counter()
+            out = subprocess.run([sys.executable, "-c", code], cwd=REPO_DIR,
+                                 capture_output=True, text=True, check=True).stdout
+            lat.append(time.perf_counter() - t0)
+        stats = summarize(lat, sum(lat))
+        stats["imports_sklearn"] = json.loads(out.strip().splitlines()[-1])
+        results[f"cold_load_{name}"] = stats
+    results["score_probe_npz"].update({"parity_ok": ok, "prediction_mismatches": mismatches, "max_abs_dp": max_dp})
+    return results
+
+
+# ---------- Memory accounting (memprof) ----------
+def bench_memory(workdir, minutes=5, n_channels=8, fs=256):
+    """Peak allocation per Dash callback / webcam route with NEUROLOCK_MEMPROF=tracemalloc."""
+    import tracemalloc
+    import memprof
+    import ratelimit
+    memprof.MODE = "tracemalloc"
+    memprof.reset()
+    try:
+        app_mod = _fresh_import("app")
+        app_mod.AUTO_RETRAIN = False
+        app_mod.start_warmup()
+        app_mod.model_ready.wait()
+        webcam = _fresh_import("webcam")
+        empid = app_mod.register_user("memprof", "230106", "pw", "pw").rsplit(" ", 1)[-1]
+        url = to_data_url(to_csv_bytes(synthetic_eeg(seed=3, n_samples=minutes * 60 * fs, n_channels=n_channels, fs=fs)))
+        client = app_mod.server.test_client()
+        calls = [
+            ([("brainwave-preview", "figure")], [("rec-upload", "contents", url)], [("rec-upload", "filename", "a.csv")]),
+            ([("rec-output", "children")], [("rec-btn", "n_clicks", 1)],
+             [("rec-empid", "value", empid), ("rec-admin", "value", app_mod.ADMIN_CODE),
+              ("rec-upload", "contents", url), ("rec-upload", "filename", "a.csv")]),
+            ([("verify-output", "children")], [("verify-btn", "n_clicks", 1)],
+             [("log-empid", "value", empid), ("brainwave-verify-upload", "contents", url),
+              ("brainwave-verify-upload", "filename", "a.csv")]),
+        ]
+        for outputs, inputs, state in calls:
+            r = client.post("/_dash-update-component", json=dash_payload(outputs, inputs, state))
+            expect(r.status_code == 200, f"dash callback returned {r.status_code}")
+        wc = webcam.app.test_client()
+        webcam.challenge_buckets = ratelimit.TokenBuckets(1e9, 1e9)
+        for _ in range(50):
+            wc.get("/challenge")
+        report = client.get("/debug/memory").get_json()
+    finally:
+        memprof.MODE = ""
+        tracemalloc.stop()
+
+    # the challenge store stays bounded however many are issued (untraced, so it is quick)
+    for _ in range(3 * webcam.MAX_ACTIVE_CHALLENGES // 2):
+        wc.get("/challenge")
+
+    results = {"upload_mb": len(url) / 1e6,
+               "active_challenges": {"issued": 3 * webcam.MAX_ACTIVE_CHALLENGES // 2,
+                                     "held": len(webcam.ACTIVE_CHALLENGES),
+                                     "max": webcam.MAX_ACTIVE_CHALLENGES}}
+    for name, p in report["paths"].items():
+        results[f"memory_{name}"] = {k: p[k] for k in ("count", "peak_kb_max", "ms_mean")}
+        results[f"memory_{name}"]["top_lines"] = [f"{t['line']} +{t['size_kb']:.0f}KB" for t in p["top_lines"][:3]]
+    return results
+
+
+# ---------- Replay detection ----------
+REPLAY_HISTORY = 1000000
+
+
+def bench_replay(repeats, workdir):
+    """Sketch cost, detection vs fresh sessions, and lookups against a million past submissions."""
+    import replay
+    import eeg_io
+    import preprocess
+    rng = np.random.default_rng(11)
+    prep = lambda d: preprocess.preprocess(eeg_io.Recording(d, [f"ch{i}" for i in range(d.shape[1])], 128.0)).data
+    originals = [prep(fresh_session(u, 0)) for u in range(20)]
+    sigs = [replay.sketch(o) for o in originals]
+    results = {"replay_sketch": measure(lambda: replay.sketch(originals[0]), repeats),
+               "replay_probe_sketch": measure(lambda: replay.probe_sketch(originals[0]), repeats)}
+
+    def distances(variant):
+        return [int(replay._hamming(s, replay.sketch(prep(variant(u))))[0]) for u, s in enumerate(sigs)]
+    base = lambda u: fresh_session(u, 0)
+    results["replay_bits_noise"] = distances(lambda u: base(u) + 0.05 * rng.standard_normal((1280, 8)))
+    results["replay_bits_rescaled"] = distances(lambda u: 3 * base(u) + 1)
+    results["replay_bits_shifted"] = distances(lambda u: np.roll(base(u), 37, axis=0))
+    results["fresh_session_bits"] = distances(lambda u: fresh_session(u, 1))
+
+    index = replay.ReplayIndex(os.path.join(workdir, "replay_index.npz"))
+    t = time.perf_counter()
+    index.extend(rng.integers(0, 2 ** 64, size=(REPLAY_HISTORY, replay.WORDS), dtype=np.uint64))
+    results["replay_bulk_load_s"] = time.perf_counter() - t
+    # MERGE_EVERY more rows: add() hands the merge into the million-row tables to a background thread
+    extra = rng.integers(0, 2 ** 64, size=(replay.MERGE_EVERY, replay.WORDS), dtype=np.uint64)
+    index.path, path = None, index.path         # without the SAVE_EVERY save it would also trigger
+    t = time.perf_counter()
+    index.add(extra)
+    results["replay_add_triggering_merge_ms"] = (time.perf_counter() - t) * 1000
+    index.path = path
+    merger = index._merger
+    if merger is not None:
+        merger.join()
+    results["replay_background_merge_s"] = time.perf_counter() - t
+    for u, sig in enumerate(sigs):
+        index.add(sig, empid=f"U{u}")
+    probes = _cycle([replay.sketch(prep(base(u) + 0.05 * rng.standard_normal((1280, 8)))) for u in range(20)])
+    fresh = _cycle([replay.sketch(prep(fresh_session(u, 2))) for u in range(20)])
+    results[f"replay_lookup_hit_{REPLAY_HISTORY}"] = measure(lambda: index.lookup(probes()), repeats)
+    results[f"replay_lookup_miss_{REPLAY_HISTORY}"] = measure(lambda: index.lookup(fresh()), repeats)
+    results["replay_detect_rate"] = float(np.mean([index.lookup(probes()) is not None for _ in range(20)]))
+    results["replay_false_match_rate"] = float(np.mean([index.lookup(fresh()) is not None for _ in range(20)]))
+
+    # 40 s accepted, replayed with the start cropped off at an offset that is not a block boundary
+    long = [prep(fresh_session(u, 3, n_samples=128 * 40)) for u in range(20)]
+    for u, o in enumerate(long):
+        index.add(replay.sketch(o), empid=f"U{u}")
+    crops = [int(rng.uniform(0, 25) * 128) for _ in long]
+    results["replay_cropped_detect_rate"] = float(np.mean([
+        index.lookup(replay.probe_sketch(o[c:] + 0.05 * rng.standard_normal(o[c:].shape))) is not None
+        for o, c in zip(long, crops)]))
+    results["replay_cropped_false_match_rate"] = float(np.mean([
+        index.lookup(replay.probe_sketch(prep(fresh_session(u, 4, n_samples=128 * 40)))) is not None
+        for u in range(20)]))
+    t = time.perf_counter()
+    index.save()
+    results["replay_save_s"] = time.perf_counter() - t
+    results["replay_file_mb"] = os.path.getsize(index.path) / 2 ** 20
+    t = time.perf_counter()
+    results["replay_reload_rows"] = len(replay.ReplayIndex(index.path))
+    results["replay_reload_s"] = time.perf_counter() - t
+    return results
+
+
+def bench_calibrate(workdir, n_users=300, seconds=20):
+    """calibrate.run over every pair of a synthetic enrolled population, split and separate-session probes."""
+    import sqlite3
+    import calibrate
+    import eeg_io
+    import preprocess
+    db = os.path.join(workdir, "calibrate.db")
+    sessions = os.path.join(workdir, "calib_sessions")
+    os.makedirs(sessions)
+    conn = sqlite3.connect(db)
+    conn.execute("CREATE TABLE employees (empid TEXT PRIMARY KEY, brainwave_path TEXT)")
+    for u in range(n_users):
+        rec = eeg_io.Recording(fresh_session(u, 0, n_samples=seconds * 128), [f"ch{i}" for i in range(8)], 128.0)
+        path = os.path.join(workdir, f"calib_{u}.npz")
+        eeg_io.write_npz(path, preprocess.preprocess(rec))
+        conn.execute("INSERT INTO employees VALUES (?, ?)", (f"U{u}", path))
+        with open(os.path.join(sessions, f"U{u}_s1.csv"), "wb") as f:
+            f.write(to_csv_bytes(fresh_session(u, 1)))
+    conn.commit()
+    conn.close()
+    results = {}
+    for label, workers in (("pool", None), ("1proc", 1)):
+        out = calibrate.run(db, workers=workers)
+        results[f"calibrate_split_{label}_s"] = out["seconds"]
+    results["calibrate_pairs"] = out["genuine_pairs"] + out["impostor_pairs"]
+    runs = {"split": out, "sessions": calibrate.run(db, sessions_dir=sessions)}
+    results["calibrate_sessions_s"] = runs["sessions"]["seconds"]
+    for mode, out in runs.items():
+        for name, r in out["matchers"].items():
+            if "skipped" in r:
+                continue
+            key = f"calibrate_{mode}_{name}"
+            results[f"{key}_eer"] = r["eer"]
+            results[f"{key}_eer_threshold"] = r["eer_threshold"]
+            results[f"{key}_threshold_at_far"] = r["threshold_at_target_far"]
+            results[f"{key}_far_at_current"] = r["far_at_current"]
+            results[f"{key}_frr_at_current"] = r["frr_at_current"]
+    return results
+
+
+# ---------- Sharding ----------
+SHARD_ADMIN_CODE = "ADMIN123"     # app.ADMIN_CODE, without importing the Dash app here
+
+
+def bench_shard(repeats, workdir, n_shards=3, n_users=30):
+    """Ring balance and movement, then enroll/verify through the router against local shard processes."""
+    import socket
+    import shard
+    keys = [f"E{100 + i}" for i in range(100000)]
+    ring = shard.HashRing([f"s{i}" for i in range(4)])
+    counts = np.unique([ring.owner(k) for k in keys], return_counts=True)[1]
+    results = {
+        "shard_ring_owner": measure(lambda: ring.owner("E12345"), repeats * 20),
+        "shard_ring_imbalance": float(counts.max() / counts.mean()),
+        "shard_moved_4_to_5": len(shard.moves(ring, shard.HashRing([f"s{i}" for i in range(5)]), keys)) / len(keys),
+    }
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        base_port = sock.getsockname()[1] + 1
+    procs, shards, token = shard.start_local(n_shards, os.path.join(workdir, "shards"), base_port)
+    try:
+        router = shard.ShardRouter(shards, token)
+        t = time.perf_counter()
+        shard.wait_ready(router)
+        results["shard_startup_s"] = time.perf_counter() - t
+        empids = [f"E{100 + u}" for u in range(n_users)]
+        enrollments = _cycle([(e, SHARD_ADMIN_CODE, to_data_url(to_csv_bytes(fresh_session(u, 0))))
+                              for u, e in enumerate(empids)])
+        results["shard_enroll_bad_admin"] = router.enroll(empids[0], "wrong", enrollments()[2])
+        results["shard_enroll"] = measure(lambda: router.enroll(*enrollments()), n_users, warmup=0)
+        genuine = _cycle([(e, to_data_url(to_csv_bytes(fresh_session(u, 1 + k))))
+                          for k in range(max(1, repeats // n_users + 1)) for u, e in enumerate(empids)])
+        decisions = []
+        results["shard_verify"] = measure(lambda: decisions.append(router.verify(*genuine())[0]), repeats)
+        results["shard_genuine_accept_rate"] = decisions.count("accept") / len(decisions)
+        impostors = [router.verify(e, to_data_url(to_csv_bytes(fresh_session(u + 500, 1))))[0]
+                     for u, e in enumerate(empids[:10])]
+        results["shard_impostor_accept_rate"] = impostors.count("accept") / len(impostors)
+        results["shard_enrolled"] = {name: h.get("enrolled") for name, h in router.health().items()}
+        # the standalone router's /verify sits behind a ratelimit gate (EMPID_BURST per employee)
+        import urllib.request
+        import urllib.error
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            router_port = sock.getsockname()[1]
+        httpd = shard.serve_router(router, router_port)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        probe = json.dumps({"empid": empids[0], "contents": genuine()[1]}).encode()
+        statuses = []
+        for _ in range(8):
+            req = urllib.request.Request(f"http://127.0.0.1:{router_port}/verify", data=probe,
+                                         headers={"Content-Type": "application/json"})
+            try:
+                with urllib.request.urlopen(req, timeout=30) as resp:
+                    statuses.append(resp.status)
+            except urllib.error.HTTPError as e:
+                statuses.append(e.code)
+        httpd.shutdown()
+        httpd.server_close()
+        results["shard_router_statuses"] = statuses
+    finally:
+        shard.stop_local(procs)
+    return results
+
+
+# ---------- Sampling profiler ----------
+def bench_profiler(workdir, seconds=2.0):
+    """Verify throughput with and without /admin/profile sampling, and what the profile contains."""
+    # the endpoint is only installed when NEUROLOCK_ADMIN_CODE is set at import
+    previous = os.environ.get("NEUROLOCK_ADMIN_CODE")
+    profile_code = os.environ["NEUROLOCK_ADMIN_CODE"] = previous or "bench-profile"
+    app_mod = _fresh_import("app")
+    if previous is None:
+        del os.environ["NEUROLOCK_ADMIN_CODE"]
+    app_mod.AUTO_RETRAIN = False
+    app_mod.REPLAY_CHECK = False      # the same probe is verified over and over
+    app_mod.start_warmup()
+    app_mod.model_ready.wait()
+    empid = app_mod.register_user("profiled", "230106", "pw", "pw").rsplit(" ", 1)[-1]
+    app_mod.save_brainwave_db(empid, app_mod.ADMIN_CODE, to_data_url(to_csv_bytes(synthetic_eeg(seed=5))))
+    probe = to_data_url(to_csv_bytes(session_of(synthetic_eeg(seed=5), seed=6)))
+    client = app_mod.server.test_client()
+
+    def verify_loop(stop, done):
+        while not stop.is_set():
+            app_mod.ai_verify_brainwave(empid, probe)
+            done[0] += 1
+
+    def run_load(during):
+        stop, done = threading.Event(), [0]
+        worker = threading.Thread(target=verify_loop, args=(stop, done))
+        t0 = time.perf_counter()
+        worker.start()
+        result = during()
+        stop.set()
+        worker.join()
+        return done[0] / (time.perf_counter() - t0), result
+
+    baseline, _ = run_load(lambda: time.sleep(seconds))
+    profiled, r = run_load(lambda: client.get(f"/admin/profile?seconds={seconds}",
+                                              headers={"X-Admin-Code": profile_code}))
+    forbidden = client.get("/admin/profile?seconds=0.1").status_code
+    rejected = [client.get(f"/admin/profile?{q}", headers={"X-Admin-Code": profile_code}).status_code
+                for q in ("seconds=nan", "seconds=inf", "seconds=-1", "seconds=0", "hz=0", "hz=-5", "hz=x")]
+    stacks = r.get_data(as_text=True).splitlines()
+    return {"profiler": {
+        "verify_per_s_idle": baseline,
+        "verify_per_s_sampling": profiled,
+        "overhead_pct": 100.0 * (1 - profiled / baseline),
+        "samples": int(r.headers.get("X-Profile-Samples", 0)),
+        "distinct_stacks": len(stacks),
+        "stacks_in_verify_brainwave": sum(int(l.rsplit(" ", 1)[1]) for l in stacks if "verify_brainwave" in l),
+        "status_without_code": forbidden,
+        "status_bad_arguments": rejected,
+    }}
+
+
+# ---------- Rate limiting ----------
+def bench_ratelimit(repeats, n_keys=100000):
+    """Per-request limiter cost and how compaction keeps state bounded under many identities."""
+    import ratelimit
+    gate = ratelimit.Admission()
+    keys = _cycle([f"10.0.{i // 256}.{i % 256}" for i in range(n_keys)])
+
+    def admit():
+        with gate.admit(None, keys()):
+            pass
+    results = {"ratelimit_admit": measure(admit, repeats * 100)}
+
+    buckets = ratelimit.TokenBuckets(rate=1000.0, burst=10)      # refills in 10 ms
+    for i in range(n_keys):
+        buckets.take(i)
+    while_filling = len(buckets.buckets)
+    time.sleep(0.02)
+    for i in range(ratelimit.COMPACT_EVERY):
+        buckets.take(-1)
+    results["ratelimit_compaction"] = {"keys": n_keys, "keys_while_filling": while_filling, "keys_after": len(buckets.buckets)}
+    return results
+
+
+# ---------- Audit log ----------
+def bench_audit(repeats, workdir, n_rows=200000, n_employees=2000):
+    """Caller-side cost of audit.record vs a commit per row, group-commit throughput and indexed queries."""
+    import audit
+    log = audit.AuditLog(os.path.join(workdir, "bench_audit.db"))
+    empids = _cycle([f"E{i}" for i in range(n_employees)])
+    results = {"audit_record": measure(lambda: log.record(empids(), "brainwave", "accept", 0.9, 12.0, "bench"),
+                                       repeats * 100)}
+
+    naive = sqlite3.connect(os.path.join(workdir, "bench_audit_naive.db"))
+    naive.execute("CREATE TABLE audit_log (ts REAL, empid TEXT, stage TEXT, decision TEXT, score REAL)")
+
+    def per_row_commit():
+        naive.execute("INSERT INTO audit_log VALUES (?, ?, 'brainwave', 'accept', 0.9)", (time.time(), empids()))
+        naive.commit()
+    results["audit_commit_per_row"] = measure(per_row_commit, repeats)
+
+    # bursts below MAX_BUFFER so nothing is dropped
+    t0 = time.perf_counter()
+    for _ in range(0, n_rows, audit.MAX_BUFFER // 2):
+        for _ in range(audit.MAX_BUFFER // 2):
+            log.record(empids(), "brainwave", "accept", 0.9, 12.0, "bench")
+        log.flush(timeout=60)
+    wall = time.perf_counter() - t0
+    results["audit_group_commit"] = {"rows": log.written, "wall_s": wall, "rows_per_s": log.written / wall,
+                                     "dropped": log.dropped}
+
+    since = time.time() - 1.0
+    results["audit_query_empid"] = measure(lambda: log.query(empid=empids()), repeats)
+    results["audit_query_time_range"] = measure(lambda: log.query(since=since, limit=100), repeats)
+    return results
+
+
+# ---------- Compare ----------
+def compare(current, previous, tolerance=1.2):
+    """Return [(name, old_p50, new_p50)] for paths whose p50 regressed beyond tolerance."""
+    regressions = []
+    for name, stats in current["results"].items():
+        old = previous.get("results", {}).get(name)
+        if not isinstance(stats, dict) or not isinstance(old, dict):
+            continue
+        if old.get("p50_ms") and stats["p50_ms"] > old["p50_ms"] * tolerance:
+            regressions.append((name, old["p50_ms"], stats["p50_ms"]))
+    return regressions
+
+
+def run(n_users, repeats, only=None):
+    workdir = tempfile.mkdtemp(prefix="neurolock-bench-")
+    cwd = os.getcwd()
+    sys.path.insert(0, REPO_DIR)
+    shutil.copy(os.path.join(REPO_DIR, MODEL_FILE), workdir)
+    results = {}
+    suites = {
+        "app": lambda: bench_app(n_users, repeats, workdir),
+        "webcam": lambda: bench_webcam(repeats, workdir),
+        "tk": lambda: bench_tk_scorers(n_users, repeats, workdir),
+        "readers": lambda: bench_readers(workdir),
+        "preprocess": lambda: bench_preprocess(repeats),
+        "scoring": lambda: bench_scoring(repeats),
+        "matching": lambda: bench_matching(repeats),
+        "export": lambda: bench_export(repeats, workdir),
+        "audit": lambda: bench_audit(repeats, workdir),
+        "ratelimit": lambda: bench_ratelimit(repeats),
+        "memory": lambda: bench_memory(workdir),
+        "replay": lambda: bench_replay(repeats, workdir),
+        "profiler": lambda: bench_profiler(workdir),
+        "calibrate": lambda: bench_calibrate(workdir),
+        "shard": lambda: bench_shard(repeats, workdir),
+        "startup": lambda: {**bench_startup(max(3, repeats // 10)), **bench_app_import(workdir)},
+    }
+    try:
+        os.chdir(workdir)
+        for name, suite in suites.items():
+            if only and name not in only:
+                continue
+            try:
+                results.update(suite())
+            except Exception as e:
+                results[f"{name}_error"] = repr(e)
+    finally:
+        os.chdir(cwd)
+        if "replay" in sys.modules:
+            sys.modules["replay"].set_index(None)      # its REPLAY_FILE is in workdir
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "meta": {
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "users": n_users,
+            "repeats": repeats,
+        },
+        "results": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NeuroLock authentication benchmarks")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--only", nargs="*", help="subset of suites: app webcam tk readers preprocess scoring matching export "
+                        "audit ratelimit memory replay profiler calibrate shard startup")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--compare", help="previous results JSON to diff against")
+    args = parser.parse_args()
+
+    report = run(args.users, args.repeats, args.only)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+
+    for name, stats in report["results"].items():
+        if isinstance(stats, dict) and "p50_ms" in stats:
+            print(f"{name:40s} p50={stats['p50_ms']:9.3f}ms p99={stats['p99_ms']:9.3f}ms")
+        else:
+            print(f"{name:40s} {stats}")
+    over = [name for name, stats in report["results"].items()
+            if isinstance(stats, dict) and stats.get("over_budget")]
+    for name in over:
+        print(f"OVER BUDGET {name}: {report['results'][name]}")
+    print("Wrote", args.out)
+    failed = [name for name in report["results"] if name.endswith("_error")]
+    for name in failed:
+        print(f"FAILED {name[:-len('_error')]}: {report['results'][name]}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f))
+        for name, old, new in regressions:
+            print(f"REGRESSION {name}: p50 {old:.3f}ms -> {new:.3f}ms")
+        if regressions:
+            sys.exit(1)
+    sys.exit(1 if failed else 0)
@@ -1,6 +1,6 @@
 // static/js/brainwave.js
 // Client logic: request challenge, capture short window of frames, compute blink_count, head_motion, focus_score,
-// then POST to /verify with base64 image and observed challenge label.
+// then POST to /verify as multipart/form-data: the JPEG as a binary "face" part plus the metric fields.
 
 let video = null;
 let canvas = null;
@@ -130,14 +130,14 @@ async function captureAndCompute(durationSec=4) {
   const focusScore = computeFocusScore(greenSeries, blinkCount, durationSec);
   // produce a representative single frame (middle)
   const repFrame = frames[Math.floor(frames.length/2)];
-  // make a small canvas toDataURL of the repFrame
+  // encode the repFrame as a JPEG Blob (binary, no base64 round trip)
   const smallCanvas = document.createElement('canvas');
   smallCanvas.width = canvas.width;
   smallCanvas.height = canvas.height;
   const scCtx = smallCanvas.getContext('2d');
   scCtx.putImageData(repFrame, 0, 0);
-  const b64 = smallCanvas.toDataURL("image/jpeg", 0.7);
-  return { b64, blinkCount, headMotion, focusScore };
+  const face = await new Promise(resolve => smallCanvas.toBlob(resolve, "image/jpeg", 0.7));
+  return { face, blinkCount, headMotion, focusScore };
 }
 
 // Main: called by UI when user requests authentication
@@ -151,20 +151,19 @@ async function performAuthentication() {
   // capture 4 seconds of data
   const startTs = Date.now() / 1000.0;
   const res = await captureAndCompute(4);
-  const payload = {
-    nonce: nonce,
-    ts: startTs,
-    face: res.b64,
-    blink_count: res.blinkCount,
-    head_motion: res.headMotion,
-    focus_score: res.focusScore,
-    challenge_observed: currentChallenge
-  };
+  const payload = new FormData();
+  payload.append("nonce", nonce);
+  payload.append("ts", startTs);
+  payload.append("blink_count", res.blinkCount);
+  payload.append("head_motion", res.headMotion);
+  payload.append("focus_score", res.focusScore);
+  payload.append("challenge_observed", currentChallenge);
+  payload.append("face", res.face, "face.jpg");
   log("Sending features: blink=" + res.blinkCount + " headMotion=" + res.headMotion.toFixed(2) + " focus=" + res.focusScore.toFixed(2));
+  // the browser sets the multipart Content-Type (with its boundary) itself
   const resp = await fetch('/verify', {
     method: 'POST',
-    headers: {'Content-Type':'application/json'},
-    body: JSON.stringify(payload)
+    body: payload
   });
   const jr = await resp.json();
   if (jr.status === "success") {
@@ -0,0 +1,416 @@
+"""
+Offline FAR/FRR calibration of the brainwave decision thresholds.
+
+    python calibrate.py --db neurolock.db --out calibration.json --workers 8
+    python calibrate.py --db neurolock.db --sessions heldout/    # heldout/<empid>[_*].csv|edf|npz...
+
+Every enrolled recording is scored against a probe from every user, its own
+user's probe giving a genuine score and everyone else's an impostor score,
+with each matcher the app uses:
+
+    corr         best-lag correlation, centred (ok.py / neurolock_app.py)
+    cosine       best-lag cosine of the first 1000 values (authenticate_brainwave.py)
+    diff         mean |difference| at the best common lag (app.py)
+    mahalanobis  band-power template distance (templates.py)
+
+A genuine probe has to be a separate session: the waveform matchers only
+search lags within +/- MAX_LAG, so a later stretch of the enrollment itself
+is never aligned with it and scores like a stranger. Probes are the first
+PROBE_SECONDS of a held-out recording per user, taken from --sessions or,
+failing that, from earlier brainwave_sessions sources that still exist on
+disk. Users without one are skipped. With no separate sessions at all, each
+recording's last PROBE_SECONDS is held out instead and only mahalanobis is
+calibrated: band powers are stable across a recording, waveforms are not.
+
+Each source file is read and preprocessed once, staged as float32 .npy,
+then packed into .npy memmaps (users x channels x samples) that workers
+share through the page cache instead of pickling. The users x users score
+matrix is never built: each pool task takes one block of BLOCK enrollments
+against every probe block. Correlations at all lags of a block are batched
+matrix products over the channels. Each task returns only fixed-bin
+histograms of its genuine and impostor scores, so memory stays flat from a
+hundred users to 10k (10^8 ordered pairs).
+
+Correlations are taken over matching.lag_limit (MAX_LAG, capped at half the
+shorter signal) in steps of LAG_STEP samples, each normalised by the energy
+of the overlapping samples at that lag (1 reproduces matching.xcorr exactly;
+larger steps trade peak accuracy for time, and cosine suffers most, so
+derive thresholds with --lag-step 1). The output JSON has, per matcher, the EER and its
+threshold, the threshold at the target FAR, the current threshold's FAR/FRR
+and a downsampled ROC.
+"""
+import os
+import glob
+import json
+import time
+import shutil
+import sqlite3
+import argparse
+import tempfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import eeg_io
+import matching
+import preprocess
+import neurolock_core
+import templates
+
+PROBE_SECONDS = 4.0
+MIN_ENROLL_SECONDS = 2.0
+MAX_ENROLL_SECONDS = 30.0
+BLOCK = 64
+MAX_LAG = matching.MAX_LAG
+LAG_STEP = 8
+COSINE_SAMPLES = neurolock_core.COSINE_SAMPLES
+TARGET_FAR = 0.001
+ROC_POINTS = 100
+
+# name -> (histogram edges, higher score accepts, threshold in use today)
+MATCHERS = {
+    "corr": (np.linspace(-1.0, 1.0, 4001), True, neurolock_core.CORR_THRESHOLD),
+    "cosine": (np.linspace(-1.0, 1.0, 4001), True, neurolock_core.COSINE_THRESHOLD),
+    "diff": (np.linspace(0.0, 4.0, 4001), False, matching.DIFF_ACCEPT),
+    "mahalanobis": (np.geomspace(1e-2, 1e4, 4001), False, templates.MAHALANOBIS_ACCEPT),
+}
+WAVEFORM = ("corr", "cosine", "diff")
+
+
+# ---------- Preparation ----------
+def _load(path):
+    """Preprocessed (samples, channels) data of a stored enrollment or probe."""
+    if path.endswith(".npz"):
+        data = eeg_io.read_eeg(path).data      # enrollments are stored preprocessed
+    else:
+        data = preprocess.load(path).data
+    data = np.asarray(data)
+    return data[:, None] if data.ndim == 1 else data
+
+
+def _stage(args):
+    """Read and preprocess one file (the only time it is read); save it as float32 .npy, return its shape."""
+    path, out, limit = args
+    try:
+        data = _load(path)[:limit]
+    except Exception as e:
+        print(f"calibrate: skipping {path}: {e}")
+        return None
+    np.save(out, data.astype(np.float32))
+    return data.shape
+
+
+def _features(args):
+    """Template of each enrollment and epoch features of each probe in rows [start, stop) (runs in a worker)."""
+    workdir, start, stop = args
+    maps = _open(workdir, "r+")
+    for row in range(start, stop):
+        enroll = np.asarray(maps["enroll"][row]).T
+        template = templates.add_session(None, templates.epoch_features(enroll))
+        maps["mean"][row] = template.mean
+        maps["chol_inv"][row] = template.chol_inv
+        maps["features"][row] = templates.epoch_features(np.asarray(maps["probe"][row]).T)
+    for m in maps.values():
+        m.flush()
+
+
+def _open(workdir, mode="r"):
+    return {name: np.load(os.path.join(workdir, f"{name}.npy"), mmap_mode=mode)
+            for name in ("enroll", "probe", "mean", "chol_inv", "features")}
+
+
+def prepare(users, workdir, pool, probe_seconds=PROBE_SECONDS):
+    """
+    Memmap the enrollment and probe of every usable user; `users` is a list of
+    (empid, enrollment path, separate-session probe path or None). Returns
+    (kept empids, True if the probes are separate sessions).
+    """
+    fs = preprocess.CANONICAL_RATE
+    probe_len = int(probe_seconds * fs)
+    min_enroll = int(MIN_ENROLL_SECONDS * fs)
+    limit = int(MAX_ENROLL_SECONDS * fs) + probe_len
+    sessions = any(probe for _, _, probe in users)
+    stage = os.path.join(workdir, "stage")
+    os.makedirs(stage)
+    jobs = [(path, os.path.join(stage, f"e{i}.npy"), limit) for i, (_, path, _) in enumerate(users)]
+    with_probe = [i for i, (_, _, probe) in enumerate(users) if probe]
+    jobs += [(users[i][2], os.path.join(stage, f"p{i}.npy"), probe_len) for i in with_probe]
+    shapes = list(pool.map(_stage, jobs, chunksize=16))
+    enroll_shapes = shapes[:len(users)]
+    probe_shapes = [None] * len(users)
+    for i, shape in zip(with_probe, shapes[len(users):]):
+        probe_shapes[i] = shape
+
+    counts = Counter(s[1] for s in enroll_shapes if s is not None)
+    if not counts:
+        raise SystemExit("calibrate: no readable enrollments")
+    channels = counts.most_common(1)[0][0]
+    if sessions:
+        keep = [i for i, s in enumerate(enroll_shapes)
+                if s is not None and s[1] >= channels and s[0] >= min_enroll
+                and probe_shapes[i] is not None and probe_shapes[i][1] >= channels and probe_shapes[i][0] >= probe_len]
+        available = [enroll_shapes[i][0] for i in keep]
+    else:
+        keep = [i for i, s in enumerate(enroll_shapes)
+                if s is not None and s[1] >= channels and s[0] >= probe_len + min_enroll]
+        available = [enroll_shapes[i][0] - probe_len for i in keep]
+    if len(keep) < 2:
+        raise SystemExit("calibrate: need at least two usable enrollments")
+    enroll_len = min(min(available), int(MAX_ENROLL_SECONDS * fs))
+
+    n_bands = len(templates.BANDS)
+    n_epochs = len(templates.epoch_features(np.zeros((probe_len, 1))))
+    layout = {"enroll": (channels, enroll_len), "probe": (channels, probe_len), "mean": (channels, n_bands),
+              "chol_inv": (channels, n_bands, n_bands), "features": (n_epochs, channels, n_bands)}
+    maps = {name: np.lib.format.open_memmap(os.path.join(workdir, f"{name}.npy"), mode="w+", dtype=np.float32,
+                                            shape=(len(keep),) + shape)
+            for name, shape in layout.items()}
+    for row, i in enumerate(keep):
+        data = np.load(os.path.join(stage, f"e{i}.npy"), mmap_mode="r")
+        if sessions:
+            maps["enroll"][row] = data[:enroll_len, :channels].T
+            maps["probe"][row] = np.load(os.path.join(stage, f"p{i}.npy"), mmap_mode="r")[:probe_len, :channels].T
+        else:
+            maps["enroll"][row] = data[:-probe_len][:enroll_len, :channels].T
+            maps["probe"][row] = data[-probe_len:, :channels].T
+    for m in maps.values():
+        m.flush()
+    del maps
+    shutil.rmtree(stage, ignore_errors=True)
+
+    chunk = max(1, len(keep) // (4 * (os.cpu_count() or 1)))
+    list(pool.map(_features, [(workdir, s, min(s + chunk, len(keep))) for s in range(0, len(keep), chunk)]))
+    return [users[i][0] for i in keep], sessions
+
+
+# ---------- Block scoring (workers) ----------
+_maps = None
+
+
+def _init(workdir):
+    global _maps
+    _maps = _open(workdir)
+
+
+def _energies(x, lags, other_len, stored):
+    """(lags, channels, n) matching.overlap_energy of a (channels, n, samples) block."""
+    cs = np.concatenate([np.zeros(x.shape[:2] + (1,), x.dtype), np.cumsum(x * x, axis=2)], axis=2)
+    start, stop = matching.overlap_bounds(lags, x.shape[2], other_len, stored)
+    return (cs[:, :, stop] - cs[:, :, start]).transpose(2, 0, 1)
+
+
+def _lag_grid(limit, step):
+    """Lags -limit..limit every `step` samples, always including 0."""
+    half = np.arange(step, limit + 1, step)
+    return np.concatenate([-half[::-1], [0], half])
+
+
+def _best_lag(a, b, lags, center):
+    """
+    Per-pair channel-mean of each channel's peak NCC, and the common lag index,
+    for a (channels, na, La) x (channels, nb, Lb) block.
+    """
+    if center:
+        a = a - a.mean(axis=2, keepdims=True)
+        b = b - b.mean(axis=2, keepdims=True)
+    energy_a = _energies(a, lags, b.shape[2], stored=True)
+    energy_b = _energies(b, lags, a.shape[2], stored=False)
+    shape = (a.shape[0], a.shape[1], b.shape[1])
+    peak = np.full(shape, -np.inf, dtype=np.float32)
+    best_mean = np.full(shape[1:], -np.inf, dtype=np.float32)
+    common = np.zeros(shape[1:], dtype=np.intp)
+    for li, k in enumerate(lags):
+        sa, sb = matching.overlap(k, a.shape[2], b.shape[2])
+        norm = np.sqrt(energy_a[li][:, :, None] * energy_b[li][:, None, :])
+        norm[norm == 0] = np.inf
+        ncc = np.matmul(a[:, :, sa], b[:, :, sb].transpose(0, 2, 1)) / norm         # (channels, na, nb)
+        np.maximum(peak, ncc, out=peak)
+        mean = ncc.mean(axis=0)
+        better = mean > best_mean
+        best_mean[better] = mean[better]
+        common[better] = li
+    return peak.mean(axis=0), common
+
+
+def _aligned_diff(a, b, lags, common):
+    """matching.aligned_diff at each pair's common lag, grouped by lag so each group is one array op."""
+    out = np.empty(common.shape, dtype=np.float32)
+    for li in np.unique(common):
+        ia, ib = np.nonzero(common == li)
+        sa, sb = matching.overlap(lags[li], a.shape[2], b.shape[2])
+        for start in range(0, len(ia), 1024):
+            pa, pb = ia[start:start + 1024], ib[start:start + 1024]
+            out[pa, pb] = np.abs(a[:, pa, sa] - b[:, pb, sb]).mean(axis=(0, 2))
+    return out
+
+
+def _mahalanobis(mean, chol_inv, features):
+    """(na, nb) templates.score of every probe's epoch features against every template."""
+    out = np.empty((len(mean), len(features)), dtype=np.float32)
+    for i in range(len(mean)):
+        z = np.einsum("cij,necj->neci", chol_inv[i], features - mean[i])
+        out[i] = (z * z).sum(axis=-1).mean(axis=(1, 2)) / features.shape[-1]
+    return out
+
+
+def _score_row(args):
+    """Histograms of one block of enrollments against every probe block."""
+    start, block, lag_step, waveform = args
+    m = _maps
+    n = len(m["enroll"])
+    stop = min(start + block, n)
+    a = np.ascontiguousarray(m["enroll"][start:stop].transpose(1, 0, 2))          # (channels, na, La)
+    mean, chol_inv = np.asarray(m["mean"][start:stop]), np.asarray(m["chol_inv"][start:stop])
+    channels = a.shape[0]
+    rows = max(1, COSINE_SAMPLES // channels)
+    lags = _lag_grid(matching.lag_limit(a.shape[2], m["probe"].shape[2], MAX_LAG), lag_step)
+    cos_lags = _lag_grid(matching.lag_limit(rows, rows, MAX_LAG), lag_step)
+    names = [name for name in MATCHERS if waveform or name not in WAVEFORM]
+    hist = {name: [np.zeros(len(MATCHERS[name][0]) - 1, np.int64), np.zeros(len(MATCHERS[name][0]) - 1, np.int64)]
+            for name in names}
+
+    for pstart in range(0, n, block):
+        pstop = min(pstart + block, n)
+        scores = {"mahalanobis": _mahalanobis(mean, chol_inv, np.asarray(m["features"][pstart:pstop]))}
+        if waveform:
+            b = np.ascontiguousarray(m["probe"][pstart:pstop].transpose(1, 0, 2))
+            corr, common = _best_lag(a, b, lags, center=True)
+            scores["corr"] = corr
+            scores["cosine"] = _best_lag(a[:, :, :rows], b[:, :, :rows], cos_lags, center=False)[0]
+            scores["diff"] = _aligned_diff(a, b, lags, common)
+        genuine = np.zeros((stop - start, pstop - pstart), dtype=bool)
+        ids = np.arange(max(start, pstart), min(stop, pstop))
+        genuine[ids - start, ids - pstart] = True
+        for name, values in scores.items():
+            edges = MATCHERS[name][0]
+            values = np.clip(np.nan_to_num(values, nan=edges[0]), edges[0], edges[-1])
+            hist[name][0] += np.histogram(values[genuine], edges)[0]
+            hist[name][1] += np.histogram(values[~genuine], edges)[0]
+    return hist
+
+
+# ---------- ROC ----------
+def roc(genuine, impostor, edges, higher_accepts, current=None, target_far=TARGET_FAR):
+    """EER, thresholds and a downsampled ROC from genuine/impostor histograms."""
+    g = np.concatenate([[0], np.cumsum(genuine)]) / max(genuine.sum(), 1)       # fraction below edge k
+    i = np.concatenate([[0], np.cumsum(impostor)]) / max(impostor.sum(), 1)
+    if higher_accepts:                      # accept score >= edges[k]
+        frr, far = g, 1.0 - i
+    else:                                   # accept score < edges[k]
+        frr, far = 1.0 - g, i
+    k = int(np.abs(far - frr).argmin())
+    ok = np.nonzero(far <= target_far)[0]
+    k_far = (ok.min() if higher_accepts else ok.max()) if len(ok) else None
+    out = {
+        "eer": float((far[k] + frr[k]) / 2),
+        "eer_threshold": float(edges[k]),
+        "target_far": target_far,
+        "threshold_at_target_far": None if k_far is None else float(edges[k_far]),
+        "frr_at_target_far": None if k_far is None else float(frr[k_far]),
+        "roc": [[float(far[j]), float(frr[j])] for j in np.unique(np.linspace(0, len(edges) - 1, ROC_POINTS).astype(int))],
+    }
+    if current is not None:
+        kc = int(np.clip(np.searchsorted(edges, current), 0, len(edges) - 1))
+        out.update(current_threshold=current, far_at_current=float(far[kc]), frr_at_current=float(frr[kc]))
+    return out
+
+
+# ---------- Driver ----------
+def enrolled_paths(db_file):
+    conn = sqlite3.connect(db_file)
+    rows = conn.execute("SELECT empid, brainwave_path FROM employees WHERE brainwave_path IS NOT NULL "
+                        "ORDER BY empid").fetchall()
+    conn.close()
+    return [(e, p) for e, p in rows if p and os.path.exists(p)]
+
+
+def session_paths(db_file, users, sessions_dir=None):
+    """{empid: separate-session recording}: <dir>/<empid>.* or <dir>/<empid>_*, else an earlier session's source."""
+    found = {}
+    if sessions_dir:
+        for empid, _ in users:
+            matches = sorted(glob.glob(os.path.join(glob.escape(sessions_dir), f"{glob.escape(empid)}.*")) +
+                             glob.glob(os.path.join(glob.escape(sessions_dir), f"{glob.escape(empid)}_*")))
+            if matches:
+                found[empid] = matches[0]
+        return found
+    conn = sqlite3.connect(db_file)
+    try:
+        rows = conn.execute("SELECT empid, source FROM brainwave_sessions WHERE source IS NOT NULL "
+                            "ORDER BY recorded_at DESC").fetchall()
+    except sqlite3.OperationalError:           # database from before brainwave_sessions
+        rows = []
+    conn.close()
+    current = dict(users)
+    for empid, source in rows:
+        if empid in current and empid not in found and os.path.exists(source) \
+                and os.path.abspath(source) != os.path.abspath(current[empid]):
+            found[empid] = source
+    return found
+
+
+def run(db_file, workers=None, block=BLOCK, lag_step=LAG_STEP, target_far=TARGET_FAR, workdir=None,
+        sessions_dir=None, probe_seconds=PROBE_SECONDS):
+    """Calibrate every matcher over all enrolled pairs; returns the result dict."""
+    t0 = time.time()
+    users = enrolled_paths(db_file)
+    probes = session_paths(db_file, users, sessions_dir)
+    if probes:
+        users = [(e, p, probes.get(e)) for e, p in users]
+    else:
+        users = [(e, p, None) for e, p in users]
+    own_workdir = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix="neurolock-calibrate-")
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            kept, sessions = prepare(users, workdir, pool, probe_seconds)
+        n = len(kept)
+        hist = {}
+        tasks = [(start, block, lag_step, sessions) for start in range(0, n, block)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init, initargs=(workdir,)) as pool:
+            for part in pool.map(_score_row, tasks):
+                for name, (gen, imp) in part.items():
+                    old = hist.setdefault(name, [0, 0])
+                    hist[name] = [old[0] + gen, old[1] + imp]
+    finally:
+        if own_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    result = {"users": n, "skipped": len(users) - n, "genuine_pairs": n, "impostor_pairs": n * (n - 1),
+              "genuine_probes": "separate sessions" if sessions else "held-out end of the enrollment",
+              "probe_seconds": probe_seconds, "lag_step": lag_step, "matchers": {}}
+    for name, (edges, higher, current) in MATCHERS.items():
+        if name in hist:
+            result["matchers"][name] = roc(hist[name][0], hist[name][1], edges, higher, current, target_far)
+        else:
+            result["matchers"][name] = {"skipped": "waveform matchers need separate-session probes (--sessions)"}
+    result["seconds"] = time.time() - t0
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calibrate NeuroLock decision thresholds (FAR/FRR, EER)")
+    parser.add_argument("--db", default="neurolock.db")
+    parser.add_argument("--out", default="calibration.json")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--block", type=int, default=BLOCK)
+    parser.add_argument("--lag-step", type=int, default=LAG_STEP)
+    parser.add_argument("--far", type=float, default=TARGET_FAR, help="target false accept rate")
+    parser.add_argument("--sessions", help="directory of held-out recordings named <empid>.* or <empid>_*")
+    parser.add_argument("--probe-seconds", type=float, default=PROBE_SECONDS)
+    args = parser.parse_args()
+
+    result = run(args.db, args.workers, args.block, args.lag_step, args.far, sessions_dir=args.sessions,
+                 probe_seconds=args.probe_seconds)
+    with open(args.out, "w") as f:
+        json.dump(result, f, indent=1)
+    print(f"calibrate: {result['users']} users, {result['impostor_pairs']} impostor pairs "
+          f"in {result['seconds']:.1f}s -> {args.out}")
+    for name, r in result["matchers"].items():
+        if "skipped" in r:
+            print(f"  {name:12s} skipped: {r['skipped']}")
+            continue
+        print(f"  {name:12s} EER {r['eer']:.4f} at {r['eer_threshold']:.4g}; "
+              f"FAR {r['target_far']:g} at {r['threshold_at_target_far']}; "
+              f"current {r['current_threshold']:.4g}: FAR {r['far_at_current']:.4f} FRR {r['frr_at_current']:.4f}")
@@ -0,0 +1,258 @@
+"""
+EEG readers shared by the Dash app, the Tk clients and process_brainwave.py.
+
+Every reader returns a Recording: `data` is a (samples, channels) float array,
+`channels` the channel names and `sample_rate` in Hz. Supported formats:
+
+    csv        text, one column per channel (pandas, imported lazily)
+    edf / bdf  European Data Format, decoded straight from the binary records
+    npy / npz  NumPy arrays (.npz may carry `channels` and `sample_rate`)
+    raw        headerless float32 buffers; needs `n_channels`
+
+A source is either a path or the raw bytes of a file (e.g. a decoded upload).
+Formats are picked from the file extension, else by sniffing the first bytes.
+Further formats can be added with register_reader().
+"""
+import io
+import os
+from collections import namedtuple
+
+import numpy as np
+
+DEFAULT_SAMPLE_RATE = 128
+
+Recording = namedtuple("Recording", ["data", "channels", "sample_rate"])
+
+# for tkinter.filedialog
+FILE_TYPES = [("EEG Files", "*.csv *.edf *.bdf *.npy *.npz"), ("CSV Files", "*.csv"), ("All Files", "*.*")]
+
+READERS = {}
+EXTENSIONS = {}
+MAGIC = []
+
+
+def register_reader(fmt, reader, extensions=(), magic=None):
+    """Register reader(source, **kwargs) -> Recording for `fmt`, its extensions and optional magic prefix."""
+    READERS[fmt] = reader
+    for ext in extensions:
+        EXTENSIONS[ext.lower()] = fmt
+    if magic is not None:
+        MAGIC.append((magic, fmt))
+
+
+def _default_channels(n):
+    return [f"ch{i}" for i in range(n)]
+
+
+def _is_path(source):
+    return isinstance(source, (str, os.PathLike))
+
+
+def _head(source, n=16):
+    if _is_path(source):
+        with open(source, "rb") as f:
+            return f.read(n)
+    return bytes(source[:n])
+
+
+def detect_format(source, name=None):
+    name = name or (os.fspath(source) if _is_path(source) else None)
+    if name:
+        ext = os.path.splitext(name)[1].lower().lstrip(".")
+        if ext in EXTENSIONS:
+            return EXTENSIONS[ext]
+    head = _head(source)
+    for magic, fmt in MAGIC:
+        if head.startswith(magic):
+            return fmt
+    return "csv"
+
+
+def read_eeg(source, fmt=None, name=None, **kwargs):
+    """Read `source` (path or bytes) into a Recording."""
+    fmt = fmt or detect_format(source, name)
+    if fmt not in READERS:
+        raise ValueError(f"Unsupported EEG format: {fmt}")
+    return READERS[fmt](source, **kwargs)
+
+
+# ---------- CSV ----------
+def read_csv(source, sample_rate=DEFAULT_SAMPLE_RATE):
+    import pandas as pd
+    df = pd.read_csv(source if _is_path(source) else io.BytesIO(source))
+    df = df.select_dtypes(include=[np.number])
+    return Recording(df.to_numpy(dtype=np.float64), [str(c) for c in df.columns], sample_rate)
+
+
+# ---------- EDF / BDF ----------
+def _fields(raw, offset, count, width):
+    block = raw[offset:offset + count * width]
+    return [block[i * width:(i + 1) * width].decode("ascii", "replace").strip() for i in range(count)], \
+        offset + count * width
+
+
+def read_edf(source, keep_annotations=False):
+    """Decode EDF (16-bit) or BDF (24-bit) data records into physical units with NumPy."""
+    if _is_path(source):
+        with open(source, "rb") as f:
+            fixed = f.read(256)
+            ns = int(fixed[252:256])
+            header = fixed + f.read(ns * 256)
+    else:
+        fixed = bytes(source[:256])
+        ns = int(fixed[252:256])
+        header = bytes(source[:256 + ns * 256])
+
+    bdf = fixed[:1] == b"\xff"
+    sample_bytes = 3 if bdf else 2
+    header_bytes = int(fixed[184:192])
+    n_records = int(fixed[236:244])
+    record_duration = float(fixed[244:252])
+
+    offset = 256
+    labels, offset = _fields(header, offset, ns, 16)
+    _, offset = _fields(header, offset, ns, 80)     # transducer
+    _, offset = _fields(header, offset, ns, 8)      # physical dimension
+    phys_min, offset = _fields(header, offset, ns, 8)
+    phys_max, offset = _fields(header, offset, ns, 8)
+    dig_min, offset = _fields(header, offset, ns, 8)
+    dig_max, offset = _fields(header, offset, ns, 8)
+    _, offset = _fields(header, offset, ns, 80)     # prefiltering
+    n_samples, offset = _fields(header, offset, ns, 8)
+
+    spr = np.array([int(n) for n in n_samples])
+    record_size = int(spr.sum()) * sample_bytes
+
+    if _is_path(source):
+        buf = np.fromfile(source, dtype=np.uint8, offset=header_bytes)
+    else:
+        buf = np.frombuffer(source, dtype=np.uint8, offset=header_bytes)
+    if n_records < 0:
+        n_records = buf.size // record_size
+    buf = buf[:n_records * record_size].reshape(n_records, record_size)
+
+    if bdf:
+        b = buf.reshape(n_records, -1, 3).astype(np.int32)
+        digital = b[..., 0] | (b[..., 1] << 8) | (b[..., 2] << 16)
+        digital = np.where(digital >= 1 << 23, digital - (1 << 24), digital)
+    else:
+        digital = buf.view("<i2")
+
+    keep = [i for i, label in enumerate(labels)
+            if keep_annotations or "annotations" not in label.lower()]
+    # channels sharing the most common rate are returned together
+    rate = np.bincount(spr[keep]).argmax()
+    keep = [i for i in keep if spr[i] == rate]
+
+    starts = np.concatenate([[0], np.cumsum(spr)[:-1]])
+    pmin = np.array([float(phys_min[i]) for i in keep])
+    pmax = np.array([float(phys_max[i]) for i in keep])
+    dmin = np.array([float(dig_min[i]) for i in keep])
+    dmax = np.array([float(dig_max[i]) for i in keep])
+    gain = (pmax - pmin) / np.where(dmax - dmin == 0, 1, dmax - dmin)
+
+    if keep == list(range(ns)):
+        block = digital.reshape(n_records, ns, rate)
+    else:
+        idx = starts[keep][:, None] + np.arange(rate)[None, :]
+        block = digital[:, idx]
+    data = block.transpose(0, 2, 1).reshape(-1, len(keep)).astype(np.float64)
+    data = (data - dmin) * gain + pmin
+
+    sample_rate = rate / record_duration if record_duration > 0 else DEFAULT_SAMPLE_RATE
+    return Recording(data, [labels[i] for i in keep], float(sample_rate))
+
+
+def _fit8(value):
+    """Format a float into the 8 ASCII characters EDF allows per header number."""
+    for precision in range(8, 0, -1):
+        text = f"{value:.{precision}g}"
+        if len(text) <= 8:
+            return text
+    return f"{value:.0e}"
+
+
+def write_edf(path, recording, bdf=False, record_seconds=1):
+    """Write a Recording as EDF (or BDF); used by the benchmark and for exporting enrollments."""
+    data = np.asarray(recording.data, dtype=np.float64)
+    n, ns = data.shape
+    fs = int(round(recording.sample_rate))
+    spr = fs * record_seconds
+    n_records = int(np.ceil(n / spr))
+    padded = np.zeros((n_records * spr, ns))
+    padded[:n] = data
+
+    dmax = (1 << 23) - 1 if bdf else 32767
+    dmin = -dmax - 1
+    lo = padded.min(axis=0)
+    hi = padded.max(axis=0)
+    margin = np.maximum((hi - lo) * 0.01, 1e-6)
+    pmin_s = [_fit8(v) for v in lo - margin]
+    pmax_s = [_fit8(v) for v in hi + margin]
+    pmin = np.array([float(v) for v in pmin_s])
+    pmax = np.array([float(v) for v in pmax_s])
+    digital = np.round((padded - pmin) / (pmax - pmin) * (dmax - dmin) + dmin)
+    digital = np.clip(digital, dmin, dmax).astype(np.int32)
+
+    def field(values, width):
+        return "".join(str(v)[:width].ljust(width) for v in values).encode("ascii")
+
+    header_bytes = 256 + ns * 256
+    fixed = (b"\xffBIOSEMI" if bdf else field(["0"], 8)) + field(["X"], 80) + field(["X"], 80) + \
+        field(["01.01.00"], 8) + field(["00.00.00"], 8) + field([header_bytes], 8) + \
+        field(["24BIT" if bdf else ""], 44) + field([n_records], 8) + field([record_seconds], 8) + field([ns], 4)
+    per_signal = (field(recording.channels, 16) + field([""] * ns, 80) + field(["uV"] * ns, 8) +
+                  field(pmin_s, 8) + field(pmax_s, 8) +
+                  field([dmin] * ns, 8) + field([dmax] * ns, 8) + field([""] * ns, 80) +
+                  field([spr] * ns, 8) + field([""] * ns, 32))
+
+    records = digital.reshape(n_records, spr, ns).transpose(0, 2, 1)
+    if bdf:
+        u = np.ascontiguousarray(records, dtype="<i4").view(np.uint8).reshape(*records.shape, 4)[..., :3]
+        body = np.ascontiguousarray(u).tobytes()
+    else:
+        body = records.astype("<i2").tobytes()
+    with open(path, "wb") as f:
+        f.write(fixed + per_signal + body)
+
+
+# ---------- NumPy ----------
+def read_npy(source, sample_rate=DEFAULT_SAMPLE_RATE):
+    data = np.load(source if _is_path(source) else io.BytesIO(source), mmap_mode="r" if _is_path(source) else None)
+    data = data.reshape(len(data), -1) if data.ndim != 2 else data
+    return Recording(data, _default_channels(data.shape[1]), sample_rate)
+
+
+def read_npz(source):
+    with np.load(source if _is_path(source) else io.BytesIO(source)) as z:
+        key = "data" if "data" in z.files else z.files[0]
+        data = z[key]
+        data = data.reshape(len(data), -1) if data.ndim != 2 else data
+        channels = [str(c) for c in z["channels"]] if "channels" in z.files else _default_channels(data.shape[1])
+        sample_rate = float(z["sample_rate"]) if "sample_rate" in z.files else DEFAULT_SAMPLE_RATE
+    return Recording(data, channels, sample_rate)
+
+
+def write_npz(path, recording):
+    np.savez(path, data=np.asarray(recording.data), channels=np.asarray(recording.channels),
+             sample_rate=recording.sample_rate)
+
+
+# ---------- Raw float32 ----------
+def read_raw(source, n_channels=None, sample_rate=DEFAULT_SAMPLE_RATE, dtype=np.float32):
+    if not n_channels:
+        raise ValueError("Raw EEG buffers need n_channels")
+    if _is_path(source):
+        data = np.fromfile(source, dtype=dtype)
+    else:
+        data = np.frombuffer(source, dtype=dtype)
+    data = data[:data.size - data.size % n_channels].reshape(-1, n_channels)
+    return Recording(data, _default_channels(n_channels), sample_rate)
+
+
+register_reader("csv", read_csv, extensions=("csv", "txt"))
+register_reader("edf", read_edf, extensions=("edf", "bdf"), magic=b"0       ")
+register_reader("bdf", read_edf, magic=b"\xffBIOSEMI")
+register_reader("npy", read_npy, extensions=("npy",), magic=b"\x93NUMPY")
+register_reader("npz", read_npz, extensions=("npz",), magic=b"PK\x03\x04")
+register_reader("raw", read_raw, extensions=("f32", "raw"))
@@ -0,0 +1,115 @@
+"""
+Shift-invariant template matching.
+
+The old matchers compared samples at fixed indices, so a probe that started
+half a second late scored like a stranger. Here every channel of the stored
+template is cross-correlated with the probe via the FFT (O(n log n) for all
+channels at once), normalised by the energy of the samples that overlap at
+each lag, and the best lag within +/- max_lag samples is taken.
+"""
+import numpy as np
+
+import preprocess
+
+MAX_LAG_SECONDS = 1.0
+MAX_LAG = int(MAX_LAG_SECONDS * preprocess.CANONICAL_RATE)
+DIFF_ACCEPT = 0.95           # mean |difference| at the aligned lag (app.py legacy rule, see calibrate.py)
+
+
+def _as_2d(x):
+    x = np.asarray(x, dtype=np.float64)
+    return x[:, None] if x.ndim == 1 else x
+
+
+def reshape_like(flat, n_channels):
+    """(samples, channels) view of a flattened row-major recording; 1 column if it does not divide."""
+    flat = np.asarray(flat)
+    if n_channels > 1 and flat.size % n_channels == 0:
+        return flat.reshape(-1, n_channels)
+    return flat.reshape(-1, 1)
+
+
+def lag_limit(len_a, len_b, max_lag=MAX_LAG):
+    """Largest usable lag: every overlap keeps at least half of the shorter input."""
+    return int(max(0, min(max_lag, min(len_a, len_b) // 2)))
+
+
+def overlap(k, len_a, len_b):
+    """Slices pairing stored[i + k] with probe[i] at lag k."""
+    return slice(max(k, 0), min(len_a, len_b + k)), slice(max(-k, 0), min(len_b, len_a - k))
+
+
+def overlap_bounds(lags, n, other_len, stored=True):
+    """(start, stop) arrays of the stored (or probe) side of overlap() for every lag."""
+    lags = np.asarray(lags)
+    if stored:
+        start, stop = np.maximum(lags, 0), np.minimum(n, other_len + lags)
+    else:
+        start, stop = np.maximum(-lags, 0), np.minimum(n, other_len - lags)
+    return start, np.maximum(stop, start)
+
+
+def overlap_energy(x, lags, other_len, stored=True):
+    """(lags, channels) sum of squares of `x` over its overlap at each lag, from one cumulative sum."""
+    cs = np.concatenate([np.zeros((1,) + x.shape[1:]), np.cumsum(x * x, axis=0)], axis=0)
+    start, stop = overlap_bounds(lags, len(x), other_len, stored)
+    return cs[stop] - cs[start]
+
+
+def xcorr(stored, probe, max_lag=MAX_LAG, center=True):
+    """
+    Normalised cross-correlation of every channel for lags -max_lag..max_lag.
+
+    Returns (ncc, lags): ncc has shape (2*max_lag+1, channels). A positive lag k
+    means probe[i] lines up with stored[i + k], i.e. the probe started k samples late.
+    Each lag is normalised by the energies of the two overlapping stretches, so
+    scores do not depend on how much longer the stored recording is, and lags
+    are capped by lag_limit.
+    """
+    a = _as_2d(stored)
+    b = _as_2d(probe)
+    ch = min(a.shape[1], b.shape[1])
+    a, b = a[:, :ch], b[:, :ch]
+    if center:
+        a = a - a.mean(axis=0)
+        b = b - b.mean(axis=0)
+    max_lag = lag_limit(len(a), len(b), max_lag)
+
+    n = len(a) + len(b) - 1
+    nfft = 1 << (n - 1).bit_length()
+    spec = np.fft.rfft(a, nfft, axis=0) * np.conj(np.fft.rfft(b, nfft, axis=0))
+    cc = np.fft.irfft(spec, nfft, axis=0)
+    window = np.concatenate([cc[nfft - max_lag:], cc[:max_lag + 1]], axis=0) if max_lag else cc[:1]
+
+    lags = np.arange(-max_lag, max_lag + 1)
+    norm = np.sqrt(overlap_energy(a, lags, len(b)) * overlap_energy(b, lags, len(a), stored=False))
+    norm[norm == 0] = np.inf
+    return window / norm, lags
+
+
+def xcorr_similarity(stored, probe, max_lag=MAX_LAG, center=True):
+    """
+    Shift-invariant similarity in [-1, 1].
+
+    Returns (score, channel_lags, common_lag): score is the mean over channels of
+    each channel's peak correlation, channel_lags the per-channel best lag and
+    common_lag the single lag that maximises the channel-averaged correlation.
+    """
+    ncc, lags = xcorr(stored, probe, max_lag, center)
+    best = ncc.argmax(axis=0)
+    peaks = ncc[best, np.arange(ncc.shape[1])]
+    common_lag = int(lags[ncc.mean(axis=1).argmax()])
+    return float(peaks.mean()), lags[best], common_lag
+
+
+def aligned_diff(stored, probe, lag):
+    """Mean absolute difference after shifting the probe by `lag` samples (see xcorr)."""
+    a = _as_2d(stored)
+    b = _as_2d(probe)
+    if lag > 0:
+        a = a[lag:]
+    elif lag < 0:
+        b = b[-lag:]
+    rows = min(len(a), len(b))
+    cols = min(a.shape[1], b.shape[1])
+    return float(np.mean(np.abs(a[:rows, :cols] - b[:rows, :cols])))
@@ -0,0 +1,176 @@
+"""
+Opt-in memory accounting per Flask route and per Dash callback.
+
+Off unless NEUROLOCK_MEMPROF is set, in which case install() hooks the Flask
+app (Dash: app.server) and every request is attributed to its route, or for
+/_dash-update-component to the callback function that served it:
+
+    NEUROLOCK_MEMPROF=tracemalloc python app.py   # peak Python allocation per request
+    NEUROLOCK_MEMPROF=rss python webcam.py        # RSS delta per request (cheap, sampling)
+
+tracemalloc mode also diffs a snapshot around every TOP_EVERY-th request of
+each path and keeps the lines whose allocations the request left behind (leak
+candidates). Snapshot cost grows with the number of live traced blocks, so
+tracing should start after the heavy imports: app.py calls start() at the end
+of its warm-up instead of tracing from install(). Totals, the top lines
+and each path's budget (MEMORY_BUDGETS_KB, or NEUROLOCK_MEMPROF_BUDGET_KB for
+all of them) are served as JSON on /debug/memory, to local clients only.
+
+tracemalloc's peak is process-wide, so with several requests in flight a
+path's peak is an upper bound; run a single worker for exact numbers.
+"""
+import os
+import time
+import threading
+
+MODE = os.environ.get("NEUROLOCK_MEMPROF", "").strip().lower()
+DEFAULT_BUDGET_KB = float(os.environ.get("NEUROLOCK_MEMPROF_BUDGET_KB", 0)) or None
+MEMORY_BUDGETS_KB = {}       # path name -> budget; e.g. {"update_graph": 64 * 1024}
+TOP_EVERY = 50
+TOP_LINES = 10
+TRACE_FRAMES = 1
+LOCAL_ADDRS = ("127.0.0.1", "::1")
+
+_stats = {}
+_lock = threading.Lock()
+
+
+# ---------- Measurements ----------
+def rss_kb():
+    """Current resident set size in KiB (Linux /proc; falls back to the peak from getrusage)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024.0
+    except (OSError, ValueError, IndexError):
+        import resource
+        return float(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def _path_name(request, dash_app):
+    if dash_app is not None and request.path.endswith("/_dash-update-component"):
+        output = (request.get_json(silent=True) or {}).get("output", "")
+        callback = dash_app.callback_map.get(output, {}).get("callback")
+        return getattr(callback, "__name__", None) or output
+    return request.url_rule.endpoint if request.url_rule else request.path
+
+
+def _entry(name):
+    entry = _stats.get(name)
+    if entry is None:
+        entry = _stats[name] = {"count": 0, "peak_kb_total": 0.0, "peak_kb_max": 0.0,
+                                "rss_kb_total": 0.0, "rss_kb_max": 0.0, "seconds_total": 0.0,
+                                "top_lines": []}
+    return entry
+
+
+IGNORE_FILES = ("tracemalloc.py", "<frozen importlib._bootstrap>", "<frozen importlib._bootstrap_external>")
+
+
+def _top_lines(before, after):
+    # filtering the grouped diff is far cheaper than Snapshot.filter_traces on every trace
+    diff = (d for d in after.compare_to(before, "lineno")
+            if d.size_diff > 0 and not d.traceback[0].filename.endswith(IGNORE_FILES))
+    return [{"line": str(d.traceback[0]), "size_kb": d.size_diff / 1024.0, "count": d.count_diff}
+            for d, _ in zip(diff, range(TOP_LINES))]
+
+
+def start():
+    """Start tracemalloc (tracemalloc mode only); requests before this get RSS numbers only."""
+    if MODE == "tracemalloc":
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACE_FRAMES)
+
+
+def _tracing():
+    import tracemalloc
+    return MODE == "tracemalloc" and tracemalloc.is_tracing()
+
+
+# ---------- Flask hooks ----------
+def install(server, dash_app=None, start_tracing=True):
+    """Hook `server` (a Flask app) if NEUROLOCK_MEMPROF is set; returns True if enabled."""
+    if MODE not in ("tracemalloc", "rss"):
+        return False
+    import tracemalloc
+    from flask import request, g, jsonify, abort
+    if start_tracing:
+        start()
+
+    @server.before_request
+    def _memprof_start():
+        if request.endpoint == "memory_stats":
+            return
+        name = _path_name(request, dash_app)
+        g.memprof = {"name": name, "t0": time.perf_counter(), "rss": rss_kb(), "snapshot": None}
+        if _tracing():
+            g.memprof["base"] = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            with _lock:
+                count = _entry(name)["count"]
+            if count % TOP_EVERY == 0:
+                g.memprof["snapshot"] = tracemalloc.take_snapshot()
+
+    @server.teardown_request
+    def _memprof_stop(exc=None):
+        m = g.pop("memprof", None)
+        if m is None:
+            return
+        rss_delta = max(rss_kb() - m["rss"], 0.0)
+        peak = 0.0
+        top = None
+        if "base" in m and _tracing():
+            peak = max(tracemalloc.get_traced_memory()[1] - m["base"], 0) / 1024.0
+            if m["snapshot"] is not None:
+                top = _top_lines(m["snapshot"], tracemalloc.take_snapshot())
+        with _lock:
+            entry = _entry(m["name"])
+            entry["count"] += 1
+            entry["peak_kb_total"] += peak
+            entry["peak_kb_max"] = max(entry["peak_kb_max"], peak)
+            entry["rss_kb_total"] += rss_delta
+            entry["rss_kb_max"] = max(entry["rss_kb_max"], rss_delta)
+            entry["seconds_total"] += time.perf_counter() - m["t0"]
+            if top:
+                entry["top_lines"] = top
+
+    @server.route("/debug/memory")
+    def memory_stats():
+        if request.remote_addr not in LOCAL_ADDRS:
+            abort(403)
+        return jsonify(stats())
+
+    print(f"memprof: {MODE} accounting enabled (/debug/memory)")
+    return True
+
+
+# ---------- Report ----------
+def stats():
+    """Per-path totals, means, budgets and top allocating lines."""
+    out = {"mode": MODE or "off", "rss_kb": rss_kb(), "paths": {}}
+    if _tracing():
+        import tracemalloc
+        current, peak = tracemalloc.get_traced_memory()
+        out.update(traced_kb=current / 1024.0, traced_peak_kb=peak / 1024.0)
+    with _lock:
+        for name, e in _stats.items():
+            n = max(e["count"], 1)
+            budget = MEMORY_BUDGETS_KB.get(name, DEFAULT_BUDGET_KB)
+            worst = e["peak_kb_max"] if MODE == "tracemalloc" else e["rss_kb_max"]
+            out["paths"][name] = {
+                "count": e["count"],
+                "peak_kb_mean": e["peak_kb_total"] / n,
+                "peak_kb_max": e["peak_kb_max"],
+                "rss_kb_delta_mean": e["rss_kb_total"] / n,
+                "rss_kb_delta_max": e["rss_kb_max"],
+                "ms_mean": e["seconds_total"] * 1000.0 / n,
+                "budget_kb": budget,
+                "over_budget": budget is not None and worst > budget,
+                "top_lines": list(e["top_lines"]),
+            }
+    return out
+
+
+def reset():
+    with _lock:
+        _stats.clear()
@@ -0,0 +1,310 @@
+"""
+NeuroLock core: MySQL storage and brainwave scoring shared by the Tkinter
+clients (ok.py, neurolock_app.py, authenticate_brainwave.py).
+
+Nothing here touches the database or builds a window at import time, and the
+heavy dependencies (pandas, scipy, bcrypt, mysql.connector) are imported
+inside the functions that use them, so a headless verification worker only
+pays for what it actually runs:
+
+    python neurolock_core.py verify E100 secret probe.csv
+"""
+import sys
+from collections import namedtuple
+
+import numpy as np
+
+import eeg_io
+import preprocess
+import matching
+import templates
+
+# ---------- DATABASE CONFIG ----------
+DB_CONFIG = {
+    "host": "localhost",
+    "user": "root",
+    "password": "2006",
+    "database": "neurolock"
+}
+
+# operating points for preprocessed input at FAR ~1e-3 (python calibrate.py)
+CORR_THRESHOLD = 0.30      # ok.py / neurolock_app.py
+COSINE_THRESHOLD = 0.55    # authenticate_brainwave.py
+COSINE_SAMPLES = 1000
+
+# neuro_users.brainwave_version: rows from before preprocessing (NULL) hold the
+# raw flattened samples at the device rate and are preprocessed on read
+BLOB_RAW = None
+BLOB_PREPROCESSED = 1
+LEGACY_RATE = eeg_io.DEFAULT_SAMPLE_RATE   # what the CSV reader assumed before rates were stored
+
+AuthResult = namedtuple("AuthResult", ["ok", "title", "message"])
+
+_connection_factory = None
+_blob_columns_ready = False
+
+
+def set_connection_factory(factory):
+    """Use `factory()` instead of mysql.connector.connect (e.g. a SQLite stand-in)."""
+    global _connection_factory
+    _connection_factory = factory
+
+
+def connect():
+    if _connection_factory is not None:
+        return _connection_factory()
+    import mysql.connector
+    return mysql.connector.connect(**DB_CONFIG)
+
+
+# ---------- DATABASE SETUP ----------
+def create_table_if_not_exists():
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS neuro_users (
+            emp_id VARCHAR(20) PRIMARY KEY,
+            name VARCHAR(100),
+            password_hash VARCHAR(255),
+            brainwave LONGBLOB,
+            brainwave_version INT,
+            brainwave_rate DOUBLE
+        );
+    """)
+    _add_blob_columns(cursor)
+    # enrollment sessions and the merged Mahalanobis template (see templates.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS brainwave_sessions (
+            id INTEGER PRIMARY KEY AUTO_INCREMENT,
+            empid VARCHAR(20) NOT NULL,
+            recorded_at DOUBLE NOT NULL,
+            n_epochs INT,
+            source VARCHAR(255),
+            INDEX idx_sessions_empid (empid, recorded_at)
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS brainwave_templates (
+            empid VARCHAR(20) PRIMARY KEY,
+            n_sessions INT NOT NULL,
+            template LONGBLOB NOT NULL,
+            updated_at DOUBLE
+        );
+    """)
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def _add_blob_columns(cursor):
+    """
+    One-time migration of pre-versioning tables; their rows keep NULL (= BLOB_RAW).
+    Run by create_table_if_not_exists and, once per process, before the first
+    read or write of the columns, since not every entry point creates the table.
+    """
+    global _blob_columns_ready
+    if _blob_columns_ready:
+        return
+    for column, ddl in (("brainwave_version", "INT"), ("brainwave_rate", "DOUBLE")):
+        try:
+            cursor.execute(f"SELECT {column} FROM neuro_users WHERE 1 = 0")
+            cursor.fetchall()
+        except Exception:
+            cursor.execute(f"ALTER TABLE neuro_users ADD COLUMN {column} {ddl}")
+    _blob_columns_ready = True
+
+
+def get_user_from_db(emp_id):
+    """(emp_id, password_hash, brainwave, brainwave_version, brainwave_rate) or None."""
+    conn = connect()
+    cursor = conn.cursor()
+    _add_blob_columns(cursor)
+    cursor.execute("SELECT emp_id, password_hash, brainwave, brainwave_version, brainwave_rate "
+                   "FROM neuro_users WHERE emp_id = %s", (emp_id,))
+    result = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    return result
+
+
+def get_template_from_db(emp_id):
+    conn = connect()
+    cursor = conn.cursor()
+    template = templates.fetch(cursor, emp_id, ph="%s")
+    cursor.close()
+    conn.close()
+    return template
+
+
+# ---------- HELPERS ----------
+def load_recording(path):
+    """Preprocessed (samples, channels) float64 array of an EEG file in any eeg_io format."""
+    return np.asarray(preprocess.load(path).data, dtype=np.float64)
+
+
+def load_brainwave(path):
+    """Preprocessed, flattened float64 samples (the neuro_users.brainwave blob layout)."""
+    return load_recording(path).flatten()
+
+
+def stored_brainwave(blob, n_channels, version=BLOB_RAW, rate=None):
+    """
+    A neuro_users.brainwave blob as a (samples, n_channels) array on the probe's
+    scale: legacy raw blobs go through the same preprocess() as the probe, at
+    their stored rate (LEGACY_RATE if none was recorded).
+    """
+    stored = matching.reshape_like(np.frombuffer(blob, dtype=np.float64), n_channels)
+    if version == BLOB_PREPROCESSED:
+        return stored
+    recording = eeg_io.Recording(stored, [f"ch{i}" for i in range(stored.shape[1])], float(rate or LEGACY_RATE))
+    return np.asarray(preprocess.preprocess(recording).data, dtype=np.float64)
+
+
+def hash_password(password):
+    import bcrypt
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
+
+def check_password(password, password_hash):
+    import bcrypt
+    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+
+
+def correlation_score(test, stored):
+    """Best-lag Pearson correlation per channel (FFT cross-correlation), averaged over channels."""
+    stored = matching.reshape_like(stored, test.shape[1])
+    return matching.xcorr_similarity(stored, test, center=True)[0]
+
+
+def cosine_score(uploaded, stored, limit=COSINE_SAMPLES):
+    """Best-lag cosine similarity over the first `limit` flattened values."""
+    rows = max(1, limit // uploaded.shape[1])
+    stored = matching.reshape_like(stored, uploaded.shape[1])
+    return matching.xcorr_similarity(stored[:rows], uploaded[:rows], center=False)[0]
+
+
+# ---------- REGISTER USER ----------
+def register_user(emp_id, name, password, csv_path, cancel=None):
+    """
+    Register `emp_id`, or add another enrollment session if it exists and the
+    password matches. `cancel` (a tk_async.CancelToken) can stop it up to the commit.
+    """
+    if not emp_id or not name or not password or not csv_path:
+        return AuthResult(False, "Error", "All fields are required!")
+    try:
+        recording = load_recording(csv_path)
+        brainwave_binary = recording.flatten().tobytes()
+
+        conn = connect()
+        cursor = conn.cursor()
+        _add_blob_columns(cursor)
+        cursor.execute("SELECT password_hash FROM neuro_users WHERE emp_id = %s", (emp_id,))
+        existing = cursor.fetchone()
+        if existing and not check_password(password, existing[0]):
+            cursor.close()
+            conn.close()
+            return AuthResult(False, "Error", f"Employee ID {emp_id} is already registered.")
+        if existing:
+            # the stored blob is the latest session (used by the correlation fallbacks)
+            cursor.execute("UPDATE neuro_users SET brainwave = %s, brainwave_version = %s, brainwave_rate = %s "
+                           "WHERE emp_id = %s",
+                           (brainwave_binary, BLOB_PREPROCESSED, preprocess.CANONICAL_RATE, emp_id))
+        else:
+            cursor.execute("""
+                INSERT INTO neuro_users (emp_id, name, password_hash, brainwave, brainwave_version, brainwave_rate)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, (emp_id, name, hash_password(password), brainwave_binary,
+                  BLOB_PREPROCESSED, preprocess.CANONICAL_RATE))
+        template = templates.enroll(cursor, emp_id, recording, csv_path, ph="%s")
+        if cancel is not None and not cancel.commit_allowed():
+            conn.rollback()
+            cursor.close()
+            conn.close()
+            return AuthResult(False, "Cancelled", "Registration cancelled, nothing was saved.")
+        conn.commit()
+        cursor.close()
+        conn.close()
+    except Exception as e:
+        return AuthResult(False, "Error", f"Registration failed:\n{e}")
+    if existing:
+        return AuthResult(True, "✅ Success", f"Session {template.n_sessions} recorded for {emp_id}.")
+    return AuthResult(True, "✅ Success", f"User {name} registered successfully!")
+
+
+# ---------- AUTHENTICATE USER (correlation, ok.py / neurolock_app.py) ----------
+def authenticate_user(emp_id, password, csv_path):
+    if not emp_id or not password or not csv_path:
+        return AuthResult(False, "Error", "All fields are required!")
+    try:
+        user_data = get_user_from_db(emp_id)
+        if not user_data:
+            return AuthResult(False, "Login Failed", "Employee ID not found.")
+
+        _, db_password_hash, db_brainwave, db_version, db_rate = user_data
+        if not check_password(password, db_password_hash):
+            return AuthResult(False, "Login Failed", "Incorrect password.")
+
+        test = load_recording(csv_path)
+        template = get_template_from_db(emp_id)
+        if template is not None:
+            distance, _ = templates.score(template, test)
+        else:
+            corr = correlation_score(test, stored_brainwave(db_brainwave, test.shape[1], db_version, db_rate))
+    except Exception as e:
+        return AuthResult(False, "Error", f"Authentication failed:\n{e}")
+
+    if template is not None:
+        detail = f"Mahalanobis {distance:.2f} over {template.n_sessions} sessions"
+        if distance <= templates.MAHALANOBIS_ACCEPT:
+            return AuthResult(True, "Access Granted", f"✅ Welcome, {emp_id}!\nBrainwave matched ({detail})")
+        return AuthResult(False, "Access Denied", f"❌ Brainwave mismatch ({detail})")
+
+    if corr > CORR_THRESHOLD:
+        return AuthResult(True, "Access Granted", f"✅ Welcome, {emp_id}!\nBrainwave matched ({corr:.2f})")
+    return AuthResult(False, "Access Denied", f"❌ Brainwave mismatch ({corr:.2f})")
+
+
+# ---------- AUTHENTICATE (cosine, authenticate_brainwave.py) ----------
+def authenticate(emp_id, password, uploaded_csv_path):
+    user_data = get_user_from_db(emp_id)
+    if not user_data:
+        return "User not found!"
+
+    db_emp_id, db_hashed_pwd, db_brainwave, db_version, db_rate = user_data
+
+    # check password
+    if not check_password(password, db_hashed_pwd):
+        return "Invalid password!"
+
+    # brainwave check: the enrolled template decides, as in authenticate_user
+    try:
+        uploaded = load_recording(uploaded_csv_path)
+        template = get_template_from_db(emp_id)
+        if template is not None:
+            distance, _ = templates.score(template, uploaded)
+            detail = f"Mahalanobis {distance:.2f} over {template.n_sessions} sessions"
+            if distance <= templates.MAHALANOBIS_ACCEPT:
+                return f"✅ Login Successful! Brainwave match: {detail}"
+            return f"❌ Brainwave mismatch! {detail}"
+
+        stored = stored_brainwave(db_brainwave, uploaded.shape[1], db_version, db_rate)
+        similarity = cosine_score(uploaded, stored)
+
+        if similarity > COSINE_THRESHOLD:
+            return f"✅ Login Successful! Brainwave match: {similarity:.3f}"
+        else:
+            return f"❌ Brainwave mismatch! Similarity: {similarity:.3f}"
+
+    except Exception as e:
+        return f"Error processing EEG file: {e}"
+
+
+# ---------- HEADLESS WORKER ----------
+if __name__ == "__main__":
+    if len(sys.argv) != 5 or sys.argv[1] != "verify":
+        print("usage: neurolock_core.py verify EMP_ID PASSWORD CSV")
+        sys.exit(2)
+    _, _, emp_id, password, csv_path = sys.argv
+    result = authenticate_user(emp_id, password, csv_path)
+    print(result.message)
+    sys.exit(0 if result.ok else 1)
@@ -0,0 +1,252 @@
+"""
+Dependency-light inference for the pickled (scaler, classifier) models.
+
+    python npz_model.py export neurolock_invariant_model.pkl neurolock_model.npz --check
+
+export() flattens the pickle into a .npz of plain arrays: StandardScaler
+mean/scale plus, depending on the estimator, linear weights (SGDClassifier,
+LogisticRegression, ...), MLP layer weights, or decision-tree / random-forest
+node arrays. NpzModel loads that file and predicts with NumPy alone, with no
+sklearn import and no unpickling. load() returns the same (scaler, model)
+layout as the pickles, with the classes_, n_features_in_, transform, predict
+and predict_proba surface that scoring.py uses.
+
+--check runs random batches through both the pickle and the export and fails
+if predictions or probabilities differ.
+"""
+import os
+import sys
+import argparse
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+
+# ---------- Export (needs sklearn, run offline) ----------
+def _export_estimator(model, out):
+    name = type(model).__name__
+    if hasattr(model, "coefs_"):                       # MLPClassifier
+        out["kind"] = "mlp"
+        out["n_layers"] = len(model.coefs_)
+        for i, (w, b) in enumerate(zip(model.coefs_, model.intercepts_)):
+            out[f"W{i}"] = w
+            out[f"b{i}"] = b
+        out["activation"] = model.activation
+        out["out_activation"] = model.out_activation_
+    elif hasattr(model, "coef_") and hasattr(model, "intercept_"):
+        out["kind"] = "linear"
+        out["coef"] = np.atleast_2d(model.coef_)
+        out["intercept"] = np.atleast_1d(model.intercept_)
+        # LogisticRegression is multinomial (softmax); SGD and liblinear are one-vs-rest
+        out["softmax"] = name == "LogisticRegression" and getattr(model, "solver", "") != "liblinear"
+    elif hasattr(model, "estimators_"):                # RandomForest / ExtraTrees
+        out["kind"] = "forest"
+        _export_trees([est.tree_ for est in model.estimators_], out)
+    elif hasattr(model, "tree_"):                      # DecisionTreeClassifier
+        out["kind"] = "forest"
+        _export_trees([model.tree_], out)
+    else:
+        raise ValueError(f"Cannot export estimator of type {name}")
+    out["estimator"] = name
+    classes = np.asarray(model.classes_)
+    out["classes"] = classes.astype(str) if classes.dtype == object else classes
+    out["n_features"] = int(model.n_features_in_)
+
+
+def _export_trees(trees, out):
+    """Concatenate all trees into flat node arrays; child indices are made global."""
+    offsets = np.cumsum([0] + [t.node_count for t in trees])
+    left, right, feature, threshold, value = [], [], [], [], []
+    for off, t in zip(offsets, trees):
+        leaf = t.children_left == -1
+        left.append(np.where(leaf, -1, t.children_left + off))
+        right.append(np.where(leaf, -1, t.children_right + off))
+        feature.append(t.feature)
+        threshold.append(t.threshold)
+        v = t.value[:, 0, :]
+        value.append(v / np.maximum(v.sum(axis=1, keepdims=True), 1e-12))
+    out["roots"] = offsets[:-1]
+    out["left"] = np.concatenate(left)
+    out["right"] = np.concatenate(right)
+    out["feature"] = np.concatenate(feature)
+    out["threshold"] = np.concatenate(threshold)
+    out["value"] = np.concatenate(value)
+    out["max_depth"] = max(t.max_depth for t in trees)
+
+
+def export(pickle_path, npz_path):
+    import joblib
+    import scoring
+    model, scaler = scoring.split_model(joblib.load(pickle_path))
+    out = {"format_version": FORMAT_VERSION}
+    _export_estimator(model, out)
+    if scaler is not None:
+        out["scaler_mean"] = np.asarray(scaler.mean_, dtype=np.float64)
+        scale = getattr(scaler, "scale_", None)
+        out["scaler_scale"] = np.ones_like(out["scaler_mean"]) if scale is None else np.asarray(scale)
+    np.savez(npz_path, **out)
+    return npz_path
+
+
+# ---------- Pure NumPy inference ----------
+def _softmax(z):
+    z = z - z.max(axis=1, keepdims=True)
+    np.exp(z, out=z)
+    z /= z.sum(axis=1, keepdims=True)
+    return z
+
+
+def _logistic(z):
+    with np.errstate(over="ignore"):            # exp overflow -> inf -> 0, as expit does
+        return 1.0 / (1.0 + np.exp(-z))
+
+
+_ACTIVATIONS = {
+    "identity": lambda z: z,
+    "relu": lambda z: np.maximum(z, 0, out=z),
+    "tanh": np.tanh,
+    "logistic": _logistic,
+}
+
+
+class NpzScaler:
+    """StandardScaler.transform from the exported mean / scale."""
+
+    def __init__(self, mean, scale):
+        self.mean_ = mean
+        self.scale_ = scale
+
+    def transform(self, X):
+        return (np.asarray(X, dtype=np.float64) - self.mean_) / self.scale_
+
+
+class NpzModel:
+    """Exported classifier with the same predict / predict_proba surface as the sklearn estimator."""
+
+    def __init__(self, path):
+        with np.load(path, allow_pickle=False) as z:
+            self.arrays = {k: z[k] for k in z.files}
+        a = self.arrays
+        self.kind = str(a["kind"])
+        self.classes_ = a["classes"]
+        self.n_features_in_ = int(a["n_features"])
+        self.scaler = NpzScaler(a["scaler_mean"], a["scaler_scale"]) if "scaler_mean" in a else None
+        if self.kind == "mlp":
+            n = int(a["n_layers"])
+            self.layers = [(a[f"W{i}"], a[f"b{i}"]) for i in range(n)]
+            self.activation = _ACTIVATIONS[str(a["activation"])]
+            self.out_activation = str(a["out_activation"])
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if self.kind == "mlp":
+            h = X
+            for W, b in self.layers[:-1]:
+                h = self.activation(h @ W + b)
+            W, b = self.layers[-1]
+            z = h @ W + b
+            if self.out_activation == "softmax":
+                return _softmax(z)
+            p = _logistic(z).ravel()
+            return np.column_stack([1 - p, p])
+        if self.kind == "linear":
+            z = X @ self.arrays["coef"].T + self.arrays["intercept"]
+            if z.shape[1] == 1:
+                p = _logistic(z).ravel()
+                return np.column_stack([1 - p, p])
+            if bool(self.arrays["softmax"]):
+                return _softmax(z)
+            # one-vs-rest (SGD / liblinear) normalisation
+            p = _logistic(z)
+            return p / np.maximum(p.sum(axis=1, keepdims=True), 1e-12)
+        return self._forest_proba(X)
+
+    def _forest_proba(self, X):
+        a = self.arrays
+        left, right, feature, threshold = a["left"], a["right"], a["feature"], a["threshold"]
+        X = X.astype(np.float32)         # sklearn trees split on float32 inputs
+        rows = np.arange(len(X))
+        proba = np.zeros((len(X), len(self.classes_)))
+        for root in a["roots"]:
+            node = np.full(len(X), root)
+            for _ in range(int(a["max_depth"])):
+                inner = left[node] != -1
+                if not inner.any():
+                    break
+                go_left = X[rows, np.where(inner, feature[node], 0)] <= threshold[node]
+                node = np.where(inner, np.where(go_left, left[node], right[node]), node)
+            proba += a["value"][node]
+        return proba / len(a["roots"])
+
+    def decision_function(self, X):
+        return X @ self.arrays["coef"].T + self.arrays["intercept"]
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if self.kind == "linear":
+            z = self.decision_function(X)
+            if z.shape[1] == 1:
+                return self.classes_[(z.ravel() > 0).astype(int)]
+            return self.classes_[z.argmax(axis=1)]
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+
+def load(path):
+    """(scaler, model) tuple, the same layout scoring.split_model expects from the pickles."""
+    model = NpzModel(path)
+    return (model.scaler, model) if model.scaler is not None else model
+
+
+def preferred_path(pickle_path):
+    """The exported .npz next to `pickle_path` if it is at least as new, else the pickle itself."""
+    npz_path = pickle_path[:-4] + ".npz" if pickle_path.endswith(".pkl") else None
+    try:
+        if npz_path and os.path.getmtime(npz_path) >= os.path.getmtime(pickle_path):
+            return npz_path
+    except OSError:
+        pass
+    return pickle_path
+
+
+# ---------- Parity check ----------
+def check(pickle_path, npz_path, n=512, seed=0, atol=1e-6):
+    """Compare the export against the pickle on random inputs; returns (ok, mismatches, max |dp|)."""
+    import joblib
+    import scoring
+    model, scaler = scoring.split_model(joblib.load(pickle_path))
+    exported = NpzModel(npz_path)
+    exported_scaler = exported.scaler
+    rng = np.random.default_rng(seed)
+    X = rng.standard_normal((n, exported.n_features_in_))
+    if scaler is not None:
+        X = X * scaler.scale_ + scaler.mean_
+    ref_X = scaler.transform(X) if scaler is not None else X
+    got_X = exported_scaler.transform(X) if exported_scaler is not None else X
+    mismatches = int((model.predict(ref_X) != exported.predict(got_X)).sum())
+    max_dp = 0.0
+    if hasattr(model, "predict_proba"):
+        max_dp = float(np.abs(model.predict_proba(ref_X) - exported.predict_proba(got_X)).max())
+    ok = mismatches == 0 and max_dp <= atol
+    return ok, mismatches, max_dp
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a pickled NeuroLock model to pure-NumPy .npz")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("export")
+    p.add_argument("pickle")
+    p.add_argument("npz")
+    p.add_argument("--check", action="store_true")
+    c = sub.add_parser("check")
+    c.add_argument("pickle")
+    c.add_argument("npz")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export(args.pickle, args.npz)
+        print("Wrote", args.npz)
+    if args.command == "check" or args.check:
+        ok, mismatches, max_dp = check(args.pickle, args.npz)
+        print(f"parity: {'OK' if ok else 'FAILED'} (prediction mismatches={mismatches}, max |dp|={max_dp:.2e})")
+        sys.exit(0 if ok else 1)
@@ -0,0 +1,95 @@
+"""
+EEG preprocessing shared by enrollment and verification.
+
+preprocess() takes an eeg_io.Recording and returns a new one that is
+band-passed, mains-notched, resampled to CANONICAL_RATE and robustly
+z-scored per channel. Every step works on the whole (samples, channels)
+array at once, and filter designs are cached per (sample rate, band) so
+repeated files at the same rate only pay for the filtering itself.
+
+scipy.signal is imported on first use.
+"""
+from fractions import Fraction
+from functools import lru_cache
+
+import numpy as np
+
+import eeg_io
+
+CANONICAL_RATE = 128
+BANDPASS = (1.0, 40.0)
+MAINS_HZ = 50.0
+NOTCH_Q = 30.0
+FILTER_ORDER = 4
+
+
+# ---------- Filter designs (cached) ----------
+@lru_cache(maxsize=64)
+def bandpass_sos(fs, low, high, order=FILTER_ORDER):
+    from scipy.signal import butter
+    nyq = fs / 2.0
+    high = min(high, 0.45 * fs)
+    if low <= 0:
+        return butter(order, high / nyq, btype="lowpass", output="sos")
+    return butter(order, [low / nyq, high / nyq], btype="bandpass", output="sos")
+
+
+@lru_cache(maxsize=64)
+def notch_sos(fs, freq, q=NOTCH_Q):
+    from scipy.signal import iirnotch, tf2sos
+    b, a = iirnotch(freq, q, fs=fs)
+    return tf2sos(b, a)
+
+
+# ---------- Stages ----------
+def _filtfilt(sos, data):
+    from scipy.signal import sosfiltfilt, sosfilt
+    padlen = 3 * (2 * len(sos) + 1)
+    if data.shape[0] <= padlen:
+        return sosfilt(sos, data, axis=0)
+    return sosfiltfilt(sos, data, axis=0)
+
+
+def bandpass(data, fs, band=BANDPASS):
+    return _filtfilt(bandpass_sos(float(fs), float(band[0]), float(band[1])), data)
+
+
+def notch(data, fs, freq=MAINS_HZ):
+    if freq is None or freq >= fs / 2.0:
+        return data
+    return _filtfilt(notch_sos(float(fs), float(freq)), data)
+
+
+def resample(data, fs, target=CANONICAL_RATE):
+    if not target or fs == target:
+        return data
+    from scipy.signal import resample_poly
+    ratio = Fraction(float(target) / float(fs)).limit_denominator(1000)
+    return resample_poly(data, ratio.numerator, ratio.denominator, axis=0)
+
+
+def robust_zscore(data, axis=0):
+    """(x - median) / (1.4826 * MAD) along `axis`; flat channels are only centred."""
+    median = np.median(data, axis=axis, keepdims=True)
+    mad = np.median(np.abs(data - median), axis=axis, keepdims=True) * 1.4826
+    mad[mad == 0] = 1.0
+    return (data - median) / mad
+
+
+def preprocess(recording, band=BANDPASS, mains=MAINS_HZ, target_rate=CANONICAL_RATE):
+    """Bandpass, notch, resample and z-score every channel of `recording` in one pass."""
+    data = np.asarray(recording.data, dtype=np.float64)
+    if data.ndim == 1:
+        data = data[:, None]
+    fs = float(recording.sample_rate or eeg_io.DEFAULT_SAMPLE_RATE)
+    data = data - data.mean(axis=0, keepdims=True)
+    data = bandpass(data, fs, band)
+    data = notch(data, fs, mains)
+    data = resample(data, fs, target_rate)
+    data = robust_zscore(data)
+    return eeg_io.Recording(data, list(recording.channels), float(target_rate or fs))
+
+
+def load(source, **kwargs):
+    """eeg_io.read_eeg followed by preprocess()."""
+    return preprocess(eeg_io.read_eeg(source, **kwargs))
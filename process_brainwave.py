@@ -2,22 +2,24 @@ import pandas as pd
 import numpy as np
 import mysql.connector
 import bcrypt
+import preprocess
+import neurolock_core
 
 # === Step 1: Load EEG Data ===
 def load_eeg_data(file_path):
-    df = pd.read_csv(file_path)
-    
+    # CSV, EDF/BDF, NPY/NPZ or raw float32 (see eeg_io), filtered per channel
+    recording = preprocess.load(file_path)
+
     # If multiple channels, flatten into one signal
-    df = df.select_dtypes(include=[np.number])
-    flat_signal = df.values.flatten()
+    flat_signal = recording.data.flatten()
 
     return pd.DataFrame(flat_signal, columns=["EEG_Signal"])
 
 # === Step 2: Normalize EEG data ===
 def normalize_signal(df):
-    signal = df["EEG_Signal"].values
-    normalized = (signal - np.min(signal)) / (np.max(signal) - np.min(signal))
-    return normalized
+    # load_eeg_data already robust z-scored each channel (preprocess.load);
+    # a second pass over the flattened signal would change the scale
+    return df["EEG_Signal"].values
 
 # === Step 3: Convert to binary ===
 def signal_to_binary(normalized_signal):
@@ -30,9 +32,8 @@ import mysql.connector
 import bcrypt
 
 def save_to_database(emp_id, name, password, csv_path):
-    # Read and flatten EEG CSV
-    df = pd.read_csv(csv_path)
-    flat_array = df.values.flatten().astype(np.float64)
+    # Read, preprocess and flatten EEG file
+    flat_array = preprocess.load(csv_path).data.flatten().astype(np.float64)
     
     # Convert to binary safely
     brainwave_binary = flat_array.tobytes()
@@ -47,10 +48,11 @@ def save_to_database(emp_id, name, password, csv_path):
     )
     cursor = conn.cursor()
     query = """
-        INSERT INTO neuro_users (emp_id, name, password, brainwave)
-        VALUES (%s, %s, %s, %s)
+        INSERT INTO neuro_users (emp_id, name, password, brainwave, brainwave_version, brainwave_rate)
+        VALUES (%s, %s, %s, %s, %s, %s)
     """
-    cursor.execute(query, (emp_id, name, password_hash, brainwave_binary))
+    cursor.execute(query, (emp_id, name, password_hash, brainwave_binary,
+                           neurolock_core.BLOB_PREPROCESSED, preprocess.CANONICAL_RATE))
     conn.commit()
     cursor.close()
     conn.close()
@@ -0,0 +1,130 @@
+"""
+Per-identity rate limiting and admission control for the verify endpoints.
+
+Two token-bucket limiters (one keyed by empid, one by client address) stop a
+single identity from hammering verification, and a bounded in-flight gate
+sheds load once MAX_IN_FLIGHT verifications are already running instead of
+letting requests queue behind them:
+
+    verify_gate = ratelimit.Admission()
+    with verify_gate.admit(empid, request.remote_addr) as decision:
+        if not decision.ok:
+            return ..., decision.status, {"Retry-After": decision.retry_header}
+        ...expensive work...
+
+Buckets are refilled lazily when a key is seen (O(1) per request) and keys
+whose bucket has refilled completely are dropped every COMPACT_EVERY calls,
+so idle identities cost no memory.
+"""
+import os
+import math
+import time
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+
+EMPID_RATE = 5 / 60.0         # tokens per second: 5 attempts a minute per employee...
+EMPID_BURST = 5               # ...with up to 5 back to back
+IP_RATE = 30 / 60.0
+IP_BURST = 10
+MAX_IN_FLIGHT = os.cpu_count() or 2
+BUSY_RETRY_AFTER_S = 1.0
+COMPACT_EVERY = 1024
+
+
+class Decision(namedtuple("Decision", "ok status retry_after reason")):
+    @property
+    def retry_header(self):
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+ADMITTED = Decision(True, 200, 0.0, None)
+
+
+class TokenBuckets:
+    """Token bucket per key; state is {key: [tokens, last_refill]}."""
+
+    def __init__(self, rate, burst, compact_every=COMPACT_EVERY):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.compact_every = compact_every
+        self.buckets = {}
+        self._calls = 0
+        self._lock = threading.Lock()
+
+    def take(self, key, cost=1.0, now=None):
+        """Spend `cost` tokens of `key`. Returns 0.0 if allowed, else seconds until it would be."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._calls += 1
+            if self._calls % self.compact_every == 0:
+                self._compact(now)
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = [self.burst, now]
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return 0.0
+            return (cost - bucket[0]) / self.rate
+
+    def _compact(self, now):
+        full = self.burst / self.rate
+        for key in [k for k, (_, last) in self.buckets.items() if now - last >= full]:
+            del self.buckets[key]
+
+
+class InFlight:
+    """Non-blocking bounded counter of running verifications."""
+
+    def __init__(self, limit=MAX_IN_FLIGHT):
+        self.limit = limit
+        self._sem = threading.BoundedSemaphore(limit)
+
+    def try_acquire(self):
+        return self._sem.acquire(blocking=False)
+
+    def release(self):
+        self._sem.release()
+
+
+class Admission:
+    """Client-address bucket, then empid bucket, then the in-flight gate."""
+
+    def __init__(self, empid_rate=EMPID_RATE, empid_burst=EMPID_BURST, ip_rate=IP_RATE, ip_burst=IP_BURST,
+                 max_in_flight=MAX_IN_FLIGHT):
+        self.by_empid = TokenBuckets(empid_rate, empid_burst)
+        self.by_ip = TokenBuckets(ip_rate, ip_burst)
+        self.in_flight = InFlight(max_in_flight)
+        self.rejected = {"ip": 0, "empid": 0, "busy": 0}
+
+    def check(self, empid, ip):
+        """Decision for one request; on success a slot is held and must be released()."""
+        if ip:
+            wait = self.by_ip.take(ip)
+            if wait:
+                self.rejected["ip"] += 1
+                return Decision(False, 429, wait, "rate_limited_ip")
+        if empid:
+            wait = self.by_empid.take(empid)
+            if wait:
+                self.rejected["empid"] += 1
+                return Decision(False, 429, wait, "rate_limited_empid")
+        if not self.in_flight.try_acquire():
+            self.rejected["busy"] += 1
+            return Decision(False, 503, BUSY_RETRY_AFTER_S, "overloaded")
+        return ADMITTED
+
+    def release(self):
+        self.in_flight.release()
+
+    @contextmanager
+    def admit(self, empid, ip):
+        decision = self.check(empid, ip)
+        try:
+            yield decision
+        finally:
+            if decision.ok:
+                self.release()
@@ -0,0 +1,338 @@
+"""
+Replay detection: has this EEG (or a lightly perturbed copy of it) been
+accepted before?
+
+Two recordings of the same person share their band powers (that is what the
+template matches on) but never the fine structure of their spectrum, which
+comes from that one session's noise. A replayed file keeps it even after
+rescaling, added noise, cropping or a time shift. A signature is the Welch
+spectrum of one SKETCH_SECONDS window (Hann epochs of EPOCH_SAMPLES, hop
+EPOCH_HOP), reduced to each channel's deviation of the log spectrum from a
+moving average over 1-40 Hz and projected onto BITS random hyperplanes
+(SimHash). Replays land within MAX_HAMMING bits of the original window;
+fresh recordings of the same user are measured at 41+ bits, other users
+further still.
+
+Windows that start more than about a second apart share too little of their
+spectrum, so an accepted upload is indexed as one signature per
+SKETCH_SECONDS block (sketch()), and a probe is looked up with the windows
+starting at every EPOCH_HOP across its first SKETCH_SECONDS (probe_sketch()).
+However the replay was cropped, one of those windows lines up with an
+indexed block to within EPOCH_HOP / 2. Cropping to less than one full block
+of the original is not detected.
+
+ReplayIndex holds the block signatures of every accepted probe. Lookups use
+TABLES bit-sampling LSH tables (KEY_BITS sampled bits each, kept as sorted
+arrays searched with searchsorted) plus a short linear scan of rows added
+since the last merge, then take exact Hamming distances of the candidates
+with popcount. Every MERGE_EVERY additions a background thread sorts just
+those rows into a copy of each table and swaps the copies in, so add() never
+re-sorts the history. Byte-identical uploads are caught first by a content hash,
+before anything is parsed. The index is saved atomically to REPLAY_FILE
+(npz) every SAVE_EVERY additions and at exit.
+"""
+import os
+import time
+import atexit
+import hashlib
+import logging
+import threading
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+import preprocess
+
+REPLAY_FILE = os.environ.get("NEUROLOCK_REPLAY_FILE", "replay_index.npz")
+BITS = 256
+WORDS = BITS // 64
+SKETCH_SECONDS = 10
+EPOCH_SAMPLES = 512            # 4 s Hann epochs at the canonical rate, 0.25 Hz bins
+EPOCH_HOP = 64
+SKETCH_BAND = (1.0, 40.0)
+SMOOTH_BINS = 5                # moving average removed from the log spectrum
+MAX_HAMMING = 38               # replays measured <= ~35 bits, fresh sessions >= ~41
+TABLES = 16
+KEY_BITS = 12
+MERGE_EVERY = 4096             # pending rows scanned linearly until merged into the tables
+SAVE_EVERY = 256
+SEED = 20240611
+
+Match = namedtuple("Match", ["kind", "distance", "empid", "ts"])
+
+log = logging.getLogger(__name__)
+
+
+# ---------- Signatures ----------
+def content_key(contents):
+    """64-bit hash of an upload as received (exact-replay fast path)."""
+    data = contents.encode() if isinstance(contents, str) else bytes(contents)
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+
+@lru_cache(maxsize=8)
+def _planes(n_features):
+    return np.random.default_rng(SEED + n_features).standard_normal((n_features, BITS))
+
+
+@lru_cache(maxsize=1)
+def _sampled_bits():
+    return np.random.default_rng(SEED).integers(0, BITS, size=(TABLES, KEY_BITS))
+
+
+def _window_power(data, fs, n_windows, stride):
+    """
+    (windows, channels, bins) Welch power of up to `n_windows` SKETCH_SECONDS
+    windows starting every `stride` epochs. Epoch spectra are computed once and
+    averaged per window with a cumsum; a recording shorter than one window is
+    a single window of whatever it has (zero-padded to one epoch).
+    """
+    data = np.asarray(data, dtype=np.float64)
+    if data.ndim == 1:
+        data = data[:, None]
+    window = int(SKETCH_SECONDS * fs)
+    per_window = (window - EPOCH_SAMPLES) // EPOCH_HOP + 1
+    n_windows = max(1, min(n_windows, (len(data) - window) // (stride * EPOCH_HOP) + 1))
+    data = data[:(n_windows - 1) * stride * EPOCH_HOP + window]
+    if len(data) < EPOCH_SAMPLES:
+        data = np.pad(data, ((0, EPOCH_SAMPLES - len(data)), (0, 0)))
+    epochs = sliding_window_view(data, EPOCH_SAMPLES, axis=0)[::EPOCH_HOP]          # (epochs, channels, samples)
+    power = np.abs(np.fft.rfft(epochs * np.hanning(EPOCH_SAMPLES), axis=-1)) ** 2
+    csum = np.concatenate([np.zeros((1,) + power.shape[1:]), np.cumsum(power, axis=0)])
+    starts = np.arange(n_windows) * stride
+    stops = np.minimum(starts + per_window, len(power))
+    return (csum[stops] - csum[starts]) / (stops - starts)[:, None, None]
+
+
+def _simhash(power, fs):
+    """(windows, WORDS) uint64 signatures of (windows, channels, bins) spectra."""
+    freqs = np.fft.rfftfreq(EPOCH_SAMPLES, d=1.0 / fs)
+    keep = (freqs >= SKETCH_BAND[0]) & (freqs < SKETCH_BAND[1])
+    logs = np.log(power[..., keep] + 1e-12)
+    # moving average along frequency (cumsum, edge-padded) leaves only the fine structure
+    pad = SMOOTH_BINS // 2
+    csum = np.cumsum(np.pad(logs, ((0, 0), (0, 0), (pad + 1, pad)), mode="edge"), axis=-1)
+    fine = (logs - (csum[..., SMOOTH_BINS:] - csum[..., :-SMOOTH_BINS]) / SMOOTH_BINS).reshape(len(logs), -1)
+    bits = fine @ _planes(fine.shape[1]) > 0
+    return np.packbits(bits, axis=1).view(np.uint64)
+
+
+def sketch(data, fs=preprocess.CANONICAL_RATE):
+    """(blocks, WORDS) uint64 SimHash of each SKETCH_SECONDS block of a preprocessed (samples, channels) array."""
+    block_epochs = int(SKETCH_SECONDS * fs) // EPOCH_HOP
+    return _simhash(_window_power(data, fs, len(data), block_epochs), fs)
+
+
+def probe_sketch(data, fs=preprocess.CANONICAL_RATE):
+    """(windows, WORDS) signatures of the windows starting at every EPOCH_HOP in the first block (lookups)."""
+    return _simhash(_window_power(data, fs, int(SKETCH_SECONDS * fs) // EPOCH_HOP, 1), fs)
+
+
+def _keys(sigs):
+    """(rows, TABLES) uint16 LSH keys of (rows, WORDS) signatures."""
+    bits = np.unpackbits(np.ascontiguousarray(sigs).view(np.uint8), axis=1)
+    return (bits[:, _sampled_bits()] << np.arange(KEY_BITS, dtype=np.uint16)).sum(axis=2, dtype=np.uint16)
+
+
+if hasattr(np, "bitwise_count"):
+    def _popcount(words):
+        return np.bitwise_count(words)
+else:
+    _POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def _popcount(words):
+        return _POPCOUNT[np.ascontiguousarray(words)[:, None].view(np.uint8)].sum(axis=1, dtype=np.uint8)
+
+
+def _hamming(sigs, sig):
+    """Bit distance of every (rows, WORDS) signature to `sig`, one word at a time (no axis reduction)."""
+    x = sigs ^ sig
+    d = _popcount(x[:, 0]).astype(np.int16)
+    for w in range(1, WORDS):
+        d += _popcount(x[:, w])
+    return d
+
+
+# ---------- Index ----------
+class ReplayIndex:
+    def __init__(self, path=None):
+        self.path = os.path.abspath(path) if path else None
+        self.n = 0
+        self.indexed = 0               # rows [0, indexed) are in the sorted tables
+        self._sigs = np.zeros((1024, WORDS), np.uint64)
+        self._keys = np.zeros((1024, TABLES), np.uint16)
+        self._ts = np.zeros(1024)
+        self._empids = []
+        self._sorted = [(np.zeros(0, np.uint16), np.zeros(0, np.uint32))] * TABLES
+        self._exact = {}
+        self._dirty = 0
+        self._lock = threading.Lock()
+        self._merge_lock = threading.Lock()     # one merge at a time; lookups keep using the old tables
+        self._merger = None
+        if self.path and os.path.exists(self.path):
+            self.load(self.path)
+
+    def __len__(self):
+        return self.n
+
+    # ---------- Lookups ----------
+    def check_exact(self, key):
+        row = self._exact.get(key)
+        return None if row is None else Match("exact", 0, self._empids[row], float(self._ts[row]))
+
+    def lookup(self, sigs, key=None):
+        """
+        Closest earlier submission within MAX_HAMMING bits of any of `sigs`
+        (a probe_sketch(), or one signature), exact content first, or None.
+        """
+        if key is not None:
+            match = self.check_exact(key)
+            if match:
+                return match
+        sigs = np.asarray(sigs, dtype=np.uint64).reshape(-1, WORDS)
+        with self._lock:
+            if not self.n:
+                return None
+            sig_keys = _keys(sigs)
+            pending = np.arange(self.indexed, self.n, dtype=np.uint32)
+            parts, owners = [], []
+            for q in range(len(sigs)):
+                rows = [pending]
+                for t, (keys, order) in enumerate(self._sorted):
+                    lo, hi = np.searchsorted(keys, [sig_keys[q, t], sig_keys[q, t] + 1])
+                    rows.append(order[lo:hi])
+                rows = np.concatenate(rows)               # duplicates are cheaper than np.unique
+                parts.append(rows)
+                owners.append(np.full(len(rows), q))
+            candidates = np.concatenate(parts)
+            if not len(candidates):
+                return None
+            distances = _hamming(self._sigs[candidates], sigs[np.concatenate(owners)])
+            best = int(distances.argmin())
+            if distances[best] > MAX_HAMMING:
+                return None
+            row = int(candidates[best])
+            return Match("near", int(distances[best]), self._empids[row], float(self._ts[row]))
+
+    # ---------- Updates ----------
+    def add(self, sigs, key=None, empid=None, ts=None):
+        """Index an accepted submission: its sketch() blocks (or one signature) and content key."""
+        sigs = np.asarray(sigs, dtype=np.uint64).reshape(-1, WORDS)
+        with self._lock:
+            self._append(sigs, _keys(sigs), np.full(len(sigs), time.time() if ts is None else ts),
+                         [empid] * len(sigs))
+            if key is not None:
+                self._exact[key] = self.n - len(sigs)
+            merge = self.n - self.indexed >= MERGE_EVERY and self._merger is None
+            if merge:
+                self._merger = threading.Thread(target=self._merge, name="replay-merge", daemon=True)
+                self._merger.start()
+            self._dirty += len(sigs)
+            save = self.path and self._dirty >= SAVE_EVERY
+        if save:
+            self.save()
+
+    def extend(self, sigs, empids=None, ts=None):
+        """Bulk add (rows, WORDS) signatures, e.g. when importing history."""
+        sigs = np.asarray(sigs, dtype=np.uint64).reshape(-1, WORDS)
+        ts = np.full(len(sigs), time.time()) if ts is None else ts
+        with self._lock:
+            for start in range(0, len(sigs), 65536):     # bounded unpackbits temporaries
+                chunk = sigs[start:start + 65536]
+                self._append(chunk, _keys(chunk), ts[start:start + 65536],
+                             list(empids[start:start + 65536]) if empids is not None else [None] * len(chunk))
+            self._dirty += len(sigs)
+        self._merge()
+
+    def _append(self, sigs, keys, ts, empids):
+        need = self.n + len(sigs)
+        if need > len(self._sigs):
+            size = max(need, 2 * len(self._sigs))
+            for name in ("_sigs", "_keys", "_ts"):
+                old = getattr(self, name)
+                grown = np.zeros((size,) + old.shape[1:], old.dtype)
+                grown[:self.n] = old[:self.n]
+                setattr(self, name, grown)
+        self._sigs[self.n:need] = sigs
+        self._keys[self.n:need] = keys
+        self._ts[self.n:need] = ts
+        self._empids.extend(empids)
+        self.n = need
+
+    def _merge(self):
+        """Insert the rows added since the last merge into the sorted tables (outside the lookup lock)."""
+        try:
+            with self._merge_lock:
+                with self._lock:
+                    start, stop, tables = self.indexed, self.n, self._sorted
+                    delta = self._keys[start:stop].copy()      # _append may reallocate _keys meanwhile
+                rows = np.arange(start, stop, dtype=np.uint32)
+                merged = []
+                for t, (keys, order) in enumerate(tables):
+                    new = np.argsort(delta[:, t], kind="stable")            # radix sort on uint16
+                    new_keys = delta[new, t]
+                    at = np.searchsorted(keys, new_keys, side="right")     # after equal keys: rows stay ascending
+                    merged.append((np.insert(keys, at, new_keys), np.insert(order, at, rows[new])))
+                with self._lock:
+                    self._sorted = merged
+                    self.indexed = stop
+        finally:
+            if self._merger is threading.current_thread():
+                self._merger = None
+
+    # ---------- Persistence ----------
+    def save(self, path=None):
+        path = os.path.abspath(path or self.path)
+        with self._lock:
+            n = self.n
+            exact = np.array(list(self._exact.items()), dtype=np.uint64).reshape(-1, 2)
+            payload = {"sigs": self._sigs[:n].copy(), "ts": self._ts[:n].copy(),
+                       "empids": np.array([e or "" for e in self._empids[:n]], dtype=str), "exact": exact}
+            self._dirty = 0
+        tmp = f"{path}.tmp.npz"
+        np.savez(tmp, **payload)
+        os.replace(tmp, path)
+
+    def load(self, path):
+        with np.load(path, allow_pickle=False) as z:
+            sigs, ts, empids, exact = z["sigs"], z["ts"], z["empids"].tolist(), z["exact"]
+        with self._merge_lock, self._lock:
+            self.n = self.indexed = 0
+            self._sorted = [(np.zeros(0, np.uint16), np.zeros(0, np.uint32))] * TABLES
+            self._empids = []
+            self._exact = {int(k): int(row) for k, row in exact}
+        self.extend(sigs, [e or None for e in empids], ts)
+        self._dirty = 0
+
+
+# ---------- Process-wide index ----------
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = ReplayIndex(REPLAY_FILE)
+    return _index
+
+
+def set_index(index):
+    """Replace the process-wide index; None drops it unsaved (e.g. before its directory is removed)."""
+    global _index
+    with _index_lock:
+        _index = index
+
+
+@atexit.register
+def _save_at_exit():
+    index = _index
+    if index is not None and index.path and index._dirty:
+        try:
+            index.save()
+        except OSError as e:
+            log.warning("replay index not saved to %s: %s", index.path, e)
@@ -0,0 +1,234 @@
+"""
+Incremental retraining of the brainwave model from enrolled templates.
+
+Runs as a separate background process (started by app.save_brainwave_db via
+schedule()) so training never competes with the Dash workers for the GIL.
+The model only scores employees without a Mahalanobis template (see
+app.score_brainwave), so the app skips it once needed() is false:
+
+    python retrain.py --db neurolock.db
+
+Each enrolled template is featurized once into epoch feature rows
+(scoring.epoch_matrix over the preprocessed recording) and cached under
+models/features/. Only templates whose file changed since the last run are
+read again. The classifier is an SGDClassifier over empids, refit with its
+scaler on every cached feature matrix and warm-started from the previous
+coefficients (new employees start at zero). Updating on the changed rows
+alone would be a single-class batch for a re-enrollment, pulling the model
+toward that employee while the scaler moved under the other coefficients.
+
+Every run writes models/neurolock_model_vNNNN.pkl (a (scaler, model, classes)
+tuple like neurolock_invariant_model.pkl) plus its npz_model export, and then
+atomically repoints models/LATEST, which the serving process polls and
+hot-swaps.
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import subprocess
+
+import numpy as np
+
+import eeg_io
+import npz_model
+import preprocess
+import scoring
+
+MODEL_DIR = "models"
+FEATURE_DIR = os.path.join(MODEL_DIR, "features")
+MANIFEST = os.path.join(FEATURE_DIR, "manifest.json")
+N_FEATURES = scoring.DEFAULT_FEATURES
+KEEP_VERSIONS = 5
+
+_process = None
+
+
+# ---------- Versioned model files ----------
+def _atomic_write(path, data, mode="w"):
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, mode) as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def latest_model_path(model_dir=MODEL_DIR):
+    """Path of the newest trained model, or None if nothing has been trained yet."""
+    try:
+        with open(os.path.join(model_dir, "LATEST")) as f:
+            name = f.read().strip()
+    except OSError:
+        return None
+    path = os.path.join(model_dir, name)
+    return path if name and os.path.exists(path) else None
+
+
+def _next_version(model_dir):
+    versions = [int(n[len("neurolock_model_v"):-4]) for n in os.listdir(model_dir)
+                if n.startswith("neurolock_model_v") and n.endswith(".pkl")]
+    return max(versions, default=0) + 1
+
+
+def save_model(bundle, model_dir=MODEL_DIR):
+    import joblib
+    os.makedirs(model_dir, exist_ok=True)
+    name = f"neurolock_model_v{_next_version(model_dir):04d}.pkl"
+    path = os.path.join(model_dir, name)
+    joblib.dump(bundle, f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
+    # serving processes load the NumPy export (see npz_model.preferred_path)
+    npz_model.export(path, f"{path[:-4]}.tmp.npz")
+    os.replace(f"{path[:-4]}.tmp.npz", f"{path[:-4]}.npz")
+    _atomic_write(os.path.join(model_dir, "LATEST"), name)
+    _prune(model_dir, keep=KEEP_VERSIONS)
+    return path
+
+
+def _prune(model_dir, keep):
+    names = sorted(n for n in os.listdir(model_dir)
+                   if n.startswith("neurolock_model_v") and n.endswith(".pkl"))
+    for name in names[:-keep]:
+        os.remove(os.path.join(model_dir, name))
+        npz = os.path.join(model_dir, name[:-4] + ".npz")
+        if os.path.exists(npz):
+            os.remove(npz)
+
+
+# ---------- Feature cache ----------
+def featurize(path):
+    """Epoch feature rows (epochs, N_FEATURES) of one stored template."""
+    if path.endswith(".npz"):
+        data = eeg_io.read_eeg(path).data     # enrollments are stored preprocessed
+    else:
+        data = preprocess.load(path).data
+    return np.ascontiguousarray(scoring.epoch_matrix(data, N_FEATURES), dtype=np.float32)
+
+
+def load_manifest():
+    try:
+        with open(MANIFEST) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def update_features(db_file):
+    """Featurize new or changed enrollments only; they are marked untrained in the manifest."""
+    os.makedirs(FEATURE_DIR, exist_ok=True)
+    manifest = load_manifest()
+    conn = sqlite3.connect(db_file)
+    rows = conn.execute("SELECT empid, brainwave_path FROM employees WHERE brainwave_path IS NOT NULL").fetchall()
+    conn.close()
+
+    for empid, path in rows:
+        if not path or not os.path.exists(path):
+            continue
+        mtime = os.path.getmtime(path)
+        entry = manifest.get(empid)
+        if entry and entry["path"] == path and entry["mtime"] == mtime:
+            continue
+        feats = featurize(path)
+        np.save(os.path.join(FEATURE_DIR, f"{empid}.npy"), feats)
+        manifest[empid] = {"path": path, "mtime": mtime, "rows": int(len(feats)), "trained": False}
+    _atomic_write(MANIFEST, json.dumps(manifest, indent=1))
+    return manifest
+
+
+def _cached(manifest, empids):
+    X = [np.load(os.path.join(FEATURE_DIR, f"{e}.npy")) for e in empids]
+    y = [np.full(len(x), e, dtype=object) for x, e in zip(X, empids)]
+    return np.concatenate(X), np.concatenate(y)
+
+
+# ---------- Training ----------
+def _load_previous():
+    import joblib
+    path = latest_model_path()
+    if path is None:
+        return None
+    scaler, model, classes = joblib.load(path)
+    return scaler, model, list(classes)
+
+
+def train_once(db_file):
+    """One incremental training pass. Returns the new model path, or None if nothing changed."""
+    from sklearn.linear_model import SGDClassifier
+    from sklearn.preprocessing import StandardScaler
+
+    manifest = update_features(db_file)
+    changed = [e for e, entry in manifest.items() if not entry["trained"]]
+    if not changed:
+        return None
+    classes = sorted(manifest)
+    if len(classes) < 2:
+        print("retrain: need at least two enrolled employees")
+        return None
+
+    previous = _load_previous()
+    X, y = _cached(manifest, classes)
+    scaler = StandardScaler().fit(X)
+    model = SGDClassifier(loss="log_loss", alpha=1e-4, max_iter=20, tol=None, random_state=0)
+    coef_init, intercept_init = _warm_start(previous, classes, X.shape[1])
+    model.fit(scaler.transform(X), y, coef_init=coef_init, intercept_init=intercept_init)
+
+    for empid in changed:
+        manifest[empid]["trained"] = True
+    _atomic_write(MANIFEST, json.dumps(manifest, indent=1))
+    return save_model((scaler, model, classes))
+
+
+def _warm_start(previous, classes, n_features):
+    """Previous coefficients re-indexed to the new class list (new employees start at zero)."""
+    if previous is None or len(classes) <= 2:
+        return None, None
+    _, old_model, _ = previous
+    old_classes = list(getattr(old_model, "classes_", []))
+    if len(old_classes) <= 2 or old_model.coef_.shape[1] != n_features:
+        return None, None
+    coef = np.zeros((len(classes), n_features))
+    intercept = np.zeros(len(classes))
+    for i, c in enumerate(classes):
+        if c in old_classes:
+            j = old_classes.index(c)
+            coef[i] = old_model.coef_[j]
+            intercept[i] = old_model.intercept_[j]
+    return coef, intercept
+
+
+def run(db_file):
+    """Train until no enrollment changed during the last pass."""
+    while True:
+        t0 = time.time()
+        path = train_once(db_file)
+        if path is None:
+            return
+        print(f"retrain: wrote {path} in {time.time() - t0:.2f}s")
+
+
+# ---------- Scheduling from the serving process ----------
+def needed(conn):
+    """True while some enrolled employee has no template (templates only exist for enrolled employees)."""
+    try:
+        return conn.execute("SELECT (SELECT COUNT(brainwave_path) FROM employees) > "
+                            "(SELECT COUNT(*) FROM brainwave_templates)").fetchone()[0] == 1
+    except sqlite3.OperationalError:
+        return True
+
+
+def schedule(db_file):
+    """Start a background training process unless one is already running."""
+    global _process
+    if _process is not None and _process.poll() is None:
+        return _process
+    script = os.path.abspath(__file__)
+    _process = subprocess.Popen([sys.executable, script, "--db", db_file])
+    return _process
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally retrain the NeuroLock model")
+    parser.add_argument("--db", default="neurolock.db")
+    args = parser.parse_args()
+    run(args.db)
@@ -0,0 +1,117 @@
+"""
+On-demand sampling profiler for the running Dash and Flask servers.
+
+    NEUROLOCK_ADMIN_CODE=... python app.py
+    curl -H "X-Admin-Code: ..." "http://localhost:8050/admin/profile?seconds=10" > app.folded
+    flamegraph.pl app.folded > app.svg        # or load it in speedscope
+
+While a profile is running, a background thread wakes every 1/hz seconds,
+reads the stack of every Python thread from sys._current_frames() and counts
+each stack. Nothing runs between profiles. The result is collapsed-stack text,
+one "thread;outer;...;inner count" line per distinct stack, which
+flamegraph.pl, speedscope and inferno read directly.
+"""
+import os
+import sys
+import hmac
+import math
+import time
+import threading
+from collections import Counter
+
+DEFAULT_HZ = 100
+MAX_HZ = 1000
+MAX_SECONDS = 60
+
+_busy = threading.Lock()
+
+
+class Sampler:
+    def __init__(self, hz=DEFAULT_HZ, exclude=()):
+        self.interval = 1.0 / max(1, min(int(hz), MAX_HZ))
+        self.exclude = set(exclude)
+        self.counts = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident in self.exclude:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+            self.counts[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="neurolock-sampler", daemon=True)
+        self._thread.start()
+        self.exclude.add(self._thread.ident)
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.counts
+
+    def collapsed(self):
+        return "".join(f"{stack} {n}\n" for stack, n in self.counts.most_common())
+
+
+def profile(seconds, hz=DEFAULT_HZ, exclude=()):
+    """Sample every thread (except `exclude` and the sampler) for `seconds`; returns the Sampler."""
+    sampler = Sampler(hz, exclude).start()
+    try:
+        time.sleep(seconds)
+    finally:
+        sampler.stop()
+    return sampler
+
+
+# ---------- Flask endpoint ----------
+def install(server, admin_code):
+    """
+    Add /admin/profile?seconds=N[&hz=H] to `server`, authorised by the
+    X-Admin-Code header. Without an admin code nothing is installed (None).
+    """
+    if not admin_code:
+        return None
+    from flask import request, Response, jsonify
+
+    @server.route("/admin/profile")
+    def admin_profile():
+        supplied = request.headers.get("X-Admin-Code", "")
+        if not hmac.compare_digest(supplied.encode(), str(admin_code).encode()):
+            return jsonify({"error": "forbidden"}), 403
+        try:
+            seconds = float(request.args.get("seconds", 5))
+            hz = int(request.args.get("hz", DEFAULT_HZ))
+        except ValueError:
+            return jsonify({"error": "seconds and hz must be numbers"}), 400
+        # nan or a negative duration would reach time.sleep and fail with a 500
+        if not math.isfinite(seconds) or seconds <= 0 or hz <= 0:
+            return jsonify({"error": "seconds and hz must be finite and > 0"}), 400
+        seconds = min(seconds, MAX_SECONDS)
+        if not _busy.acquire(blocking=False):
+            return jsonify({"error": "a profile is already running"}), 409
+        try:
+            sampler = profile(seconds, hz, exclude={threading.get_ident()})
+        finally:
+            _busy.release()
+        name = f"neurolock-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}.folded"
+        return Response(sampler.collapsed(), mimetype="text/plain", headers={
+            "Content-Disposition": f"attachment; filename={name}",
+            "X-Profile-Samples": str(sampler.samples),
+        })
+
+    return admin_profile
@@ -0,0 +1,86 @@
+"""
+Epoch-based scoring of a probe recording against the pickled model.
+
+The model consumes a fixed number of flattened (samples x channels) values.
+Instead of using only the first window of the probe, the whole recording is
+cut into overlapping epochs with a strided view (no copies), scored with one
+batched scaler.transform + predict_proba/predict, and the epoch scores are
+aggregated into a single decision.
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+DEFAULT_FEATURES = 270
+EPOCH_OVERLAP = 0.5
+MAX_EPOCHS = 256
+ACCEPT_SCORE = 0.5
+TARGET_CLASS = 1
+
+
+def split_model(model_data):
+    """Return (model, scaler) from the pickled object (a bare estimator or a tuple)."""
+    if isinstance(model_data, tuple):
+        model = None
+        scaler = None
+        for obj in model_data:
+            if hasattr(obj, "predict"):
+                model = obj
+            elif hasattr(obj, "transform"):
+                scaler = obj
+        return model, scaler
+    return model_data, None
+
+
+def target_for(model, empid):
+    """Class to score for `empid`: the empid itself for retrained models, else the legacy class 1."""
+    classes = getattr(model, "classes_", ())
+    return empid if empid in list(classes) else TARGET_CLASS
+
+
+def epoch_matrix(data, n_features=DEFAULT_FEATURES, overlap=EPOCH_OVERLAP, max_epochs=MAX_EPOCHS):
+    """
+    (epochs, n_features) view over the row-major flattened recording.
+
+    Epochs start on sample boundaries and overlap by `overlap`; when there
+    would be more than `max_epochs` the stride grows so they still cover the
+    whole recording. A recording shorter than one epoch is zero-padded.
+    """
+    data = np.asarray(data)
+    n_channels = data.shape[1] if data.ndim == 2 else 1
+    flat = np.ascontiguousarray(data).reshape(-1)
+    if flat.size < n_features:
+        return np.pad(flat, (0, n_features - flat.size), mode="constant").reshape(1, -1)
+
+    windows = sliding_window_view(flat, n_features)
+    epoch_samples = max(1, n_features // n_channels)
+    hop = max(1, int(round(epoch_samples * (1 - overlap)))) * n_channels
+    n_epochs = (windows.shape[0] - 1) // hop + 1
+    if n_epochs > max_epochs:
+        hop = ((windows.shape[0] - 1) // (max_epochs - 1) // n_channels or 1) * n_channels
+    return windows[::hop][:max_epochs]
+
+
+def epoch_scores(model, scaler, epochs, target=TARGET_CLASS):
+    """Per-epoch score for `target`: class probability if available, else 1/0 votes. Scaler errors propagate."""
+    # a scaler that cannot transform the epochs raises: the model never sees unscaled features
+    X = scaler.transform(epochs) if scaler is not None else epochs
+    if hasattr(model, "predict_proba"):
+        classes = list(getattr(model, "classes_", []))
+        if target in classes:
+            return model.predict_proba(X)[:, classes.index(target)]
+        return np.zeros(len(X))
+    return (model.predict(X) == target).astype(np.float64)
+
+
+def score_probe(model, scaler, data, target=TARGET_CLASS, method="mean"):
+    """
+    Score a whole probe recording. Returns (score, n_epochs) where score is the
+    mean epoch probability (method="mean") or the fraction of epochs voting for
+    `target` (method="vote").
+    """
+    n_features = getattr(model, "n_features_in_", DEFAULT_FEATURES)
+    epochs = epoch_matrix(data, n_features)
+    scores = epoch_scores(model, scaler, epochs, target)
+    if method == "vote":
+        scores = scores >= ACCEPT_SCORE
+    return float(np.mean(scores)), len(epochs)
@@ -0,0 +1,356 @@
+"""
+Sharded enrollment storage and verification, partitioned by empid.
+
+Each shard is an ordinary app.py process with its own working directory, so
+its SQLite file, brainwaves/, retrained models/ and replay index hold only the
+employees it owns. Ownership comes from a consistent-hash ring (VNODES points
+per shard, blake2b of empid): adding a fifth shard to four moves about a fifth
+of the employees, and nobody else.
+
+    python shard.py --local 3                      # 3 workers + router on this machine
+    NEUROLOCK_SHARDS="s0=http://10.0.0.5:8061,s1=http://10.0.0.6:8061" python app.py
+
+With NEUROLOCK_SHARDS set, app.py keeps the employee directory (register,
+login, search) and forwards enrollments and ai_verify_brainwave to the owning
+shard's /shard/* endpoints. Those endpoints only exist on processes started
+with both NEUROLOCK_SHARD_ID and NEUROLOCK_SHARD_TOKEN, and every call must
+carry the token; enrollments still need the admin code the client typed.
+The router started by --local (or --router) is a bare HTTP front for
+POST /verify with {"empid", "contents", "filename"}, for callers that don't
+need the Dash UI, behind the same ratelimit.Admission gate as app.py.
+"""
+import os
+import sys
+import hmac
+import json
+import time
+import bisect
+import shutil
+import secrets
+import hashlib
+import argparse
+import subprocess
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import ratelimit
+
+SHARD_ID = os.environ.get("NEUROLOCK_SHARD_ID")          # set on shard workers
+SHARD_TOKEN = os.environ.get("NEUROLOCK_SHARD_TOKEN")
+VNODES = 128
+TIMEOUT_S = 30.0
+MAX_BODY = 64 * 1024 * 1024
+BASE_PORT = 8061
+ROUTER_PORT = 8060
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_FILE = "neurolock_invariant_model.pkl"
+# per-process state that must land in each shard's own directory
+LOCAL_ENV = ("NEUROLOCK_SHARDS", "NEUROLOCK_DB_FILE", "NEUROLOCK_BRAINWAVE_DIR",
+             "NEUROLOCK_REPLAY_FILE", "NEUROLOCK_AUDIT_DB")
+
+
+# ---------- Ring ----------
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    def __init__(self, nodes, vnodes=VNODES):
+        self.nodes = sorted(nodes)
+        points = sorted((_hash(f"{node}#{v}"), node) for node in self.nodes for v in range(vnodes))
+        self._points = [p for p, _ in points]
+        self._owners = [node for _, node in points]
+
+    def owner(self, key):
+        i = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[i]
+
+
+def moves(old, new, keys):
+    """Keys whose owner differs between two rings (what a rebalance has to copy)."""
+    return [k for k in keys if old.owner(k) != new.owner(k)]
+
+
+def parse_shards(spec):
+    """{name: url} from "s0=http://host:port,..."; a bare URL is its own name."""
+    shards = {}
+    for item in filter(None, (s.strip() for s in spec.split(","))):
+        name, _, url = item.partition("=") if "=" in item.split("://")[0] else ("", "", item)
+        shards[name or url] = url.rstrip("/")
+    return shards
+
+
+# ---------- Router ----------
+class ShardRouter:
+    def __init__(self, shards, token, timeout=TIMEOUT_S):
+        if not token:
+            raise ValueError("shard: a router needs the shards' NEUROLOCK_SHARD_TOKEN")
+        self.shards = dict(shards)
+        self.ring = HashRing(self.shards)
+        self.token = token
+        self.timeout = timeout
+
+    def owner(self, empid):
+        name = self.ring.owner(empid)
+        return name, self.shards[name]
+
+    def _request(self, url, body=None):
+        headers = {"Content-Type": "application/json", "X-Shard-Token": self.token}
+        req = urllib.request.Request(url, data=body, headers=headers, method="POST" if body is not None else "GET")
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                return resp.status, resp.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def forward(self, empid, op, body):
+        """POST raw JSON `body` to the owner's /shard/<op>; returns (status, response bytes)."""
+        name, url = self.owner(empid)
+        try:
+            return self._request(f"{url}/shard/{op}", body)
+        except (urllib.error.URLError, OSError) as e:
+            reason = getattr(e, "reason", e)
+            return 503, json.dumps({"error": f"shard {name} unavailable: {reason}", "shard": name}).encode()
+
+    def _call(self, empid, op, contents, filename, **extra):
+        body = json.dumps({"empid": empid, "contents": contents, "filename": filename, **extra}).encode()
+        status, raw = self.forward(empid, op, body)
+        try:
+            return status, json.loads(raw)
+        except ValueError:
+            return status, {"error": f"HTTP {status} from shard {self.ring.owner(empid)}"}
+
+    def verify(self, empid, contents, filename=None):
+        """app.verify_brainwave on the owning shard: (decision, score, message)."""
+        status, out = self._call(empid, "verify", contents, filename)
+        if status != 200:
+            return "error", None, f"⚠️ Verification unavailable: {out.get('error')}"
+        return out["decision"], out["score"], out["message"]
+
+    def enroll(self, empid, admin_code, contents, filename=None):
+        """app.save_brainwave_db on the owning shard (which checks admin_code); returns its message."""
+        status, out = self._call(empid, "enroll", contents, filename, admin_code=admin_code)
+        return out["message"] if status == 200 else f"⚠️ Enrollment unavailable: {out.get('error')}"
+
+    def health(self):
+        out = {}
+        for name, url in self.shards.items():
+            try:
+                status, raw = self._request(f"{url}/shard/health")
+                out[name] = json.loads(raw) if status == 200 else {"error": f"HTTP {status}"}
+            except (urllib.error.URLError, OSError, ValueError) as e:
+                out[name] = {"error": str(getattr(e, "reason", e))}
+        return out
+
+
+def from_env():
+    """ShardRouter over NEUROLOCK_SHARDS (NEUROLOCK_SHARD_TOKEN required), or None when running unsharded."""
+    spec = os.environ.get("NEUROLOCK_SHARDS")
+    return ShardRouter(parse_shards(spec), SHARD_TOKEN) if spec else None
+
+
+# ---------- Shard endpoints ----------
+def install(server, verify, enroll, stats):
+    """
+    Add /shard/verify, /shard/enroll and /shard/health to `server` if this
+    process is a shard. Without NEUROLOCK_SHARD_TOKEN nothing is installed:
+    the endpoints skip the admin UI and must never be open.
+    """
+    if not SHARD_ID:
+        return False
+    if not SHARD_TOKEN:
+        print(f"⚠️ shard {SHARD_ID}: NEUROLOCK_SHARD_TOKEN is not set, /shard endpoints disabled")
+        return False
+    from flask import request, jsonify
+
+    def _authorized():
+        return hmac.compare_digest(request.headers.get("X-Shard-Token", "").encode(), SHARD_TOKEN.encode())
+
+    def _payload():
+        if not _authorized():
+            return None, (jsonify(error="bad shard token"), 403)
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict) or not body.get("empid") or not body.get("contents"):
+            return None, (jsonify(error="empid and contents required"), 400)
+        return body, None
+
+    @server.route("/shard/verify", methods=["POST"])
+    def shard_verify():
+        body, error = _payload()
+        if error:
+            return error
+        try:
+            decision, score, message = verify(body["empid"], body["contents"], body.get("filename"))
+        except Exception as e:
+            decision, score, message = "error", None, f"⚠️ Verification error: {e}"
+        return jsonify(decision=decision, score=None if score is None else float(score), message=message, shard=SHARD_ID)
+
+    @server.route("/shard/enroll", methods=["POST"])
+    def shard_enroll():
+        body, error = _payload()
+        if error:
+            return error
+        message = enroll(body["empid"], body.get("admin_code"), body["contents"], body.get("filename"))
+        return jsonify(message=message, shard=SHARD_ID)
+
+    @server.route("/shard/health")
+    def shard_health():
+        if not _authorized():
+            return jsonify(error="bad shard token"), 403
+        return jsonify(shard=SHARD_ID, **stats())
+
+    return True
+
+
+# ---------- Standalone router ----------
+class _RouterHandler(BaseHTTPRequestHandler):
+    router = None
+    gate = None
+
+    def _send(self, status, body, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path.split("?")[0] != "/verify":
+            return self._send(404, b'{"error": "not found"}')
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY:
+            return self._send(413, b'{"error": "upload too large"}')
+        body = self.rfile.read(length)
+        try:
+            empid = json.loads(body).get("empid")
+        except (ValueError, AttributeError):
+            empid = None
+        if not isinstance(empid, str) or not empid:
+            return self._send(400, b'{"error": "empid required"}')
+        with self.gate.admit(empid, self.client_address[0]) as admission:
+            if admission.ok:
+                status, response = self.router.forward(empid, "verify", body)
+        if not admission.ok:
+            return self._send(admission.status, json.dumps({"error": admission.reason}).encode(),
+                              {"Retry-After": admission.retry_header})
+        self._send(status, response)
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/health":
+            return self._send(404, b'{"error": "not found"}')
+        self._send(200, json.dumps(self.router.health()).encode())
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def serve_router(router, port=ROUTER_PORT, host="127.0.0.1", gate=None):
+    gate = gate or ratelimit.Admission()
+    handler = type("RouterHandler", (_RouterHandler,), {"router": router, "gate": gate})
+    httpd = ThreadingHTTPServer((host, port), handler)
+    httpd.daemon_threads = True
+    return httpd
+
+
+# ---------- Local cluster ----------
+def start_local(n, base_dir="shards", base_port=BASE_PORT, host="127.0.0.1", token=None):
+    """
+    Start n shard workers, each in base_dir/shard-<i> with its own copy of the
+    base model; returns (processes, {name: url}, token).
+    """
+    token = token or secrets.token_hex(16)
+    procs, shards = [], {}
+    for i in range(n):
+        name = f"s{i}"
+        workdir = os.path.abspath(os.path.join(base_dir, f"shard-{i}"))
+        os.makedirs(workdir, exist_ok=True)
+        model = os.path.join(REPO_DIR, MODEL_FILE)
+        if os.path.exists(model) and not os.path.exists(os.path.join(workdir, MODEL_FILE)):
+            shutil.copy(model, workdir)
+        env = {k: v for k, v in os.environ.items() if k not in LOCAL_ENV}
+        env.update(NEUROLOCK_SHARD_ID=name, NEUROLOCK_SHARD_TOKEN=token)
+        log = open(os.path.join(workdir, "worker.log"), "ab")
+        procs.append(subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--worker", "--host", host, "--port", str(base_port + i)],
+            cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT))
+        log.close()
+        shards[name] = f"http://{host}:{base_port + i}"
+    return procs, shards, token
+
+
+def wait_ready(router, timeout=60.0):
+    """Block until every shard answers /shard/health."""
+    deadline = time.monotonic() + timeout
+    while True:
+        health = router.health()
+        down = [name for name, h in health.items() if "error" in h]
+        if not down:
+            return health
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"shards not ready: {', '.join(down)}")
+        time.sleep(0.2)
+
+
+def stop_local(procs):
+    for p in procs:
+        p.terminate()
+    for p in procs:
+        try:
+            p.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            p.kill()
+
+
+def _run_worker(host, port):
+    import app
+    app.start_warmup()
+    os.makedirs(app.BRAINWAVE_DIR, exist_ok=True)
+    print(f"shard {SHARD_ID}: serving {os.getcwd()} on {host}:{port}", flush=True)
+    app.server.run(host=host, port=port, threaded=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded NeuroLock verification")
+    parser.add_argument("--local", type=int, metavar="N", help="start N shard workers and a router here")
+    parser.add_argument("--worker", action="store_true", help="run this process as a shard (NEUROLOCK_SHARD_ID)")
+    parser.add_argument("--router", action="store_true", help="route POST /verify over NEUROLOCK_SHARDS")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=ROUTER_PORT)
+    parser.add_argument("--base-port", type=int, default=BASE_PORT)
+    parser.add_argument("--dir", default="shards", help="--local: parent of the shard directories")
+    args = parser.parse_args()
+
+    if args.worker:
+        if not SHARD_ID or not SHARD_TOKEN:
+            raise SystemExit("shard: --worker needs NEUROLOCK_SHARD_ID and NEUROLOCK_SHARD_TOKEN")
+        _run_worker(args.host, args.port)
+        raise SystemExit(0)
+
+    procs = []
+    if args.local:
+        procs, shards, token = start_local(args.local, args.dir, args.base_port, args.host)
+        router = ShardRouter(shards, token)
+        print("shard: waiting for workers ...")
+        wait_ready(router)
+        spec = ",".join(f"{name}={url}" for name, url in shards.items())
+        print(f"shard: {args.local} workers up. Dash front end:\n"
+              f"  NEUROLOCK_SHARDS={spec} NEUROLOCK_SHARD_TOKEN={token} python app.py")
+    elif args.router:
+        router = from_env()
+        if router is None:
+            raise SystemExit("shard: --router needs NEUROLOCK_SHARDS")
+    else:
+        parser.error("one of --local, --worker or --router is required")
+
+    httpd = serve_router(router, args.port, args.host)
+    print(f"shard: router on http://{args.host}:{args.port}/verify")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        stop_local(procs)
@@ -0,0 +1,148 @@
+"""
+Multi-session statistical templates and Mahalanobis verification.
+
+Each enrollment session is cut into EPOCH_SECONDS epochs (50% overlap) and
+every epoch becomes a (channels, bands) matrix of log band powers. A user's
+template is the running per-channel summary of all their epochs:
+
+    n          number of epochs merged so far
+    mean       (channels, bands)
+    m2         (channels, bands, bands) scatter matrices (sum of outer products)
+    chol_inv   (channels, bands, bands) inverse Cholesky factor of the shrunk covariance
+
+Sessions are merged with the parallel (Chan et al.) form of Welford's update,
+so adding a session never re-reads the earlier ones, and chol_inv is
+recomputed once per enrollment. Verification is then one batched einsum: the
+whitened distance of every probe epoch on every channel at once, averaged
+into a score that is about 1 for a genuine probe and grows for impostors.
+
+Templates are stored as one blob per user in brainwave_templates, with one
+brainwave_sessions row per session; app.py (SQLite) and neurolock_core.py
+(MySQL) create those tables and pass their placeholder style.
+"""
+import io
+import time
+from collections import namedtuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+import preprocess
+from analytics import BANDS
+
+EPOCH_SECONDS = 2.0
+MIN_SESSION_SECONDS = EPOCH_SECONDS    # a shorter session has no full epoch to take band powers from
+SHRINKAGE = 0.1              # covariance shrinkage towards its diagonal
+MAHALANOBIS_ACCEPT = 5.0     # mean squared whitened distance per band; genuine ~1, impostors >10
+
+Template = namedtuple("Template", ["n", "n_sessions", "mean", "m2", "chol_inv"])
+
+
+# ---------- Features ----------
+def epoch_features(data, fs=preprocess.CANONICAL_RATE, epoch_seconds=EPOCH_SECONDS):
+    """(epochs, channels, bands) log10 band powers of a preprocessed (samples, channels) array."""
+    data = np.asarray(data, dtype=np.float64)
+    if data.ndim == 1:
+        data = data[:, None]
+    size = min(len(data), int(epoch_seconds * fs))
+    windows = sliding_window_view(data, size, axis=0)[::max(1, size // 2)]      # (epochs, channels, size)
+    spectrum = np.abs(np.fft.rfft(windows * np.hanning(size), axis=-1)) ** 2
+    freqs = np.fft.rfftfreq(size, d=1.0 / fs)
+    powers = np.stack([spectrum[..., (freqs >= lo) & (freqs < hi)].sum(axis=-1) for _, lo, hi in BANDS], axis=-1)
+    return np.log10(powers + 1e-12)
+
+
+# ---------- Incremental statistics ----------
+def _summarize(features):
+    n = len(features)
+    mean = features.mean(axis=0)
+    centred = features - mean
+    m2 = np.einsum("eci,ecj->cij", centred, centred)
+    return n, mean, m2
+
+
+def _finalize(n, mean, m2):
+    cov = m2 / max(n - 1, 1)
+    diag = np.einsum("cii->ci", cov)
+    target = np.zeros_like(cov)
+    np.einsum("cii->ci", target)[...] = np.maximum(diag, 1e-6)
+    shrunk = (1 - SHRINKAGE) * cov + SHRINKAGE * target
+    chol = np.linalg.cholesky(shrunk)                                  # batched over channels
+    return np.linalg.inv(chol)
+
+
+def add_session(template, features):
+    """Merge one session's epoch features into `template` (None for a first enrollment)."""
+    nb, mean_b, m2_b = _summarize(features)
+    if template is None:
+        n, mean, m2, sessions = nb, mean_b, m2_b, 1
+    else:
+        na, mean_a, m2_a = template.n, template.mean, template.m2
+        n = na + nb
+        delta = mean_b - mean_a
+        mean = mean_a + delta * (nb / n)
+        m2 = m2_a + m2_b + np.einsum("ci,cj->cij", delta, delta) * (na * nb / n)
+        sessions = template.n_sessions + 1
+    return Template(n, sessions, mean, m2, _finalize(n, mean, m2))
+
+
+# ---------- Scoring ----------
+def distances(template, features):
+    """(epochs, channels) squared Mahalanobis distances, whitened with the stored factor."""
+    channels = min(features.shape[1], template.mean.shape[0])
+    diff = features[:, :channels] - template.mean[None, :channels]
+    z = np.einsum("cij,ecj->eci", template.chol_inv[:channels], diff)
+    return (z * z).sum(axis=-1)
+
+
+def score(template, data, fs=preprocess.CANONICAL_RATE):
+    """Mean squared distance per band over all epochs and channels; returns (score, n_epochs)."""
+    features = epoch_features(data, fs)
+    d2 = distances(template, features)
+    return float(d2.mean() / len(BANDS)), len(features)
+
+
+# ---------- Storage ----------
+def to_blob(template):
+    buf = io.BytesIO()
+    np.savez(buf, n=template.n, n_sessions=template.n_sessions, mean=template.mean,
+             m2=template.m2, chol_inv=template.chol_inv)
+    return buf.getvalue()
+
+
+def from_blob(blob):
+    with np.load(io.BytesIO(blob), allow_pickle=False) as z:
+        return Template(int(z["n"]), int(z["n_sessions"]), z["mean"], z["m2"], z["chol_inv"])
+
+
+def fetch(cursor, empid, ph="?"):
+    """Stored Template of `empid`, or None. `ph` is the driver's placeholder (? or %s)."""
+    cursor.execute(f"SELECT template FROM brainwave_templates WHERE empid = {ph}", (empid,))
+    row = cursor.fetchone()
+    return from_blob(bytes(row[0])) if row and row[0] is not None else None
+
+
+def long_enough(data, fs=preprocess.CANONICAL_RATE):
+    return len(data) >= int(MIN_SESSION_SECONDS * fs)
+
+
+def enroll(cursor, empid, data, source=None, ph="?"):
+    """
+    Add one preprocessed session of `empid` and store the updated template.
+    Caller commits. Raises ValueError, before touching the template, for a
+    session shorter than MIN_SESSION_SECONDS.
+    """
+    if not long_enough(data):
+        raise ValueError(f"session of {len(data)} samples is shorter than one {EPOCH_SECONDS:g} s epoch")
+    features = epoch_features(data)
+    template = add_session(fetch(cursor, empid, ph), features)
+    blob = to_blob(template)
+    now = time.time()
+    cursor.execute(f"UPDATE brainwave_templates SET n_sessions = {ph}, template = {ph}, updated_at = {ph} "
+                   f"WHERE empid = {ph}", (template.n_sessions, blob, now, empid))
+    if not cursor.rowcount:
+        cursor.execute(f"INSERT INTO brainwave_templates (empid, n_sessions, template, updated_at) "
+                       f"VALUES ({ph}, {ph}, {ph}, {ph})", (empid, template.n_sessions, blob, now))
+    cursor.execute(f"INSERT INTO brainwave_sessions (empid, recorded_at, n_epochs, source) "
+                   f"VALUES ({ph}, {ph}, {ph}, {ph})", (empid, now, len(features), source))
+    return template
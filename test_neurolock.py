@@ -0,0 +1,272 @@
+"""
+Behavioural checks for the NeuroLock paths (run with `python -m pytest`).
+
+benchmark.py only times these paths; what must hold regardless of speed is
+asserted here, against scratch databases in a temporary directory and the
+synthetic recordings from the benchmark harness.
+"""
+import os
+import shutil
+import sqlite3
+import threading
+
+import flask
+import numpy as np
+import pytest
+
+from benchmark import (MODEL_FILE, REPO_DIR, SQLiteStandIn, _fresh_import, fresh_session,
+                       synthetic_eeg, to_csv_bytes, to_data_url)
+
+
+def upload(data):
+    return to_data_url(to_csv_bytes(data))
+
+
+@pytest.fixture(scope="module")
+def workdir(tmp_path_factory):
+    path = tmp_path_factory.mktemp("neurolock")
+    shutil.copy(os.path.join(REPO_DIR, MODEL_FILE), path)
+    cwd = os.getcwd()
+    os.chdir(path)
+    yield path
+    os.chdir(cwd)
+
+
+@pytest.fixture(scope="module")
+def app_mod(workdir):
+    app_mod = _fresh_import("app")
+    app_mod.AUTO_RETRAIN = False
+    app_mod.start_warmup()
+    app_mod.model_ready.wait()
+    yield app_mod
+    import replay
+    replay.set_index(None)      # its REPLAY_FILE is in workdir
+
+
+@pytest.fixture
+def enrolled(app_mod):
+    empid = app_mod.register_user("enrolled", "230106", "pw", "pw").rsplit(" ", 1)[-1]
+    app_mod.save_brainwave_db(empid, app_mod.ADMIN_CODE, upload(fresh_session(1, 0)))
+    return empid
+
+
+@pytest.fixture
+def core(tmp_path):
+    core = _fresh_import("neurolock_core")
+    db_path = str(tmp_path / "neuro_users.db")
+    core.set_connection_factory(lambda: SQLiteStandIn(db_path))
+    yield core, db_path
+    core.set_connection_factory(None)
+
+
+# ---------- app.py ----------
+def test_enrollment_refused_before_writing(app_mod, enrolled):
+    url = upload(synthetic_eeg(seed=0))
+    written = set(os.listdir(app_mod.BRAINWAVE_DIR))
+    assert app_mod.save_brainwave_db("E999999", app_mod.ADMIN_CODE, url).startswith("⚠ Unknown")
+    assert app_mod.save_brainwave_db("../x", app_mod.ADMIN_CODE, url) == "⚠ Invalid Employee ID."
+    assert set(os.listdir(app_mod.BRAINWAVE_DIR)) == written
+
+
+def test_short_session_refused(app_mod, enrolled):
+    before = app_mod.templates.fetch(app_mod.conn.cursor(), enrolled).n_sessions
+    message = app_mod.save_brainwave_db(enrolled, app_mod.ADMIN_CODE, upload(synthetic_eeg(seed=0, n_samples=3)))
+    assert message.startswith("⚠ Recording too short")
+    assert app_mod.templates.fetch(app_mod.conn.cursor(), enrolled).n_sessions == before
+
+
+def test_template_decides_genuine_and_impostor(app_mod, enrolled):
+    assert app_mod.verify_brainwave(enrolled, upload(fresh_session(2, 1)))[0] == "reject"
+    assert app_mod.verify_brainwave(enrolled, upload(fresh_session(1, 1)))[0] == "accept"
+    assert app_mod.verify_brainwave(enrolled, upload(fresh_session(1, 1)))[0] == "replay"
+
+
+def test_retrain_needed_only_without_templates(app_mod, enrolled):
+    assert not app_mod.retrain.needed(app_mod.conn)
+    stashed = app_mod.conn.execute("SELECT * FROM brainwave_templates").fetchall()
+    app_mod.conn.execute("DELETE FROM brainwave_templates")
+    try:
+        assert app_mod.retrain.needed(app_mod.conn)
+    finally:
+        app_mod.conn.executemany("INSERT INTO brainwave_templates VALUES (?, ?, ?, ?)", stashed)
+        app_mod.conn.commit()
+
+
+def test_one_char_search_is_one_page(app_mod):
+    app_mod.conn.executemany("INSERT INTO employees (empid, name, password) VALUES (?, ?, 'pw')",
+                             [(f"S{i:05d}", f"search{i}") for i in range(3 * app_mod.EMPLOYEE_PAGE)])
+    app_mod.conn.commit()
+    try:
+        for prefix in ("s", "S"):
+            app_mod.search_employees.cache_clear()
+            assert len(app_mod.search_employees(prefix)) == app_mod.EMPLOYEE_PAGE
+    finally:
+        # generate_empid numbers from the newest row
+        app_mod.conn.execute("DELETE FROM employees WHERE empid LIKE 'S%'")
+        app_mod.conn.commit()
+        app_mod.search_employees.cache_clear()
+
+
+def test_concurrent_requests_keep_their_rows(app_mod, enrolled):
+    errors, empids, seen = [], [], []
+
+    def register():
+        try:
+            for _ in range(20):
+                empids.append(app_mod.register_user("threaded", "230106", "pw", "pw").rsplit(" ", 1)[-1])
+        except Exception as e:
+            errors.append(e)
+
+    def read():
+        try:
+            for _ in range(200):
+                seen.append(app_mod.templates.fetch(app_mod.conn.cursor(), enrolled))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=f) for f in (register, read) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert len(set(empids)) == len(empids) == 80
+    assert all(t is not None for t in seen)
+
+
+# ---------- webcam.py ----------
+def test_webcam_rejects_bad_json_and_throttles(workdir, monkeypatch):
+    monkeypatch.delenv("NEUROLOCK_ADMIN_CODE", raising=False)
+    webcam = _fresh_import("webcam")
+    client = webcam.app.test_client()
+    for body in ([1, 2], 5, "x", None, {"nonce": [1]}):
+        assert client.post("/verify", json=body).status_code == 400
+    statuses = [client.get("/challenge").status_code for _ in range(webcam.CHALLENGE_BURST + 2)]
+    assert statuses[-2:] == [429, 429]
+    assert client.get("/admin/profile").status_code == 404
+
+
+# ---------- sampler.py ----------
+def test_profiler_rejects_bad_arguments():
+    import sampler
+    server = flask.Flask("profiled")
+    assert sampler.install(server, None) is None
+    sampler.install(server, "code")
+    client = server.test_client()
+    assert client.get("/admin/profile?seconds=0.1").status_code == 403
+    for query in ("seconds=nan", "seconds=inf", "seconds=-1", "seconds=0", "hz=0", "hz=-5", "hz=x"):
+        assert client.get(f"/admin/profile?{query}", headers={"X-Admin-Code": "code"}).status_code == 400
+
+
+# ---------- neurolock_core.py ----------
+def test_cancelled_registration_writes_nothing(core, tmp_path):
+    core, _ = core
+    from tk_async import CancelToken
+    core.create_table_if_not_exists()
+    path = str(tmp_path / "t.csv")
+    with open(path, "wb") as f:
+        f.write(to_csv_bytes(synthetic_eeg(seed=500)))
+    assert core.register_user("T1", "T1", "pw", path).ok
+    token = CancelToken()
+    token.cancel()
+    assert core.register_user("T1", "T1", "pw", path, cancel=token).title == "Cancelled"
+    assert core.get_template_from_db("T1").n_sessions == 1
+
+
+def test_cosine_and_correlation_clients_agree(core, tmp_path):
+    core, _ = core
+    core.create_table_if_not_exists()
+    paths = []
+    for u in range(4):
+        paths.append(str(tmp_path / f"u{u}.csv"))
+        with open(paths[-1], "wb") as f:
+            f.write(to_csv_bytes(fresh_session(u, 0)))
+        core.register_user(f"U{u}", f"U{u}", "pw", paths[-1])
+    for u in range(4):
+        for v in range(4):
+            ok = core.authenticate_user(f"U{u}", "pw", paths[v]).ok
+            assert ok == (u == v)
+            assert core.authenticate(f"U{u}", "pw", paths[v]).startswith("✅") == ok
+
+
+def test_blob_columns_added_lazily(core):
+    core, db_path = core
+    old = sqlite3.connect(db_path)
+    old.execute("CREATE TABLE neuro_users (emp_id TEXT PRIMARY KEY, name TEXT, password_hash TEXT, brainwave BLOB)")
+    old.execute("INSERT INTO neuro_users VALUES ('OLD', 'old', 'x', ?)", (np.zeros(8).tobytes(),))
+    old.commit()
+    old.close()
+    assert core.get_user_from_db("OLD") == ("OLD", "x", np.zeros(8).tobytes(), None, None)
+
+
+# ---------- audit.py ----------
+class _FailingOnce:
+    """Wraps the audit connection; the first executemany fails as a full disk would."""
+
+    def __init__(self, conn):
+        self.conn, self.failed = conn, False
+
+    def __enter__(self):
+        return self.conn.__enter__()
+
+    def __exit__(self, *exc):
+        return self.conn.__exit__(*exc)
+
+    def executemany(self, sql, rows):
+        if not self.failed:
+            self.failed = True
+            raise sqlite3.OperationalError("database or disk is full")
+        return self.conn.executemany(sql, rows)
+
+
+def test_audit_batch_retried_after_failed_write(tmp_path):
+    import audit
+    log = audit.AuditLog(str(tmp_path / "audit.db"), flush_interval=0.05)
+    log._start()
+    with log._lock:
+        log._conn = _FailingOnce(log._conn)
+    for i in range(10):
+        log.record(f"E{i}", "brainwave", "accept")
+    log.flush(timeout=5)
+    assert log._conn.failed
+    assert log.written == 10 and not log.buffer
+    assert len(log.query(limit=100)) == 10
+
+
+def test_failed_enrollment_keeps_previous_recording(app_mod, enrolled, monkeypatch):
+    path = os.path.join(app_mod.BRAINWAVE_DIR, f"{enrolled}.npz")
+    with open(path, "rb") as f:
+        before = f.read()
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("analytics down")
+    monkeypatch.setattr(app_mod.analytics, "record", fail)
+    with pytest.raises(RuntimeError):
+        app_mod.save_brainwave_db(enrolled, app_mod.ADMIN_CODE, upload(fresh_session(1, 7)))
+    with open(path, "rb") as f:
+        assert f.read() == before
+    assert not [f for f in os.listdir(app_mod.BRAINWAVE_DIR) if f.startswith(".")]      # no temp file left
+
+
+# ---------- replay.py ----------
+def test_replay_merges_match_a_full_sort(monkeypatch):
+    import replay
+    monkeypatch.setattr(replay, "MERGE_EVERY", 16)
+    rng = np.random.default_rng(3)
+    sigs = rng.integers(0, 2 ** 64, size=(300, replay.WORDS), dtype=np.uint64)
+    index = replay.ReplayIndex()
+    index.extend(sigs[:100], [f"B{i}" for i in range(100)])
+    for i in range(100, 300, 5):
+        index.add(sigs[i:i + 5], empid=f"A{i}")
+        merger = index._merger
+        if merger is not None:
+            merger.join()
+    index._merge()
+    assert index.indexed == len(index) == 300
+    keys = replay._keys(sigs)
+    for t, (table_keys, order) in enumerate(index._sorted):
+        expected = np.argsort(keys[:, t], kind="stable")
+        assert np.array_equal(order, expected) and np.array_equal(table_keys, keys[expected, t])
+    for i in (0, 99, 100, 299):
+        match = index.lookup(sigs[i])
+        assert match.distance == 0 and match.empid == (f"B{i}" if i < 100 else f"A{i - i % 5}")
@@ -0,0 +1,128 @@
+"""
+Background execution for the Tkinter clients.
+
+Slow work (MySQL round trip, bcrypt, CSV parsing, scoring) runs on a small
+worker pool; results are handed back to the Tk main loop with root.after, so
+the window keeps repainting and the next user can already pick a file while
+the previous verification is still computing.
+
+A running job cannot be interrupted, so a job that writes takes a CancelToken
+(writes=True) and asks it right before committing: Cancel either stops the
+commit or, once it has started, is disabled and the result is shown.
+"""
+import threading
+import tkinter as tk
+from tkinter import ttk
+from concurrent.futures import ThreadPoolExecutor
+
+POLL_MS = 50
+MAX_WORKERS = 2
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="neurolock-auth")
+    return _executor
+
+
+class CancelToken:
+    """Cancel request shared with a worker; whichever of cancel() and commit_allowed() runs first wins."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.cancelled = False
+        self.committing = False
+
+    def cancel(self):
+        """False if the worker is already committing."""
+        with self._lock:
+            if self.committing:
+                return False
+            self.cancelled = True
+            return True
+
+    def commit_allowed(self):
+        """Called by the worker just before it commits; False means roll back instead."""
+        with self._lock:
+            if self.cancelled:
+                return False
+            self.committing = True
+            return True
+
+
+class BackgroundTask:
+    """A submitted job plus its progress row (indeterminate bar + Cancel button)."""
+
+    def __init__(self, parent, fn, args, on_done, on_error=None, label="Working...", writes=False):
+        self.parent = parent
+        self.on_done = on_done
+        self.on_error = on_error
+        self.cancelled = False
+        self.token = CancelToken()
+        self.frame = self.cancel_button = None
+        self._build_progress(label)
+        kwargs = {"cancel": self.token} if writes else {}
+        self.future = get_executor().submit(fn, *args, **kwargs)
+        self.parent.after(POLL_MS, self._poll)
+
+    def _build_progress(self, label):
+        self.frame = tk.Frame(self.parent, bg=self.parent.cget("bg"))
+        tk.Label(self.frame, text=label, bg=self.parent.cget("bg"), fg="#66fcf1").pack(side="left", padx=4)
+        bar = ttk.Progressbar(self.frame, mode="indeterminate", length=120)
+        bar.pack(side="left", padx=4)
+        bar.start(15)
+        self.cancel_button = tk.Button(self.frame, text="Cancel", command=self.cancel, relief="flat")
+        self.cancel_button.pack(side="left", padx=4)
+        self.frame.pack(pady=3)
+
+    def _close_progress(self):
+        if self.frame is not None:
+            self.frame.destroy()
+            self.frame = self.cancel_button = None
+
+    def _disable_cancel(self):
+        if self.cancel_button is not None:
+            self.cancel_button.config(state="disabled", text="Saving...")
+
+    def cancel(self):
+        """
+        Drop the job if it has not started, or stop a writing job before it
+        commits; a job past its commit runs on and its result is shown.
+        """
+        if not self.token.cancel():
+            self._disable_cancel()
+            return
+        self.cancelled = True
+        self.future.cancel()
+        self._close_progress()
+
+    def _poll(self):
+        if not self.future.done():
+            if self.token.committing:
+                self._disable_cancel()
+            try:
+                self.parent.after(POLL_MS, self._poll)
+            except tk.TclError:
+                # window closed while the job was running
+                self.cancelled = True
+            return
+        self._close_progress()
+        if self.cancelled or self.future.cancelled():
+            return
+        error = self.future.exception()
+        if error is not None:
+            if self.on_error is not None:
+                self.on_error(error)
+            return
+        self.on_done(self.future.result())
+
+
+def run_in_background(parent, fn, *args, on_done, on_error=None, label="Working...", writes=False):
+    """
+    Run fn(*args) on the worker pool and call on_done(result) on the Tk main
+    loop; with writes=True it is called as fn(*args, cancel=CancelToken).
+    """
+    return BackgroundTask(parent, fn, args, on_done, on_error=on_error, label=label, writes=writes)
@@ -0,0 +1,119 @@
+"""
+Parsed Dash uploads, shared across callbacks.
+
+A dcc.Upload hands every callback the same base64 data URL: the preview
+(update_graph), the save (save_brainwave_db) and verification all used to
+decode and parse it again. This cache keys the parsed eeg_io.Recording, and
+its preprocessed form once something asks for it, by a hash of the data URL
+and file name, and evicts least recently used entries once the arrays held
+exceed MAX_BYTES:
+
+    recording = upload_cache.recording(contents, filename)       # raw, for previews
+    clean = upload_cache.preprocessed(contents, filename)        # canonical, for matching
+
+Cached arrays are marked read-only because every caller shares them.
+"""
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import eeg_io
+import preprocess
+
+MAX_BYTES = 256 * 1024 * 1024
+
+
+def _key(contents, filename):
+    digest = hashlib.blake2b(contents.encode(), digest_size=16)
+    digest.update(b"\0" + (filename or "").encode())
+    return digest.hexdigest()
+
+
+def _frozen(recording):
+    data = np.asarray(recording.data)
+    data.flags.writeable = False
+    return recording._replace(data=data)
+
+
+class UploadCache:
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.parses = 0
+        self._entries = OrderedDict()         # key -> {"raw": Recording, "clean": Recording|None}
+        self._lock = threading.Lock()
+
+    def _entry(self, contents, filename):
+        key = _key(contents, filename)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return key, entry
+            self.misses += 1
+        raw = _frozen(eeg_io.read_eeg(base64.b64decode(contents.split(",", 1)[1]), name=filename))
+        entry = {"raw": raw, "clean": None}
+        with self._lock:
+            self.parses += 1
+            entry = self._entries.setdefault(key, entry)   # a concurrent parse may have won
+            if entry["raw"] is raw:
+                self._account(raw.data.nbytes)
+        return key, entry
+
+    def _account(self, nbytes):
+        self.bytes += nbytes
+        while self.bytes > self.max_bytes and len(self._entries) > 1:
+            _, old = self._entries.popitem(last=False)
+            self.bytes -= old["raw"].data.nbytes + (old["clean"].data.nbytes if old["clean"] else 0)
+
+    def recording(self, contents, filename=None):
+        """The upload as parsed by eeg_io.read_eeg."""
+        return self._entry(contents, filename)[1]["raw"]
+
+    def preprocessed(self, contents, filename=None):
+        """The upload after preprocess.preprocess (computed on first request)."""
+        key, entry = self._entry(contents, filename)
+        clean = entry["clean"]
+        if clean is None:
+            clean = _frozen(preprocess.preprocess(entry["raw"]))
+            with self._lock:
+                if entry["clean"] is None and self._entries.get(key) is entry:
+                    entry["clean"] = clean
+                    self._account(clean.data.nbytes)
+        return clean
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "parses": self.parses}
+
+
+# ---------- Process-wide cache ----------
+_cache = UploadCache()
+
+
+def recording(contents, filename=None):
+    return _cache.recording(contents, filename)
+
+
+def preprocessed(contents, filename=None):
+    return _cache.preprocessed(contents, filename)
+
+
+def stats():
+    return _cache.stats()
+
+
+def clear():
+    _cache.clear()
@@ -4,24 +4,58 @@ import time
 import json
 import base64
 import hashlib
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for
+import audit
+import memprof
+import ratelimit
+import sampler
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, abort
+from werkzeug.exceptions import RequestEntityTooLarge
 
 app = Flask(__name__)
 app.secret_key = "neuro_lock_secure_key"
 
+# Face captures arrive as multipart/form-data (field "face"), a raw image body with
+# the metrics in X-* headers, or (older clients) base64 inside JSON.
+MIN_FACE_BYTES = 5000
+MAX_FACE_BYTES = 2 * 1024 * 1024
+READ_CHUNK = 64 * 1024
+# the legacy base64 JSON form is 4/3 of the image plus the other fields
+app.config["MAX_CONTENT_LENGTH"] = MAX_FACE_BYTES * 4 // 3 + READ_CHUNK
+METRIC_FIELDS = ["nonce","ts","blink_count","head_motion","focus_score","challenge_observed"]
+RAW_IMAGE_TYPES = ("image/jpeg", "image/png", "image/webp", "application/octet-stream")
+memprof.install(app)  # no-op unless NEUROLOCK_MEMPROF is set
+ADMIN_CODE = os.environ.get("NEUROLOCK_ADMIN_CODE")
+sampler.install(app, ADMIN_CODE)  # /admin/profile?seconds=N, only when NEUROLOCK_ADMIN_CODE is set
+
 UPLOAD_FOLDER = "static/uploads"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 # Simple server-side store of active challenges: nonce -> (challenge_type, issued_time, ttl)
+# Kept in issue order, so expired entries are always at the front.
 ACTIVE_CHALLENGES = {}
+MAX_ACTIVE_CHALLENGES = 10000
+CHALLENGE_GRACE_S = 2
 
-# Helper: simple face "check" from base64 JPEG (very lightweight)
-def verify_face_from_base64(b64data):
+def prune_challenges(now=None):
+    """Drop expired challenges from the front, then the oldest until there is room for one more."""
+    now = time.time() if now is None else now
+    while ACTIVE_CHALLENGES:
+        nonce, rec = next(iter(ACTIVE_CHALLENGES.items()))
+        if now - rec["issued"] <= rec["ttl"] + CHALLENGE_GRACE_S and len(ACTIVE_CHALLENGES) < MAX_ACTIVE_CHALLENGES:
+            break
+        ACTIVE_CHALLENGES.pop(nonce, None)
+
+# per-empid / per-address token buckets plus a cap on concurrent verifications
+verify_gate = ratelimit.Admission()
+# every login takes one challenge; a client minting them in a loop would evict everyone else's
+CHALLENGE_RATE = 30 / 60.0
+CHALLENGE_BURST = 10
+challenge_buckets = ratelimit.TokenBuckets(CHALLENGE_RATE, CHALLENGE_BURST)
+
+# Helper: simple face "check" on the captured image bytes (very lightweight)
+def verify_face_bytes(img_bytes):
     try:
-        # basic sanity: decode and check size
-        header, encoded = b64data.split(',', 1) if ',' in b64data else (None, b64data)
-        img_bytes = base64.b64decode(encoded)
-        if len(img_bytes) < 5000:
+        if len(img_bytes) < MIN_FACE_BYTES:
             # very small images are suspicious (likely not a real webcam capture)
             return False
         # optional: save to disk for audit/demo
@@ -33,6 +67,58 @@ def verify_face_from_base64(b64data):
         print("verify_face error:", e)
         return False
 
+def decode_face_base64(b64data):
+    """Image bytes of a (data URL) base64 string; b"" if it does not decode."""
+    try:
+        header, encoded = b64data.split(',', 1) if ',' in b64data else (None, b64data)
+        return base64.b64decode(encoded)
+    except Exception as e:
+        print("verify_face error:", e)
+        return b""
+
+def verify_face_from_base64(b64data):
+    return verify_face_bytes(decode_face_base64(b64data))
+
+def read_bounded(stream, limit=MAX_FACE_BYTES):
+    """Read `stream` in chunks into one buffer, aborting with 413 as soon as it passes `limit`."""
+    buf = bytearray()
+    while True:
+        chunk = stream.read(min(READ_CHUNK, limit + 1 - len(buf)))
+        if not chunk:
+            return buf
+        buf += chunk
+        if len(buf) > limit:
+            abort(413)
+
+def read_verify_request():
+    """(fields, face_bytes or None) from a multipart form, a raw image body or legacy JSON."""
+    if request.content_length is not None and request.content_length > app.config["MAX_CONTENT_LENGTH"]:
+        abort(413)
+    if request.mimetype == "multipart/form-data":
+        upload = request.files.get("face")
+        return request.form.to_dict(), read_bounded(upload.stream) if upload else None
+    if request.mimetype in RAW_IMAGE_TYPES:
+        if request.content_length is not None and request.content_length > MAX_FACE_BYTES:
+            abort(413)
+        fields = {f: request.headers["X-" + f.replace("_", "-")]
+                  for f in METRIC_FIELDS if "X-" + f.replace("_", "-") in request.headers}
+        return fields, read_bounded(request.stream)
+    data = request.get_json(force=True)
+    if not isinstance(data, dict):
+        return None, None
+    face = data.pop("face", None)
+    return data, decode_face_base64(face) if face is not None else None
+
+def request_empid():
+    """Employee ID for rate limiting, read without touching a form or image body."""
+    data = request.get_json(silent=True)
+    return (request.headers.get("X-Empid") or request.args.get("empid")
+            or (data.get("empid") if isinstance(data, dict) else None))
+
+@app.errorhandler(413)
+def too_large(e):
+    return jsonify({"status":"fail","reason":"too_large","max_bytes":MAX_FACE_BYTES}), 413
+
 # Create a randomized challenge
 import random
 CHALLENGES = [
@@ -54,41 +140,81 @@ def dashboard():
 
 @app.route("/challenge", methods=["GET"])
 def challenge():
+    wait = challenge_buckets.take(request.remote_addr)
+    if wait:
+        throttled = ratelimit.Decision(False, 429, wait, "rate_limited_ip")
+        return (jsonify({"status":"fail","reason":throttled.reason,"retry_after":throttled.retry_header}),
+                429, {"Retry-After": throttled.retry_header})
     nonce = hashlib.sha256(os.urandom(16) + str(time.time()).encode()).hexdigest()[:20]
     chal = random.choice(CHALLENGES)
     ttl = 8  # seconds allowed to respond
+    prune_challenges()
     ACTIVE_CHALLENGES[nonce] = {"challenge":chal["id"], "issued":time.time(), "ttl":ttl}
     return jsonify({"nonce":nonce, "challenge":chal["id"], "label":chal["label"], "ttl":ttl})
 
 @app.route("/verify", methods=["POST"])
 def verify():
+    t0 = time.perf_counter()
+    empid = request_empid()
+    with verify_gate.admit(empid, request.remote_addr) as admission:
+        if admission.ok:
+            try:
+                response = verify_liveness()
+            except RequestEntityTooLarge as e:
+                response = too_large(e)
+        else:
+            # shed before any decoding or disk work; the client should back off
+            response = (jsonify({"status":"fail","reason":admission.reason,"retry_after":admission.retry_header}),
+                        admission.status, {"Retry-After": admission.retry_header})
+    body, status = response[:2] if isinstance(response, tuple) else (response, 200)
+    result = body.get_json(silent=True) or {}
+    decision = "accept" if status == 200 else "throttled" if status in (429, 503) else "reject"
+    audit.record(empid, "liveness", decision,
+                 score=result.get("focus_score"), latency_ms=(time.perf_counter() - t0) * 1000,
+                 source=request.remote_addr, detail=result.get("reason"))
+    return response
+
+def verify_liveness():
     """
-    Expected JSON:
+    Expected fields (multipart form fields, X-Nonce / X-Ts / X-Blink-Count / ...
+    headers next to a raw image body, or JSON):
     {
       "nonce": "...",
       "ts": 169...,  (unix seconds)
-      "face": "data:image/jpeg;base64,...",
+      "face": <JPEG bytes>  (JSON: "data:image/jpeg;base64,..."),
       "blink_count": 2,
       "head_motion": 1.23,
       "focus_score": 0.72,
       "challenge_observed": "blink_twice"   # client-reported observed action
     }
     """
-    data = request.get_json(force=True)
-    required_fields = ["nonce","ts","face","blink_count","head_motion","focus_score","challenge_observed"]
-    for f in required_fields:
+    data, face = read_verify_request()
+    if data is None:
+        return jsonify({"status":"fail","reason":"bad_body"}), 400
+    for f in METRIC_FIELDS:
         if f not in data:
             return jsonify({"status":"fail","reason":"missing_field","field":f}), 400
+    if face is None:
+        return jsonify({"status":"fail","reason":"missing_field","field":"face"}), 400
+    try:
+        # form fields and headers arrive as strings
+        ts = float(data["ts"])
+        blink_count = int(float(data["blink_count"]))
+        head_motion = float(data["head_motion"])
+        focus_score = float(data["focus_score"])
+    except (TypeError, ValueError):
+        return jsonify({"status":"fail","reason":"bad_field"}), 400
 
     nonce = data["nonce"]
-    ts = float(data["ts"])
+    if not isinstance(nonce, str):
+        return jsonify({"status":"fail","reason":"bad_field"}), 400
     now = time.time()
 
     # basic freshness checks
     if nonce not in ACTIVE_CHALLENGES:
         return jsonify({"status":"fail","reason":"unknown_nonce"}), 400
     chal_record = ACTIVE_CHALLENGES[nonce]
-    if now - chal_record["issued"] > chal_record["ttl"] + 2:
+    if now - chal_record["issued"] > chal_record["ttl"] + CHALLENGE_GRACE_S:
         # expired
         ACTIVE_CHALLENGES.pop(nonce, None)
         return jsonify({"status":"fail","reason":"challenge_expired"}), 400
@@ -97,7 +223,7 @@ def verify():
         return jsonify({"status":"fail","reason":"stale_timestamp"}), 400
 
     # basic face sanity
-    face_ok = verify_face_from_base64(data["face"])
+    face_ok = verify_face_bytes(face)
     if not face_ok:
         return jsonify({"status":"fail","reason":"face_invalid"}), 400
 
@@ -107,13 +233,13 @@ def verify():
     # simple rules:
     chal_ok = False
     # blink threshold: for "blink_twice" expect blink_count >= 2
-    if required_challenge == "blink_twice" and data["blink_count"] >= 2 and observed == "blink_twice":
+    if required_challenge == "blink_twice" and blink_count >= 2 and observed == "blink_twice":
         chal_ok = True
     # head movement: for look_left_right expect head_motion > threshold (0.8)
-    elif required_challenge == "look_left_right" and data["head_motion"] > 0.6 and observed == "look_left_right":
+    elif required_challenge == "look_left_right" and head_motion > 0.6 and observed == "look_left_right":
         chal_ok = True
     # follow_dot: ensure some head motion and at least one blink or motion
-    elif required_challenge == "follow_dot" and (data["head_motion"] > 0.4 or data["blink_count"] >= 1) and observed == "follow_dot":
+    elif required_challenge == "follow_dot" and (head_motion > 0.4 or blink_count >= 1) and observed == "follow_dot":
         chal_ok = True
     # smile: we trust client-reported smile (client uses mouth region detection), require at least 0.2 head motion or >0 blinks
     elif required_challenge == "smile" and observed == "smile":
@@ -124,7 +250,6 @@ def verify():
 
     # focus_score check (simulated EEG/focus proxy)
     # expected: focus_score should be reasonably high (>0.45) for authentication success
-    focus_score = float(data["focus_score"])
     if focus_score < 0.45:
         # low focus -> require MFA in real system; for demo deny
         return jsonify({"status":"fail","reason":"low_focus","focus_score":focus_score}), 400